@@ -2,15 +2,98 @@
 ASGI config for campussim project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The progress stream of the pages (interface/events.py) is served next to Django, every other request is handled
+by Django, whose streaming responses are iterated out of the event loop (see streamingASGIHandler).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 """
 
+import asyncio
+import contextvars
 import os
+import threading
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connections
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings.prod')
 
-application = get_asgi_application()
+_receive = contextvars.ContextVar('receive')
+
+## Django 3.2 iterates streaming responses (the exports, see interface/export.py) in the event loop, where a long
+## export would hold up every other connection. They are iterated by a thread of their own instead, which hands the
+## parts over through a bounded queue (it waits while the client reads slowly) and stops when the client goes away
+## `send_response' and `chunk_bytes' are internals of Django 3.2's ASGIHandler, requirements.txt pins django below 4.0
+class streamingASGIHandler(ASGIHandler):
+    max_pending = 4
+
+    async def __call__(self, scope, receive, send):
+        _receive.set(receive)
+        return await super().__call__(scope, receive, send)
+
+    async def wait_disconnect(self):
+        receive = _receive.get()
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        headers = [(header.encode('ascii'), value.encode('latin1')) for header, value in response.items()]
+        headers += [(b'Set-Cookie', c.output(header='').encode('ascii').strip()) for c in response.cookies.values()]
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.max_pending)
+        stopped = threading.Event()
+
+        ## the parts, then None at the end or the exception that ended the iteration
+        def produce():
+            end = None
+            try:
+                for part in response:
+                    asyncio.run_coroutine_threadsafe(queue.put(part), loop).result()
+                    if stopped.is_set():
+                        break
+            except Exception as e:
+                end = e
+            finally:
+                connections.close_all()
+                asyncio.run_coroutine_threadsafe(queue.put(end), loop)
+
+        threading.Thread(target=produce, name='streaming-response', daemon=True).start()
+        disconnected = asyncio.ensure_future(self.wait_disconnect())
+        try:
+            while True:
+                part = await queue.get()
+                if part is None:
+                    break
+                if isinstance(part, Exception):
+                    raise part
+                if disconnected.done():
+                    stopped.set()
+                if stopped.is_set():
+                    continue
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not stopped.is_set():
+                await send({'type': 'http.response.body'})
+        finally:
+            stopped.set()
+            disconnected.cancel()
+            while not queue.empty():
+                queue.get_nowait()
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+django.setup(set_prefix=False)
+django_application = streamingASGIHandler()
+
+from interface import events
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == events.PATH:
+        return await events.application(scope, receive, send)
+    return await django_application(scope, receive, send)
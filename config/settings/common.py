@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'interface.middleware.gzipMiddleware', #compresses the large JSON responses of the API, not the ZIP exports
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,12 +59,24 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
+# Django REST framework
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'interface.renderers.fastJSONRenderer', #uses orjson when it is installed
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
 
 # Database
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'config.sqlite3', #sqlite in WAL mode with immediate transactions (config/sqlite3/base.py)
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600, #seconds a connection is reused across requests/ tasks
+        'OPTIONS': {
+            'timeout': 30, #seconds a writer waits for the database lock before failing
+        },
     }
 }
 
@@ -87,6 +100,10 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage' #compres
 # Media files (simulator files that are not directly served to users)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = Path.joinpath(BASE_DIR, 'media/')
+# Campus files parsed at upload, kept for the instantiation (interface/schema.py), private to the server
+CAMPUS_CACHE_ROOT = Path.joinpath(BASE_DIR, 'cache/campus/')
+# Seconds after which chunked uploads (interface/uploads.py) that were not made into a campus are removed
+UPLOAD_EXPIRY = 24 * 3600
 
 # Celery: handles running asynchronous, background tasks
 CELERY_BROKER_URL = 'amqp://localhost'
@@ -100,9 +117,51 @@ CELERY_RESULT_BACKEND = 'django-db'
 CELERY_TASK_ROUTES = {
     'interace.tasks.send_mail': 'mailQueue',
     'interface.tasks.run_instantiate': 'instQueue',
-    'interface.task.run_simulation': 'simQueue',
+    'interface.tasks.run_iteration': 'simQueue',
+}
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1 # workers take one iteration at a time, the order is decided by the scheduler
+CELERY_TASK_ACKS_LATE = True # run_iteration is also rejected when its worker dies (reject_on_worker_lost), to be delivered again
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-simulations': {
+        'task': 'interface.tasks.dispatch_simulations',
+        'schedule': 60.0, # seconds
+    },
+    'remove-stale-uploads': {
+        'task': 'interface.tasks.remove_stale_uploads',
+        'schedule': 3600.0, # seconds
+    },
 }
 
+# Simulation scheduler (interface/scheduler.py): dispatches simulation iterations to simQueue
+SIM_SCHEDULER = {
+    'SLOTS': 8, # iterations running at once, match the concurrency of the simQueue workers
+    'USER_MAX_RUNNING': 4, # iterations of a single user running at once
+    'USAGE_WINDOW': 48 * 3600, # seconds of CPU time history considered for fair share
+    'USAGE_HALF_LIFE': 6 * 3600, # seconds after which consumed CPU time counts half
+    'DEFER_BACKLOG': 2000, # queued iterations past which batch simulations wait to be admitted
+    'REJECT_BACKLOG': 10000, # queued iterations past which batch simulations are rejected
+    'RUN_TIMEOUT': 12 * 3600, # seconds an iteration may run for, the simulator is stopped past it
+    'LOST_AFTER': 15 * 60, # seconds after which an iteration dispatched but not started, or running past RUN_TIMEOUT, is taken for lost
+    'MAX_ATTEMPTS': 3, # times an iteration is handed to a worker before it is failed
+}
+
+# Job status transitions and iteration progress are pushed to the pages of their owners (interface/progress.py), through
+# a fanout exchange of the celery broker ('amqp') or within the process that made the change ('local')
+PROGRESS_PUBSUB = {
+    'BACKEND': 'amqp',
+    'EXCHANGE': 'campussim.progress',
+    'HEARTBEAT': 15, # seconds between keep-alive comments on an idle stream
+}
+
+# Seconds between reads of the output files of a running iteration, for the live day by day counts (interface/live.py)
+LIVE_SERIES_INTERVAL = 5
+# New days read before the curve is stored on the iteration again, the remaining days are stored when it ends
+LIVE_SERIES_DAYS = 10
+
+# Instantiations run campus_parse in a child process of the instQueue worker, the memory (heap and anonymous mappings)
+# the child can allocate is capped so that an oversized campus fails instead of exhausting the node, 0 for no limit
+INSTANTIATION_MEMORY_LIMIT = 8 * 1024 ** 3 # bytes
+
 # Anymail: handles sending out email notifications, when configured
 ANYMAIL = {
 
@@ -0,0 +1,20 @@
+"""
+base.py: SQLite database backend for the web server and the celery workers sharing one database file
+- the journal is in WAL mode: readers do not wait for the writer and the writer does not wait for readers
+- transactions begin IMMEDIATE, i.e. they take the write lock when they start: a transaction that reads and then
+  writes would otherwise fail with `database is locked' instead of waiting when another writer got there first
+- writers wait for the lock for up to OPTIONS['timeout'] seconds (see config/settings/common.py)
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        conn.execute('PRAGMA journal_mode = WAL')
+        ## with WAL, transactions stay durable against crashes of the application, only not against power loss
+        conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
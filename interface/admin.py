@@ -11,6 +11,7 @@ admin.site.register(campusInstantiation)
 admin.site.register(interventions)
 admin.site.register(testingParams)
 admin.site.register(simulationParams)
+admin.site.register(simulationSweep)
 admin.site.register(simulationResults)
 
 ## This defines the behaviors for the fields defined in the user model
@@ -20,3 +20,12 @@ class InterfaceConfig(AppConfig):
 
     def ready(self):
         post_migrate.connect(create_user_groups, sender=self)
+
+        ## dashboard counters follow the objects they count (see counters.py)
+        from . import counters
+        counters.connect()
+
+        ## cached campus frames are removed with their campus or upload (see schema.py, uploads.py)
+        from . import schema, uploads
+        schema.connect()
+        uploads.connect()
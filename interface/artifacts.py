@@ -0,0 +1,277 @@
+"""
+artifacts.py: writes and reads the instantiation artifacts (individuals.json, interaction_spaces.json)
+- artifacts are encoded record by record straight into their storage path, the whole JSON document
+  is never held in memory
+- `orjson' is used when it is installed (numpy types are serialized natively), else `json' with `helper.convert'
+- artifacts are stored compressed (zstd when `zstandard' is installed, else gzip) next to a small index
+  (`<artifact>.index.json': codec, size before and after compression, sha256 of the JSON)
+- the simulator reads plain JSON: a decompressed copy is staged next to the artifact, under the name the
+  uncompressed artifact had, before an iteration runs and removed once the instantiation is idle
+- running iterations hold a shared lock on the staged copies of their instantiation (`hold_staged'), the copies
+  are only removed under the exclusive lock (`release_staged')
+- python readers use `open_artifact', which decompresses on the fly
+"""
+import codecs
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import time
+
+from .helper import convert
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+if orjson is not None:
+    OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+## file suffix -> function opening a compressed file like `open(path, mode)'
+CODECS = {'.gz': lambda path, mode: gzip.open(path, mode, compresslevel=6)}
+if zstandard is not None:
+    CODECS['.zst'] = lambda path, mode: zstandard.open(path, mode, cctx=zstandard.ZstdCompressor(level=10))
+DEFAULT_CODEC = '.zst' if zstandard is not None else '.gz'
+
+ARTIFACT_FIELDS = ('agent_json', 'interaction_spaces_json')
+CHUNK_SIZE = 1024 * 1024
+
+## Encodes one JSON value to bytes
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, default=convert, option=OPTIONS)
+    return json.dumps(obj, default=convert).encode('utf-8')
+
+## Writes a list (or dict) as a JSON document to the binary file `f', one element at a time
+## Elements are joined into chunks of about CHUNK_SIZE bytes before being written (compressed files are slow on small writes)
+## Returns the number of bytes written and the sha256 of the document
+def write_json(records, f):
+    if isinstance(records, dict):
+        opening, closing = b'{', b'}'
+        items = (dumps(str(k)) + b':' + dumps(v) for k, v in records.items())
+    else:
+        opening, closing = b'[', b']'
+        items = (dumps(v) for v in records)
+
+    written, digest = 0, hashlib.sha256()
+    def flush(chunk):
+        data = b''.join(chunk)
+        digest.update(data)
+        return f.write(data)
+
+    chunk, size = [opening], 1
+    for i, item in enumerate(items):
+        if i:
+            chunk.append(b',')
+        chunk.append(item)
+        size += len(item) + 1
+        if size >= CHUNK_SIZE:
+            written += flush(chunk)
+            chunk, size = [], 0
+    chunk.append(closing)
+    written += flush(chunk)
+    return written, digest.hexdigest()
+
+## Codec suffix of a stored artifact name, '' for artifacts stored before compression
+def get_codec(name):
+    suffix = os.path.splitext(name)[1]
+    return suffix if suffix in CODECS else ''
+
+## Path of the plain JSON read by the simulator for the artifact stored at `path'
+def get_staged_path(path):
+    codec = get_codec(path)
+    return path[:-len(codec)] if codec else path
+
+def get_index_path(path):
+    return f"{ path }.index.json"
+
+def read_index(path):
+    try:
+        with open(get_index_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_index(path, codec, raw_bytes, sha256):
+    index = {'codec': codec.lstrip('.'), 'bytes': raw_bytes, 'stored_bytes': os.path.getsize(path), 'sha256': sha256}
+    with open(get_index_path(path), 'w') as f:
+        json.dump(index, f)
+    return index
+
+## Opens a stored artifact for reading as plain JSON bytes, whether or not it is compressed
+def open_artifact(fieldfile):
+    path = fieldfile.path
+    codec = get_codec(path)
+    return CODECS[codec](path, 'rb') if codec else open(path, 'rb')
+
+## Iterates over the elements of a JSON list (or the values of a JSON object) read from the binary file `f',
+## one element at a time, without decoding the whole document
+def iter_json(f):
+    decoder = json.JSONDecoder()
+    reader = codecs.getincrementaldecoder('utf-8')()
+    buf, pos, eof = '', 0, False
+
+    def fill():
+        nonlocal buf, pos, eof
+        data = f.read(CHUNK_SIZE)
+        eof = not data
+        buf = buf[pos:] + reader.decode(data, final=eof)
+        pos = 0
+
+    def next_char():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf) or eof:
+                return buf[pos] if pos < len(buf) else ''
+            fill()
+
+    def decode():
+        nonlocal pos
+        next_char()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                ## a number at the end of the buffer may continue in the next chunk
+                if end < len(buf) or eof:
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            fill()
+
+    opening = next_char()
+    if opening not in ('[', '{'):
+        raise ValueError("Expected a JSON list or object")
+    closing = ']' if opening == '[' else '}'
+    pos += 1
+    if next_char() == closing:
+        return
+    while True:
+        if opening == '{':
+            decode()
+            if next_char() != ':':
+                raise ValueError("Expected ':' in a JSON object")
+            pos += 1
+        yield decode()
+        separator = next_char()
+        pos += 1
+        if separator == closing:
+            return
+        if separator != ',':
+            raise ValueError(f"Expected ',' or '{ closing }'")
+
+## Storage name for a new artifact of the FileField `field_name' of `instance': `filename' + codec suffix
+## The name is chosen so that neither the compressed file nor its staged copy clash with other artifacts
+def get_artifact_name(instance, field_name, filename, codec=DEFAULT_CODEC):
+    field = instance._meta.get_field(field_name)
+    storage = getattr(instance, field_name).storage
+    name = field.generate_filename(instance, filename)
+    root, ext = os.path.splitext(name)
+    while storage.exists(name) or storage.exists(name + codec):
+        name = storage.get_alternative_name(root, ext)
+    return name + codec
+
+## Streams `records' compressed (codec taken from the suffix of `path') into `path' and writes its index
+## Does not touch the database, the instantiation runs it in a child process
+## Returns {'bytes': size of the JSON, 'stored_bytes': size on disk, 'seconds': time taken to serialize and write it}
+def write_json_artifact(path, records):
+    codec = get_codec(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    start = time.perf_counter()
+    with CODECS[codec](path, 'wb') as f:
+        written, sha256 = write_json(records, f)
+    elapsed = time.perf_counter() - start
+    index = write_index(path, codec, written, sha256)
+    return {'bytes': written, 'stored_bytes': index['stored_bytes'], 'seconds': elapsed}
+
+## Makes sure the plain JSON of a stored artifact exists for the simulator, returns its path
+## The copy is decompressed to a temporary file and moved in place, so a partial copy is never visible
+def stage_artifact(fieldfile):
+    path = fieldfile.path
+    staged = get_staged_path(path)
+    if staged == path:
+        return path
+    index = read_index(path)
+    if os.path.exists(staged) and (index is None or os.path.getsize(staged) == index['bytes']):
+        return staged
+
+    tmp = f"{ staged }.{ os.getpid() }.tmp"
+    with open_artifact(fieldfile) as src, open(tmp, 'wb') as dst:
+        while True:
+            data = src.read(CHUNK_SIZE)
+            if not data:
+                break
+            dst.write(data)
+    os.replace(tmp, staged)
+    return staged
+
+## Stages all the artifacts of an instantiation (see `stage_artifact')
+def stage_artifacts(inst):
+    return [stage_artifact(getattr(inst, field)) for field in ARTIFACT_FIELDS]
+
+## Lock file of the staged copies of an instantiation, next to them
+def get_lock_path(inst):
+    return f"{ get_staged_path(inst.agent_json.path) }.lock"
+
+## Shared lock on the staged copies of an instantiation, held for as long as the returned file is open
+## An iteration takes it before staging and keeps it until the simulator exits, the lock goes with a worker that dies
+def hold_staged(inst):
+    if not inst.agent_json:
+        return None
+    f = open(get_lock_path(inst), 'a')
+    fcntl.flock(f, fcntl.LOCK_SH)
+    return f
+
+## Removes the staged copies of the artifacts of an instantiation, returns the number of bytes freed
+## Nothing is removed while an iteration holds them (see `hold_staged')
+def release_staged(inst):
+    freed = 0
+    if not inst.agent_json:
+        return freed
+    with open(get_lock_path(inst), 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0
+        for field in ARTIFACT_FIELDS:
+            fieldfile = getattr(inst, field)
+            if not fieldfile or not get_codec(fieldfile.name):
+                continue
+            staged = get_staged_path(fieldfile.path)
+            if os.path.exists(staged):
+                freed += os.path.getsize(staged)
+                os.remove(staged)
+    return freed
+
+## Compresses an artifact stored before compression, the field then points to the compressed file
+## The plain file is left in place as the staged copy, `release_staged' removes it once the instantiation is idle
+## Returns (bytes before, bytes after), (0, 0) when there was nothing to compress
+def compress_artifact(instance, field_name, codec=DEFAULT_CODEC):
+    fieldfile = getattr(instance, field_name)
+    if not fieldfile or get_codec(fieldfile.name) or not os.path.exists(fieldfile.path) or os.path.exists(f"{ fieldfile.path }{ codec }"):
+        return (0, 0)
+    path = fieldfile.path
+    digest = hashlib.sha256()
+    with open(path, 'rb') as src, CODECS[codec](f"{ path }{ codec }", 'wb') as dst:
+        while True:
+            data = src.read(CHUNK_SIZE)
+            if not data:
+                break
+            digest.update(data)
+            dst.write(data)
+    index = write_index(f"{ path }{ codec }", codec, os.path.getsize(path), digest.hexdigest())
+
+    type(instance).objects.filter(pk=instance.pk).update(**{field_name: f"{ fieldfile.name }{ codec }"})
+    setattr(instance, field_name, f"{ fieldfile.name }{ codec }")
+    return (index['bytes'], index['stored_bytes'])
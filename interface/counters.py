@@ -0,0 +1,130 @@
+"""
+counters.py: maintains the per-user dashboard counters (`userCounters') read by the profile page
+- interventions, campus instantiations and simulations are counted (the latter two by status) when they are
+  created or deleted (model signals, `record' for bulk creates)
+- status changes go through `set_status', which updates the objects and the counters in one transaction, a
+  row is only counted as moved when its conditional update succeeds so concurrent transitions are not counted twice
+- every status transition is also published to the pages of the owner (see progress.py)
+- `reconcile' recounts from the tables and repairs any drift (python manage.py reconcile_counters)
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.signals import post_delete, post_save
+
+from . import progress
+from .models import campusInstantiation, interventions, simulationParams, userCounters
+
+## model -> prefix of its counter fields, the status is appended (e.g. `jobs_running')
+PREFIXES = {campusInstantiation: 'campuses', simulationParams: 'jobs'}
+COUNTER_FIELDS = [f.name for f in userCounters._meta.get_fields() if f.name not in ('user', 'updated_on')]
+
+## Counter field of an object of `model' with the given status, None if it is not counted
+def get_field(model, status=None):
+    if model is interventions:
+        return 'interventions'
+    if model not in PREFIXES or not status:
+        return None
+    field = f"{ PREFIXES[model] }_{ status.lower() }"
+    return field if field in COUNTER_FIELDS else None
+
+## Applies {user id: {field: delta}} to the counters, missing counters are only created when `create' is set
+## (deletes do not create them, a user being deleted takes their counters along)
+def add(deltas, create=True):
+    with transaction.atomic():
+        for user_id, fields in deltas.items():
+            fields = {field: delta for field, delta in fields.items() if field is not None and delta}
+            if user_id is None or not fields:
+                continue
+            if create:
+                userCounters.objects.get_or_create(user_id=user_id)
+            userCounters.objects.filter(user_id=user_id).update(**{field: F(field) + delta for field, delta in fields.items()})
+
+## Counts objects that were created (sign=1) or deleted (sign=-1) without going through the model signals (bulk_create)
+def record(objs, sign=1):
+    deltas = defaultdict(Counter)
+    for obj in objs:
+        deltas[obj.created_by_id][get_field(type(obj), getattr(obj, 'status', None))] += sign
+    add(deltas, create=sign > 0)
+
+## Sets the status (and the other `fields') of the objects of `queryset' and moves them between counters
+## Returns the number of objects updated, as `QuerySet.update' does
+def set_status(queryset, status, **fields):
+    model = queryset.model
+    with transaction.atomic():
+        groups = defaultdict(list)
+        for pk, user_id, old in queryset.values_list('pk', 'created_by_id', 'status'):
+            groups[(user_id, old)].append(pk)
+        updated = 0
+        deltas = defaultdict(Counter)
+        for (user_id, old), pks in groups.items():
+            n = model.objects.filter(pk__in=pks, status=old).update(status=status, **fields)
+            updated += n
+            if n and old != status:
+                deltas[user_id][get_field(model, old)] -= n
+                deltas[user_id][get_field(model, status)] += n
+                if model in PREFIXES:
+                    if n != len(pks):
+                        pks = list(model.objects.filter(pk__in=pks, status=status).values_list('pk', flat=True))
+                    progress.publish(user_id, PREFIXES[model], ids=pks, old=old, status=status)
+        add(deltas)
+    return updated
+
+def on_save(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record([instance])
+
+def on_delete(sender, instance, **kwargs):
+    record([instance], sign=-1)
+
+## Connected when the application is ready (see apps.py)
+def connect():
+    for model in [interventions] + list(PREFIXES):
+        post_save.connect(on_save, sender=model, dispatch_uid=f"counters_save_{ model.__name__ }")
+        post_delete.connect(on_delete, sender=model, dispatch_uid=f"counters_delete_{ model.__name__ }")
+
+## Counters recounted from the tables, {user id: {field: n}}, for all users or only `user_ids'
+def count(user_ids=None):
+    counts = defaultdict(Counter)
+    querysets = [(interventions, interventions.objects.all())] + [(model, model.objects.all()) for model in PREFIXES]
+    for model, queryset in querysets:
+        if user_ids is not None:
+            queryset = queryset.filter(created_by_id__in=user_ids)
+        keys = ['created_by'] + (['status'] if model in PREFIXES else [])
+        for row in queryset.values(*keys).annotate(n=Count('pk')).order_by():
+            field = get_field(model, row.get('status'))
+            if row['created_by'] is not None and field is not None:
+                counts[row['created_by']][field] += row['n']
+    return counts
+
+## Rewrites the counters that drifted from the tables, returns {user id: {field: (counter, actual)}}
+def reconcile(user_ids=None, dry_run=False):
+    actual = count(user_ids)
+    stored = userCounters.objects.all() if user_ids is None else userCounters.objects.filter(user_id__in=user_ids)
+    stored = {row['user']: row for row in stored.values('user', *COUNTER_FIELDS)}
+    drift = {}
+    with transaction.atomic():
+        for user_id in set(actual) | set(stored):
+            have = stored.get(user_id, {})
+            changed = {field: (have.get(field, 0), actual[user_id][field]) for field in COUNTER_FIELDS
+                       if have.get(field, 0) != actual[user_id][field]}
+            if not changed and user_id in stored:
+                continue
+            if changed:
+                drift[user_id] = changed
+            if not dry_run:
+                userCounters.objects.update_or_create(user_id=user_id, defaults={field: actual[user_id][field] for field in COUNTER_FIELDS})
+    return drift
+
+## Counters of a user, summed over every user for staff, in a single read
+## Users counted before the counters existed are counted once from the tables
+def get_counts(user):
+    if user.is_staff:
+        totals = userCounters.objects.aggregate(**{field: Sum(field) for field in COUNTER_FIELDS})
+        return userCounters(**{field: totals[field] or 0 for field in COUNTER_FIELDS})
+    try:
+        return userCounters.objects.get(user=user)
+    except userCounters.DoesNotExist:
+        reconcile([user.id])
+        return userCounters.objects.get_or_create(user=user)[0]
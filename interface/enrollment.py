@@ -0,0 +1,69 @@
+"""
+enrollment.py: sparse (CSR) representation of the timetable, the classes each student is enrolled in
+- `students[i]' is enrolled in `classes[indptr[i]:indptr[i + 1]]', memory grows with the number of enrollments
+- the dense form handed to `campus_parse' has the 24 columns the timetable was always read with (the student id and
+  up to 23 classes), a timetable with a larger enrollment is rejected
+"""
+import io
+
+import numpy as np
+import pandas as pd
+
+## Columns of the dense timetable read by `campus_parse'
+TIMETABLE_COLUMNS = 24
+
+## Raised when the timetable cannot be read as a list of student and class ids
+class EnrollmentError(ValueError):
+    pass
+
+## Classes of each student in compressed sparse row form
+class sparseEnrollment:
+    def __init__(self, students, indptr, classes):
+        self.students = np.asarray(students, dtype=np.int32)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.classes = np.asarray(classes, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.students)
+
+    ## Number of classes of each student
+    @property
+    def counts(self):
+        return np.diff(self.indptr)
+
+    ## Dense timetable as read by `campus_parse': column '0' is the student id and columns '1' to '23' the class ids,
+    ## padded with NaN
+    def to_frame(self):
+        counts = self.counts
+        width = TIMETABLE_COLUMNS
+        dense = np.full((len(self), width), np.nan, dtype=np.float32)
+        dense[:, 0] = self.students
+        position = np.arange(len(self.classes)) - np.repeat(self.indptr[:-1], counts) + 1
+        dense[np.repeat(np.arange(len(self)), counts), position] = self.classes
+        return pd.DataFrame(dense, columns=[str(i) for i in range(width)])
+
+## Reads a timetable file (no header, one student per line: the student id followed by its class ids)
+## All the ids are parsed in one go by the pandas C parser as a single column, blank lines and trailing commas are ignored
+def read_enrollment(f):
+    lines = [line.strip(b' ,') for line in f.read().replace(b'\r', b'').split(b'\n')]
+    lines = [line for line in lines if line]
+    if not lines:
+        return sparseEnrollment([], [0], [])
+
+    counts = np.fromiter((line.count(b',') + 1 for line in lines), dtype=np.int64, count=len(lines))
+    try:
+        values = pd.read_csv(io.BytesIO(b'\n'.join(lines).replace(b',', b'\n')), header=None, skip_blank_lines=False, dtype=np.float64)[0].to_numpy()
+    except ValueError as e:
+        raise EnrollmentError(f"only student and class ids are expected: { e }")
+    if np.isnan(values).any():
+        row = int(np.repeat(np.arange(len(lines)), counts)[np.argmax(np.isnan(values))]) + 1
+        raise EnrollmentError(f"line { row } has an empty id")
+    if (values % 1 != 0).any():
+        raise EnrollmentError("student and class ids should be whole numbers")
+    if counts.max() > TIMETABLE_COLUMNS:
+        raise EnrollmentError(f"line { int(np.argmax(counts)) + 1 } has more than { TIMETABLE_COLUMNS - 1 } classes")
+
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    is_student = np.zeros(len(values), dtype=bool)
+    is_student[starts] = True
+    return sparseEnrollment(values[starts], np.concatenate([[0], np.cumsum(counts - 1)]), values[~is_student])
@@ -0,0 +1,109 @@
+"""
+events.py: streams the progress of a user's jobs to their pages as Server-Sent Events (GET /events/progress/)
+- served by the ASGI application next to Django (see config/asgi.py), a connection waits on the event loop and
+  not on a worker thread, the database is only read when a page connects
+- a connection starts with a `snapshot' of the user's counters and of the jobs the page shows (?jobs=1,2,3), so
+  that changes made between the page being rendered and the stream being opened are not missed
+- then every event of the user's jobs is pushed as it is published (see progress.py): status transitions ('jobs',
+  'campuses'), iterations ('iteration'), new days of the live counts ('series') and aggregated results ('results'),
+  staff receive the events of every user as their dashboard counts every job
+- the session cookie of the pages authenticates the stream
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.db.models import Count, Q
+from django.utils.module_loading import import_string
+
+from . import counters
+from .models import simulationParams
+from .progress import hub
+
+PATH = '/events/progress/'
+MAX_JOBS = 200
+
+## User of the session the request was made with, AnonymousUser when there is none
+def get_scope_user(scope):
+    close_old_connections()
+    try:
+        request = ASGIRequest(scope, None)
+        request.session = import_string(f"{ settings.SESSION_ENGINE }.SessionStore")(request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+        return get_user(request)
+    finally:
+        close_old_connections()
+
+## Counters of the user and the status and progress of the jobs shown by the page, in two reads
+def get_snapshot(user, job_ids):
+    close_old_connections()
+    try:
+        counts = counters.get_counts(user)
+        jobs = simulationParams.objects.filter(id__in=job_ids[:MAX_JOBS])
+        if not user.is_staff:
+            jobs = jobs.filter(created_by=user)
+        jobs = jobs.annotate(done=Count('iterations', filter=Q(iterations__status__in=['Complete', 'Error']))).values('id', 'status', 'done', 'simulation_iterations')
+        return {
+            'counters': {field: getattr(counts, field) for field in counters.COUNTER_FIELDS},
+            'jobs': [{'id': job['id'], 'status': job['status'], 'done': job['done'], 'total': job['simulation_iterations']} for job in jobs],
+        }
+    finally:
+        close_old_connections()
+
+def get_job_ids(scope):
+    params = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    try:
+        return [int(i) for i in ','.join(params.get('jobs', [])).split(',') if i.strip()]
+    except ValueError:
+        return []
+
+def format_event(kind, data):
+    return f"event: { kind }\ndata: { json.dumps(data) }\n\n".encode()
+
+async def send_response(send, code, message):
+    await send({'type': 'http.response.start', 'status': code, 'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+    await send({'type': 'http.response.body', 'body': message.encode()})
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+## ASGI application of the stream
+async def application(scope, receive, send):
+    if scope['method'] != 'GET':
+        return await send_response(send, 405, 'Method not allowed')
+    user = await sync_to_async(get_scope_user)(scope)
+    if not user.is_authenticated:
+        return await send_response(send, 403, 'Authentication credentials were not provided')
+    snapshot = await sync_to_async(get_snapshot)(user, get_job_ids(scope))
+
+    key = None if user.is_staff else user.id
+    queue = hub.subscribe(key)
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n' + format_event('snapshot', snapshot), 'more_body': True})
+        while True:
+            event = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({event, disconnected}, timeout=settings.PROGRESS_PUBSUB['HEARTBEAT'], return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                event.cancel()
+                break
+            if event in done:
+                data = {k: v for k, v in event.result().items() if k != 'user'}
+                body = format_event(data.pop('kind'), data)
+            else:
+                event.cancel()
+                body = b': keep-alive\n\n'
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    finally:
+        hub.unsubscribe(key, queue)
+        disconnected.cancel()
@@ -0,0 +1,251 @@
+"""
+export.py: bundles the parameters and the results of a set of simulations into one ZIP file, streamed as it is written
+- the bundle has `parameters.<csv|parquet>' (one row per simulation), `series.<csv|parquet>' (the aggregated
+  results in long form: simulation, mode, metric, day, mean, std) and, when asked for, the output files of every
+  iteration as written by the simulator (`raw/<simulation>/iteration_<i>/...'), the iterations whose output
+  directory or files could not be read are listed in `raw/missing.txt'
+- nothing is staged on disk and memory does not grow with the size of the export: the simulations are read a few
+  at a time, the raw files are copied block by block and the ZIP file is written in order (the sizes and checksums
+  follow every entry), so that `stream_bundle' yields the bundle in chunks of about CHUNK_SIZE
+- served by `simulationParamsViewSet.export' (GET /api/simulations/export/) and the `export_results' command, the
+  ASGI application iterates the response in a thread of its own (see config/asgi.py)
+- parquet tables are written with pyarrow (imported when a parquet export is made), one row group per batch
+"""
+import csv
+import io
+import json
+import os
+import time
+import zipfile
+
+from .helper import SERIES_MODES
+from .models import simulationIteration, simulationParams, simulationResults
+
+import logging
+log = logging.getLogger('interface_log')
+
+CHUNK_SIZE = 256 * 1024
+BLOCK_SIZE = 1024 * 1024
+PARAMS_BATCH = 500 # simulations per read of the parameters
+RESULTS_BATCH = 8 # simulations per read of the aggregated results, each holds every series of a simulation
+MAX_BATCH_ROWS = 100000 # rows of series per row group (parquet) or write (csv)
+CSV_SLICE_ROWS = 2000 # rows per call of the csv writer
+
+## column -> lookup on simulationParams and the type of the column
+PARAM_COLUMNS = (
+    ('id', 'id', 'int'),
+    ('simulation_name', 'simulation_name', 'str'),
+    ('status', 'status', 'str'),
+    ('campus_instantiation', 'campus_instantiation', 'int'),
+    ('campus_name', 'campus_instantiation__inst_name__campus_name', 'str'),
+    ('intervention', 'intervention', 'int'),
+    ('intervention_name', 'intervention__intv_name', 'str'),
+    ('testing_protocol', 'testing_protocol', 'int'),
+    ('sweep', 'sweep', 'int'),
+    ('batch_id', 'batch_id', 'str'),
+    ('days_to_simulate', 'days_to_simulate', 'int'),
+    ('simulation_iterations', 'simulation_iterations', 'int'),
+    ('init_infected_seed', 'init_infected_seed', 'int'),
+    ('enable_testing', 'enable_testing', 'bool'),
+    ('testing_capacity', 'testing_capacity', 'int'),
+    ('periodicity', 'periodicity', 'int'),
+    ('betaScale', 'betaScale', 'int'),
+    ('min_grp_size', 'min_grp_size', 'int'),
+    ('max_grp_size', 'max_grp_size', 'int'),
+    ('avg_associations', 'avg_associations', 'int'),
+    ('minimum_hostel_time', 'minimum_hostel_time', 'float'),
+    ('restart', 'restart', 'int'),
+    ('restart_batch_size', 'restart_batch_size', 'int'),
+    ('restart_batch_frequency', 'restart_batch_frequency', 'int'),
+    ('vax', 'vax', 'int'),
+    ('vaccination_frequency', 'vaccination_frequency', 'int'),
+    ('vax_restart_delay', 'vax_restart_delay', 'int'),
+    ('daily_vaccination_capacity', 'daily_vaccination_capacity', 'int'),
+    ('trans_coeff_file', 'trans_coeff_file', 'json'),
+    ('created_on', 'created_on', 'datetime'),
+    ('completed_at', 'completed_at', 'datetime'),
+)
+SERIES_COLUMNS = (('simulation', 'int'), ('mode', 'str'), ('metric', 'str'), ('day', 'int'), ('mean', 'float'), ('std', 'float'))
+
+def convert(value, kind):
+    if value is None:
+        return None
+    if kind == 'float':
+        return float(value)
+    if kind == 'str':
+        return str(value)
+    if kind == 'json':
+        return json.dumps(value)
+    return value
+
+## Write end of the ZIP file, what is written is taken out in chunks by `drain'
+## The ZIP file is not seekable, zipfile then writes the sizes and checksum of an entry after its data
+class zipSink:
+    def __init__(self):
+        self.parts, self.size = [], 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts, self.size = [], 0
+        return data
+
+    def drain(self, minimum=CHUNK_SIZE):
+        if self.size and self.size >= minimum:
+            yield self.take()
+
+## Entry of the ZIP file as a file object that knows its position, as pyarrow asks for it
+class entryFile:
+    def __init__(self, entry):
+        self.entry, self.position, self.closed = entry, 0, False
+
+    def write(self, data):
+        self.entry.write(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+## Writes a table to an entry, batch by batch (a batch is a list of columns), as CSV or as a parquet row group per
+## batch. Yields after every batch so that the caller can send what was written
+def write_table(entry, columns, batches, file_format):
+    if file_format == 'csv':
+        datetimes = [i for i, (_, kind) in enumerate(columns) if kind == 'datetime']
+        text = io.StringIO()
+        csv.writer(text).writerow(name for name, _ in columns)
+        entry.write(text.getvalue().encode())
+        for values in batches:
+            for i in datetimes:
+                values[i] = [v.isoformat() if v else v for v in values[i]]
+            text = io.StringIO()
+            writer = csv.writer(text)
+            ## in slices: a call holds the interpreter lock, the event loop of the ASGI application waits meanwhile
+            for start in range(0, len(values[0]), CSV_SLICE_ROWS):
+                writer.writerows(zip(*(v[start:start + CSV_SLICE_ROWS] for v in values)))
+            entry.write(text.getvalue().encode())
+            yield
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    types = {'int': pa.int64(), 'float': pa.float64(), 'bool': pa.bool_(), 'str': pa.string(), 'json': pa.string(),
+             'datetime': pa.timestamp('us')}
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    writer = pq.ParquetWriter(entryFile(entry), schema, compression='zstd')
+    try:
+        for values in batches:
+            writer.write_table(pa.Table.from_arrays([pa.array(v, type=field.type) for v, field in zip(values, schema)], schema=schema))
+            yield
+    finally:
+        writer.close()
+
+def get_param_columns(simulation_ids):
+    lookups = [lookup for _, lookup, _ in PARAM_COLUMNS]
+    for start in range(0, len(simulation_ids), PARAMS_BATCH):
+        rows = simulationParams.objects.filter(id__in=simulation_ids[start:start + PARAMS_BATCH]).order_by('id').values_list(*lookups)
+        if rows:
+            yield [[convert(v, kind) for v in values] for values, (_, _, kind) in zip(zip(*rows), PARAM_COLUMNS)]
+
+## Columns of the aggregated results, read a few simulations at a time and written every MAX_BATCH_ROWS rows
+def get_series_columns(simulation_ids):
+    columns = [[] for _ in SERIES_COLUMNS]
+    for start in range(0, len(simulation_ids), RESULTS_BATCH):
+        results = simulationResults.objects.filter(simulation_id__in=simulation_ids[start:start + RESULTS_BATCH], status='A')
+        for pk, agg in results.order_by('simulation_id').values_list('simulation_id', 'agg_results'):
+            agg = agg or {}
+            time_ = agg.get('time') or []
+            simulations, modes, metrics, days, means, stds = columns
+            for mode in SERIES_MODES:
+                for metric, values in (agg.get(mode) or {}).items():
+                    mean, std = values.get('mean') or [], values.get('std') or []
+                    n = min(len(time_), len(mean), len(std))
+                    simulations.extend([pk] * n)
+                    modes.extend([mode] * n)
+                    metrics.extend([metric] * n)
+                    days.extend(time_[:n])
+                    means.extend(mean[:n])
+                    stds.extend(std[:n])
+            if len(days) >= MAX_BATCH_ROWS:
+                yield columns
+                columns = [[] for _ in SERIES_COLUMNS]
+    if columns[0]:
+        yield columns
+
+## (name in the bundle, path) of the output files of the iterations, iterations run before they were recorded
+## one by one are found from the output directory of their simulation
+## An iteration without an output directory is given as (its directory in the bundle, None)
+def get_raw_files(simulation_ids):
+    for start in range(0, len(simulation_ids), PARAMS_BATCH):
+        batch = simulation_ids[start:start + PARAMS_BATCH]
+        directories = {}
+        for pk, iteration, directory in simulationIteration.objects.filter(simulation_id__in=batch).values_list('simulation_id', 'iteration', 'output_directory'):
+            directories.setdefault(pk, {})[iteration] = directory
+        for pk, directory, iterations in simulationParams.objects.filter(id__in=batch).order_by('id').values_list('id', 'output_directory', 'simulation_iterations'):
+            found = directories.get(pk) or {i: f"{ directory }_id_{ i }" for i in range(iterations or 0) if directory}
+            for iteration, path in sorted(found.items()):
+                if not path or not os.path.isdir(path):
+                    yield f"raw/{ pk }/iteration_{ iteration }/", None
+                    continue
+                for root, dirs, files in os.walk(path):
+                    dirs.sort()
+                    for name in sorted(files):
+                        full = os.path.join(root, name)
+                        yield f"raw/{ pk }/iteration_{ iteration }/{ os.path.relpath(full, path) }", full
+
+def new_entry(name, compress=True):
+    info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    return info
+
+## The bundle of the simulations `simulation_ids', in chunks of bytes
+def stream_bundle(simulation_ids, file_format='csv', raw=False):
+    sink = zipSink()
+    ## parquet is compressed already
+    compress = file_format == 'csv'
+    with zipfile.ZipFile(sink, 'w') as bundle:
+        tables = (('parameters', [(name, kind) for name, _, kind in PARAM_COLUMNS], get_param_columns),
+                  ('series', SERIES_COLUMNS, get_series_columns))
+        for name, columns, get_columns in tables:
+            with bundle.open(new_entry(f"{ name }.{ file_format }", compress), 'w', force_zip64=True) as entry:
+                for _ in write_table(entry, columns, get_columns(simulation_ids), file_format):
+                    yield from sink.drain()
+
+        if raw:
+            missing = []
+            for name, path in get_raw_files(simulation_ids):
+                if path is None:
+                    missing.append(f"{ name }: the output directory was not found")
+                    continue
+                try:
+                    info = zipfile.ZipInfo.from_file(path, name)
+                    source = open(path, 'rb')
+                except OSError as e:
+                    missing.append(f"{ name }: { e.strerror }")
+                    continue
+                info.compress_type = zipfile.ZIP_DEFLATED
+                ## outputs can be over 2 GiB, or still growing while they are read
+                with source, bundle.open(info, 'w', force_zip64=True) as entry:
+                    while True:
+                        block = source.read(BLOCK_SIZE)
+                        if not block:
+                            break
+                        entry.write(block)
+                        yield from sink.drain()
+            if missing:
+                log.warning(f"{ len(missing) } raw outputs of the export could not be read")
+                bundle.writestr(new_entry('raw/missing.txt'), '\n'.join(missing) + '\n')
+    yield sink.take()
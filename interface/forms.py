@@ -7,9 +7,10 @@ from django.core.exceptions import ValidationError
 from django.utils.translation import ugettext_lazy as _
 
 from .models import userModel, campusData, campusInstantiation, interventions
-from .helper import get_or_none, validate_password
+from .helper import get_or_none, validate_password, validate_sweep_spec, expand_sweep_values, SWEEP_FIELDS
+from .schema import read_uploads, check_integrity
 
-import pandas as pd
+import json
 
 ## Registration form for new users
 class RegisterForm(forms.Form):
@@ -87,40 +88,16 @@ class addCampusDataForm(forms.ModelForm):
 
     def clean(self):
         cleaned_data = super(addCampusDataForm, self).clean()
-        ## TODO: Validate the Timtetable.csv with proper validation rules
         if self.cleaned_data.get('campus_name') is None:
             raise ValidationError({"campus_name": "The name of the instantiation should not be empty"})
 
-        try:
-            classes_csv = pd.read_csv(self.cleaned_data.get('classes_csv'))
-            common_areas_csv = pd.read_csv(self.cleaned_data.get('common_areas_csv'))
-            mess_csv = pd.read_csv(self.cleaned_data.get('mess_csv'))
-            staff_csv = pd.read_csv(self.cleaned_data.get('staff_csv'))
-            students_csv = pd.read_csv(self.cleaned_data.get('students_csv'))
-            campus_setup_csv = pd.read_csv(self.cleaned_data.get('campus_setup_csv'))
-
-            expected_classes_cols = ['class_id', 'dept', 'faculty_id', 'active_duration', 'days']
-            expected_common_areas_cols = ['type', 'number', 'average_time_spent', 'starting_id','active_duration']
-            expected_mess_cols = ['mess_id', 'active_duration', 'average_time_spent']
-            expected_staff_cols = ['staff_id', 'dept_associated', 'interaction_space', 'residence_block', 'adult_family_members', 'num_children']
-            expected_students_cols = ['id', 'age', 'hostel', 'mess', 'dept_id']
-            expected_campus_setup_cols = ['name','beta_hostel','beta_classroom','beta_residential_block']
-
-
-            if not set(expected_classes_cols).issubset(classes_csv.columns.tolist()):
-                raise ValidationError({"classes.csv": "One or more required columns names are missing in classes.csv. Please refer the sample file and re-upload"})
-            if not set(expected_common_areas_cols).issubset(common_areas_csv.columns.tolist()):
-                raise ValidationError({"common_areas_csv": "One or more required columns names are missing in common_areas.csv. Please refer the sample file and re-upload"})
-            if not set(expected_mess_cols).issubset(mess_csv.columns.tolist()):
-                raise ValidationError({"mess_csv": "One or more required columns names are missing in mess.csv. Please refer the sample file and re-upload"})
-            if not set(expected_staff_cols).issubset(staff_csv.columns.tolist()):
-                raise ValidationError({"staff_csv": "One or more required columns names are missing in staff.csv. Please refer the sample file and re-upload"})
-            if not set(expected_students_cols).issubset(students_csv.columns.tolist()):
-                raise ValidationError({"students_csv": "One or more required columns names are missing in students.csv. Please refer the sample file and re-upload"})
-            if not set(expected_campus_setup_cols).issubset(campus_setup_csv.columns.tolist()):
-                raise ValidationError({"campus_setup_csv": "One or more required columns names are missing in campus_setup.csv. Please refer the sample file and re-upload"})
-        except:
-            raise ValidationError(_("Ensure files uploaded are only in .csv format"))
+        ## every file is parsed once against its declared columns and types, then checked against the other files (see schema.py)
+        ## the parsed frames are kept in `self.frames' for the instantiation
+        self.frames, errors = read_uploads(self.cleaned_data)
+        if not errors:
+            errors = check_integrity(self.frames)
+        for field, message in errors.items():
+            self.add_error(field, message)
         return cleaned_data
 
 
@@ -236,3 +213,73 @@ class createSimulationForm(forms.Form):
                 choices=interventionChoices,
                 required=True,
             )
+
+
+## Form to specify a parameter sweep, i.e. a batch of simulations over lists/ ranges of parameters
+class createSweepForm(forms.Form):
+    sweep_name = forms.CharField(
+        label="Sweep name",
+        initial="campus Sweep",
+        max_length=25,
+        required=True,
+    )
+    mode = forms.ChoiceField(
+        label="Simulate every combination of the values (grid) or a random sample of them",
+        choices=(('grid', 'Grid'), ('random', 'Random sample')),
+        initial='grid',
+        required=True,
+    )
+    num_samples = forms.IntegerField(
+        label="Number of combinations to simulate when sampling randomly",
+        initial=10,
+        min_value=1,
+        max_value=500,
+        required=True,
+    )
+    random_seed = forms.IntegerField(
+        label="Seed for the random sample (optional)",
+        min_value=0,
+        required=False,
+    )
+    sweep_spec = forms.JSONField(
+        label="Parameters to vary",
+        initial={"init_infected_seed": [50, 100, 200], "beta_1": {"start": 0.1, "stop": 0.5, "num": 3}},
+        widget=forms.Textarea(attrs={'rows': 6}),
+        help_text=mark_safe("A JSON object with a list of values, or a range <code>{\"start\", \"stop\", \"num\"}</code> or <code>{\"start\", \"stop\", \"step\"}</code>, per parameter. "
+                            "Parameters are <code>beta_&lt;type&gt;</code> for the transmission coefficients of the selected campus and " + ', '.join(SWEEP_FIELDS.keys()) + ". "
+                            "Parameters that are not varied take their default values."),
+        required=True,
+    )
+    max_members = 500
+
+    def __init__(self, campus_queryset, intv_queryset, *args, **kwargs):
+        super(createSweepForm, self).__init__(*args, **kwargs)
+        self.campus_queryset = campus_queryset
+        self.intv_queryset = intv_queryset
+        self.fields['instantiatedCampus'] = forms.ModelChoiceField(
+                label = 'Select the campus instantiation to run the simulations',
+                queryset=campus_queryset,
+                required=True,
+            )
+        self.fields['intvName'] = forms.ModelChoiceField(
+                label = 'Select the intervention to simulate',
+                queryset=intv_queryset,
+                required=True,
+            )
+
+    def clean(self):
+        cleaned_data = super(createSweepForm, self).clean()
+        campus = cleaned_data.get('instantiatedCampus')
+        spec = cleaned_data.get('sweep_spec')
+        if campus is None or spec is None:
+            return cleaned_data
+
+        beta_types = {int(e['type']) for e in json.loads(campus.trans_coeff_file)}
+        validate_sweep_spec(spec, beta_types)
+
+        grid_size = 1
+        for value in spec.values():
+            grid_size *= len(expand_sweep_values(value))
+        if cleaned_data.get('mode') == 'grid' and grid_size > self.max_members:
+            raise ValidationError(_('The sweep expands to %(n)s simulations, at most %(max)s are allowed. Use fewer values or a random sample'), params={'n': grid_size, 'max': self.max_members})
+        return cleaned_data
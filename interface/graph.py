@@ -0,0 +1,125 @@
+"""
+graph.py: inspects the structure of an instantiated campus as a sparse agent x interaction space incidence matrix
+- individuals.json is read once per instantiation, the matrix (scipy CSR) is cached next to the artifacts in
+  `graph_<instantiation id>.npz' and every later summary is computed from the cache
+- occupancy of the spaces, spaces per agent and projected contacts are computed with sparse/ vectorized operations
+- agents list the ids of the spaces they visit in `interaction_spaces', spaces have an `id' and a `type'
+"""
+import itertools
+import json
+import os
+
+import numpy as np
+import scipy.sparse as sp
+
+from .artifacts import open_artifact
+from .stats import AGENT_SPACES_KEY, get_type_name
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+TOP_SPACES = 10
+
+def load_artifact(fieldfile):
+    with open_artifact(fieldfile) as f:
+        data = f.read()
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def get_cache_path(inst):
+    return f"{ os.path.dirname(inst.agent_json.path) }/graph_{ inst.id }.npz"
+
+## Builds the incidence matrix from the decoded artifacts, references to unknown spaces are counted and dropped
+## Returns (CSR matrix agents x spaces, space ids, space types, number of unknown references)
+def build_incidence(individuals, spaces):
+    if isinstance(spaces, dict):
+        spaces = [dict(space, id=space.get('id', key)) for key, space in spaces.items()]
+    space_ids = np.array([int(space['id']) for space in spaces], dtype=np.int64)
+    space_types = np.array([int(space.get('type', 0)) for space in spaces], dtype=np.int16)
+
+    counts = np.fromiter((len(agent.get(AGENT_SPACES_KEY) or ()) for agent in individuals), dtype=np.int64, count=len(individuals))
+    refs = np.fromiter(itertools.chain.from_iterable(agent.get(AGENT_SPACES_KEY) or () for agent in individuals), dtype=np.int64, count=int(counts.sum()))
+    agents = np.repeat(np.arange(len(individuals)), counts)
+
+    order = np.argsort(space_ids)
+    pos = np.minimum(np.searchsorted(space_ids[order], refs), max(len(space_ids) - 1, 0))
+    known = (space_ids[order][pos] == refs) if len(space_ids) else np.zeros(len(refs), dtype=bool)
+
+    matrix = sp.csr_matrix(
+        (np.ones(int(known.sum()), dtype=np.int8), (agents[known], order[pos[known]])),
+        shape=(len(individuals), len(space_ids))
+    )
+    ## an agent visiting a space twice is one membership
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix, space_ids, space_types, int((~known).sum())
+
+## Incidence matrix of an instantiation, built from its artifacts the first time and cached
+def load_incidence(inst):
+    path = get_cache_path(inst)
+    if os.path.exists(path):
+        with np.load(path) as cache:
+            matrix = sp.csr_matrix((cache['data'], cache['indices'], cache['indptr']), shape=tuple(cache['shape']))
+            return matrix, cache['space_ids'], cache['space_types'], int(cache['unknown'])
+
+    matrix, space_ids, space_types, unknown = build_incidence(load_artifact(inst.agent_json), load_artifact(inst.interaction_spaces_json))
+    tmp = f"{ path }.{ os.getpid() }.tmp.npz"
+    np.savez_compressed(tmp, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr, shape=np.array(matrix.shape),
+                        space_ids=space_ids, space_types=space_types, unknown=np.array(unknown))
+    os.replace(tmp, path)
+    return matrix, space_ids, space_types, unknown
+
+def describe(values):
+    if len(values) == 0:
+        return {'min': 0, 'median': 0, 'p90': 0, 'max': 0, 'mean': 0}
+    return {
+        'min': int(values.min()),
+        'median': float(np.median(values)),
+        'p90': float(np.percentile(values, 90)),
+        'max': int(values.max()),
+        'mean': float(values.mean()),
+    }
+
+## Structure of an instantiated campus:
+## - occupancy (agents per space) of each type of space and the largest spaces
+## - histogram of the number of spaces per agent
+## - projected contacts: pairs of agents sharing a space (per type), and per agent the number of agents it shares
+##   a space with, counted once per shared space (an upper bound on its distinct contacts)
+def summarize(inst):
+    matrix, space_ids, space_types, unknown = load_incidence(inst)
+    occupancy = np.asarray(matrix.sum(axis=0)).ravel().astype(np.int64)
+    degree = np.diff(matrix.indptr)
+    pairs = occupancy * (occupancy - 1) // 2
+    contacts = matrix @ np.maximum(occupancy - 1, 0)
+
+    types = []
+    for code in np.unique(space_types):
+        of_type = space_types == code
+        types.append({
+            'type': int(code),
+            'name': get_type_name(code),
+            'spaces': int(of_type.sum()),
+            'visits': int(occupancy[of_type].sum()),
+            'occupancy': describe(occupancy[of_type]),
+            'contact_pairs': int(pairs[of_type].sum()),
+        })
+
+    top = np.argsort(occupancy)[::-1][:TOP_SPACES]
+    counts, edges = np.histogram(contacts, bins=min(20, max(1, len(np.unique(contacts)))))
+    return {
+        'agents': matrix.shape[0],
+        'spaces': matrix.shape[1],
+        'memberships': int(matrix.nnz),
+        'unknown_space_references': unknown,
+        'types': types,
+        'largest_spaces': [{'id': int(space_ids[i]), 'type': get_type_name(space_types[i]), 'occupancy': int(occupancy[i])} for i in top],
+        'spaces_per_agent': {
+            'summary': describe(degree),
+            'histogram': np.bincount(degree).tolist() if len(degree) else [],
+        },
+        'projected_contacts': {
+            'summary': describe(contacts),
+            'histogram': {'counts': counts.tolist(), 'edges': edges.tolist()},
+        },
+    }
@@ -1,10 +1,13 @@
 """
 helper.py: contains utility functions used in the application
+- numpy and pandas are imported by the functions that use them, so that the web processes (which import this
+  module through the views) do not load them until a request needs them
 """
 import os
+import sys
 import datetime
-import numpy as np
-import pandas as pd
+import importlib.util
+import itertools
 
 from django.urls import reverse
 from django.core.exceptions import ValidationError
@@ -50,8 +53,10 @@ def get_activation_url(token, origin_name=None):
         return activation_url
 
 ### Function to ensure numpy.dtypes are converted to scalars
+## numpy is not imported here: a numpy scalar cannot exist unless numpy was already loaded
 def convert(o):
-    if isinstance(o, np.generic): return o.item()
+    np = sys.modules.get('numpy')
+    if np is not None and isinstance(o, np.generic): return o.item()
     raise TypeError
 
 ## Function to validate inputs to create simulation
@@ -89,6 +94,283 @@ def validateFormResponse(formData):
         return False
     return True
 
+## Simulation parameters (fields of `simulationParams') that can be varied in a parameter sweep
+## Transmission coefficients are varied with `beta_<type>' keys, <type> as in the campus `trans_coeff_file'
+SWEEP_FIELDS = {
+    'days_to_simulate': int,
+    'init_infected_seed': int,
+    'simulation_iterations': int,
+    'enable_testing': bool,
+    'testing_capacity': int,
+    'periodicity': int,
+    'betaScale': int,
+    'min_grp_size': int,
+    'max_grp_size': int,
+    'avg_associations': int,
+    'minimum_hostel_time': float,
+    'restart': int,
+    'restart_batch_size': int,
+    'restart_batch_frequency': int,
+    'vax': int,
+    'vaccination_frequency': int,
+    'vax_restart_delay': int,
+    'daily_vaccination_capacity': int,
+}
+
+## Function to expand the values of one swept parameter
+## - a list is used as is
+## - {"start", "stop", "num"} gives `num' evenly spaced values, both ends included
+## - {"start", "stop", "step"} gives values from `start' to `stop' (included) in steps of `step'
+def expand_sweep_values(value):
+    import numpy as np
+    if isinstance(value, list):
+        values = value
+    elif isinstance(value, dict) and 'num' in value:
+        values = np.linspace(float(value['start']), float(value['stop']), int(value['num'])).tolist()
+    elif isinstance(value, dict) and 'step' in value:
+        step = float(value['step'])
+        if step <= 0:
+            raise ValueError('step should be a positive number')
+        values = np.arange(float(value['start']), float(value['stop']) + step / 2, step).tolist()
+    else:
+        values = [value]
+    if len(values) == 0:
+        raise ValueError('at least one value is required')
+    return values
+
+## Function to validate a sweep specification against the swept fields and the campus's interaction space types
+def validate_sweep_spec(spec, beta_types):
+    if not isinstance(spec, dict) or len(spec) == 0:
+        raise ValidationError(_('The sweep should specify at least one parameter to vary'))
+    for key, value in spec.items():
+        if key.startswith('beta_'):
+            try:
+                valid = int(key.split('_', 1)[1]) in beta_types
+            except ValueError:
+                valid = False
+            if not valid:
+                raise ValidationError(_('%(key)s is not an interaction space type of the selected campus'), params={'key': key})
+            cast = float
+        elif key in SWEEP_FIELDS:
+            cast = SWEEP_FIELDS[key]
+        else:
+            raise ValidationError(_('%(key)s cannot be varied in a sweep'), params={'key': key})
+        try:
+            values = [cast(v) for v in expand_sweep_values(value)]
+        except (TypeError, ValueError, KeyError):
+            raise ValidationError(_('The values for %(key)s should be a list or a range with start, stop and num/ step'), params={'key': key})
+        if key.startswith('beta_') and not all(0 <= v <= 1 for v in values):
+            raise ValidationError(_('Transmission coefficients for %(key)s should be between 0 and 1'), params={'key': key})
+
+## Function to expand a sweep specification into the list of parameter combinations to simulate
+## - mode 'grid' returns the full cartesian product of the values
+## - mode 'random' returns `num_samples' distinct combinations drawn from the grid,
+##   the grid is not materialized so large sweeps can be sampled cheaply
+def expand_sweep(spec, mode='grid', num_samples=10, seed=None):
+    import numpy as np
+    keys = sorted(spec.keys())
+    values = [expand_sweep_values(spec[key]) for key in keys]
+    shape = tuple(len(v) for v in values)
+    total = int(np.prod(shape))
+
+    if mode == 'random' and num_samples < total:
+        rng = np.random.default_rng(seed)
+        flat = np.sort(rng.choice(total, size=num_samples, replace=False))
+        indexes = zip(*np.unravel_index(flat, shape))
+    else:
+        indexes = itertools.product(*[range(n) for n in shape])
+    return [{key: values[k][int(i)] for k, (key, i) in enumerate(zip(keys, index))} for index in indexes]
+
+## Function to check the constraints `validateFormResponse' puts on a single simulation's parameters
+def validate_simulation_params(params):
+    min_grp_size = int(params['min_grp_size'])
+    max_grp_size = int(params['max_grp_size'])
+    avg_associations = int(params['avg_associations'])
+    if int(params['days_to_simulate']) < 1 or int(params['simulation_iterations']) < 1:
+        return False
+    if (min_grp_size <= 0) or (max_grp_size <= 0) or (min_grp_size >= max_grp_size):
+        return False
+    if (avg_associations <= 0) or (avg_associations >= 20):
+        return False
+    if int(params['periodicity']) != 7:
+        return False
+    return True
+
+## Function to validate a batch of simulation specifications (REST API) with vectorized checks
+## - `campus_betas' maps the ids of the campus instantiations the user can simulate to their interaction space types
+## - `intervention_ids' are the ids of the interventions the user can simulate
+## Returns the specifications as a dataframe with defaults filled in and a {row: [errors]} mapping
+def validate_simulation_batch(specs, campus_betas, intervention_ids):
+    import numpy as np
+    import pandas as pd
+    df = pd.DataFrame.from_records(specs)
+    errors = {}
+
+    def flag(mask, message):
+        for i in np.flatnonzero(np.asarray(mask, dtype=bool)):
+            errors.setdefault(int(i), []).append(message)
+
+    for col in ['simulation_name', 'campus_instantiation', 'intervention']:
+        if col not in df.columns:
+            df[col] = None
+        flag(df[col].isna(), f"{ col } is required")
+    for col in df.columns:
+        if col not in SWEEP_FIELDS and col not in ('simulation_name', 'campus_instantiation', 'intervention') and not col.startswith('beta_'):
+            flag(df[col].notna(), f"{ col } is not a simulation parameter")
+
+    for field, cast in SWEEP_FIELDS.items():
+        default = simulationParams._meta.get_field(field).default
+        values = df[field] if field in df.columns else pd.Series(default, index=df.index)
+        values = pd.to_numeric(values.where(values.notna(), default).astype(object), errors='coerce')
+        flag(values.isna(), f"{ field } should be a number")
+        if cast is not float:
+            flag(values.notna() & ((values % 1 != 0) | (values < 0) | (values > 32767)), f"{ field } should be a positive integer")
+        df[field] = values
+
+    names = df['simulation_name'].astype(str)
+    flag(~names.str.len().between(2, 30), "simulation_name should be 2 to 30 characters long")
+    flag(df['days_to_simulate'] < 1, "days_to_simulate should be at least 1")
+    flag(df['simulation_iterations'] < 1, "simulation_iterations should be at least 1")
+    flag((df['min_grp_size'] <= 0) | (df['max_grp_size'] <= 0) | (df['min_grp_size'] >= df['max_grp_size']), "min_grp_size should be positive and less than max_grp_size")
+    flag((df['avg_associations'] <= 0) | (df['avg_associations'] >= 20), "avg_associations should be between 1 and 19")
+    flag(df['periodicity'] != 7, "periodicity should be 7")
+
+    campus = pd.to_numeric(df['campus_instantiation'], errors='coerce')
+    flag(df['campus_instantiation'].notna() & ~campus.isin(list(campus_betas.keys())), "campus_instantiation is not a completed campus instantiation of the user")
+    intv = pd.to_numeric(df['intervention'], errors='coerce')
+    flag(df['intervention'].notna() & ~intv.isin(list(intervention_ids)), "intervention is not an intervention of the user")
+
+    for col in [c for c in df.columns if c.startswith('beta_')]:
+        given = df[col].notna()
+        beta = pd.to_numeric(df[col], errors='coerce')
+        flag(given & ~beta.between(0, 1), f"{ col } should be a number between 0 and 1")
+        try:
+            beta_type = int(col.split('_', 1)[1])
+            known = campus.map(lambda c: beta_type in campus_betas.get(c, ()))
+        except ValueError:
+            known = pd.Series(False, index=df.index)
+        flag(given & ~known.astype(bool), f"{ col } is not an interaction space type of the campus instantiation")
+        df[col] = beta
+
+    df['campus_instantiation'] = campus
+    df['intervention'] = intv
+    return df, errors
+
+## Function to describe a queue estimate (see `scheduler.estimate') to users
+def describe_estimate(estimate):
+    if estimate is None:
+        return ''
+    return (f"Position in the queue: { estimate['position'] }, expected to start around { estimate['start'].strftime('%d %b %H:%M') }"
+            f" and finish around { estimate['finish'].strftime('%d %b %H:%M') }.")
+
+## Function to read the daily mean of one series of the aggregated results as floats, empty when the results do not
+## have it (results stored before the series was added)
+def get_mean_series(agg_results, mode, metric):
+    import numpy as np
+    try:
+        return np.asarray(agg_results[mode][metric]['mean'], dtype=float)
+    except (KeyError, TypeError, ValueError):
+        return np.array([], dtype=float)
+
+## Function to summarize the aggregated results of a simulation for the sweep results table
+## Values that cannot be computed (a missing series, or only NaN) are None
+def summarize_results(agg_results):
+    import numpy as np
+    daily = get_mean_series(agg_results, 'daily', 'infected')
+    if len(daily) == 0:
+        return {}
+
+    def last(metric):
+        values = get_mean_series(agg_results, 'cumulative', metric)
+        values = values[~np.isnan(values)]
+        return float(values[-1]) if len(values) else None
+
+    summary = {'peak_daily_infected': None, 'peak_day': None}
+    if not np.isnan(daily).all():
+        peak_day = int(np.nanargmax(daily))
+        time = agg_results.get('time') or []
+        summary = {'peak_daily_infected': float(daily[peak_day]), 'peak_day': time[peak_day] if peak_day < len(time) else None}
+    summary.update({
+        'total_infected': last('infected'),
+        'total_fatalities': last('fatalities'),
+        'total_positive_cases': last('positive_cases'),
+    })
+    return summary
+
+## series of the aggregated results (see `run_aggregate_sims') that can be requested together
+SERIES_MODES = ('daily', 'cumulative')
+SERIES_METRICS = ('infected', 'recovered', 'fatalities', 'positive_cases', 'people_tested')
+
+## Function to thin a series to at most `points' evenly spaced days, the first and last days are always kept
+def sample_indices(n, points=None):
+    import numpy as np
+    if points is None or n <= points:
+        return None
+    return np.unique(np.linspace(0, n - 1, max(points, 2)).round().astype(int))
+
+def take(values, indices):
+    if values is None or indices is None:
+        return values
+    return [values[i] for i in indices if i < len(values)]
+
+## Function to validate a request for series: simulation ids, metrics, the daily/ cumulative choice and an optional
+## point budget. Returns (ids, metrics, mode, points, errors)
+def validate_series_request(params, max_simulations=50):
+    errors = {}
+    try:
+        ids = list(dict.fromkeys(int(i) for i in params.get('ids', '').split(',') if i.strip()))
+    except ValueError:
+        ids = []
+        errors['ids'] = "Simulation ids should be integers separated by commas"
+    if not ids and 'ids' not in errors:
+        errors['ids'] = "At least one simulation id is required"
+    elif len(ids) > max_simulations:
+        errors['ids'] = f"At most { max_simulations } simulations can be compared at once"
+
+    metrics = list(dict.fromkeys(m.strip() for m in params.get('metrics', '').split(',') if m.strip()))
+    unknown = [m for m in metrics if m not in SERIES_METRICS]
+    if not metrics or unknown:
+        errors['metrics'] = f"Metrics should be one or more of { ', '.join(SERIES_METRICS) }"
+
+    mode = params.get('mode', 'daily')
+    if mode not in SERIES_MODES:
+        errors['mode'] = f"Mode should be one of { ', '.join(SERIES_MODES) }"
+
+    points = params.get('points')
+    if points in (None, ''):
+        points = None
+    else:
+        try:
+            points = int(points)
+            if points < 2:
+                raise ValueError
+        except ValueError:
+            errors['points'] = "The point budget should be an integer of at least 2"
+    return ids, metrics, mode, points, errors
+
+## file formats of the tables of an export (see export.py), parquet needs pyarrow
+EXPORT_FORMATS = ('csv', 'parquet')
+
+## Function to validate a request for an export: optional simulation ids (else every simulation selected by the
+## filters), the file format of the tables and whether the raw outputs of the iterations are included.
+## Returns (ids, file_format, raw, errors)
+def validate_export_request(params):
+    errors = {}
+    try:
+        ids = list(dict.fromkeys(int(i) for i in params.get('ids', '').split(',') if i.strip()))
+    except ValueError:
+        ids = []
+        errors['ids'] = "Simulation ids should be integers separated by commas"
+
+    file_format = params.get('as', 'csv')
+    if file_format not in EXPORT_FORMATS:
+        errors['as'] = f"The format should be one of { ', '.join(EXPORT_FORMATS) }"
+    elif file_format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        errors['as'] = "Parquet exports need pyarrow, which is not installed"
+
+    raw = str(params.get('raw', '')).lower() in ('1', 'true', 'yes')
+    return ids, file_format, raw, errors
+
 # Altering diff function
 # def my_diff():
 
@@ -96,6 +378,8 @@ def validateFormResponse(formData):
 
 ### Function to aggregate resutls from specified number of simulatoin iterations and serialize
 def run_aggregate_sims(simPK):
+    import numpy as np
+    import pandas as pd
     num_iterations = simulationParams.objects.get(id=simPK).simulation_iterations
     dirName = simulationParams.objects.get(id=simPK).output_directory
 
@@ -0,0 +1,136 @@
+"""
+live.py: day by day counts of the iterations that are running, read from the output files as the simulator writes them
+- the CSV files of an iteration are tailed: the byte offset read so far and the incomplete last line are kept for
+  every file, each read only parses the bytes appended since the previous one
+- the simulator writes STEPS_PER_DAY rows per day, the first row of every day is kept (as in `run_aggregate_sims')
+- `tasks.run_iteration' reads the files every settings.LIVE_SERIES_INTERVAL seconds while the simulator runs, stores
+  the curve on the iteration (`simulationIteration.live_series') every settings.LIVE_SERIES_DAYS new days and
+  publishes them (see progress.py)
+- a file that is rewritten is read again from the start, a file without the expected column or with a value that is
+  not a number stops its metric (logged), the other metrics go on
+- `summarize' gives the mean and standard deviation over the iterations, in the layout of the aggregated results
+"""
+import os
+import statistics
+
+import logging
+log = logging.getLogger('interface_log')
+
+## metric -> (output file, column), as read by `run_aggregate_sims'
+METRICS = {
+    'infected': ('num_affected.csv', 'num_affected'),
+    'recovered': ('num_recovered.csv', 'num_recovered'),
+    'fatalities': ('num_fatalities.csv', 'num_fatalities'),
+}
+STEPS_PER_DAY = 4
+
+## Values of one column of a CSV file that is being appended to
+class csvTail:
+    def __init__(self, path, column):
+        self.path = path
+        self.column = column
+        self.restarted = False
+        self.reset()
+
+    def reset(self):
+        self.offset, self.partial, self.index, self.error = 0, b'', None, None
+
+    ## Values of the complete lines appended since the last read, a file that was rewritten is read again from the start
+    ## (`restarted' is then set until the next read). Once the column is found missing or a value is not a number,
+    ## `error' says why and the file is not read any further, unless it is rewritten
+    def read(self):
+        self.restarted = False
+        try:
+            with open(self.path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < self.offset:
+                    self.reset()
+                    self.restarted = True
+                if self.error:
+                    return []
+                f.seek(self.offset)
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        self.offset += len(data)
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()
+
+        values = []
+        for line in lines:
+            cells = line.strip().split(b',')
+            if cells == [b'']:
+                continue
+            if self.index is None:
+                header = [c.strip().decode(errors='replace') for c in cells]
+                if self.column not in header:
+                    self.error = f"{ os.path.basename(self.path) } has no column { self.column }"
+                    break
+                self.index = header.index(self.column)
+                continue
+            try:
+                values.append(float(cells[self.index]))
+            except (IndexError, ValueError):
+                self.error = f"{ os.path.basename(self.path) } has a line without a number in the column { self.column }: { line.strip()[:80].decode(errors='replace') }"
+                break
+        return values
+
+## Cumulative counts per day of one iteration, from the files in its output directory
+class iterationWatcher:
+    def __init__(self, directory):
+        self.tails = {metric: csvTail(os.path.join(directory, name), column) for metric, (name, column) in METRICS.items()}
+        self.steps = {metric: 0 for metric in METRICS}
+        self.samples = {metric: [] for metric in METRICS}
+        self.days = 0
+        self.stored = 0 # days stored on the iteration, see `tasks.update_live_series'
+
+    ## Reads what was appended to the files, returns True when the curve has new days
+    ## The days are those every metric that is still read has reached, a rewritten file starts its metric over
+    def poll(self):
+        for metric, tail in self.tails.items():
+            failed = tail.error
+            values = tail.read()
+            if tail.restarted:
+                self.samples[metric], self.steps[metric] = [], 0
+            for value in values:
+                if self.steps[metric] % STEPS_PER_DAY == 0:
+                    self.samples[metric].append(value)
+                self.steps[metric] += 1
+            if tail.error and not failed:
+                log.warning(f"The live series of { metric } stopped at day { len(self.samples[metric]) }: { tail.error }")
+        days = min((len(values) for metric, values in self.samples.items() if not self.tails[metric].error), default=self.days)
+        grew, self.days = days > self.days, days
+        self.stored = min(self.stored, days)
+        return grew
+
+    ## Days every metric that is still read has reached, stored as `simulationIteration.live_series'
+    def curve(self):
+        return {'time': list(range(self.days)), 'cumulative': {metric: values[:self.days] for metric, values in self.samples.items()}}
+
+def get_daily(cumulative):
+    return cumulative[:1] + [b - a for a, b in zip(cumulative, cumulative[1:])]
+
+## Mean and standard deviation per day over the iterations that reached that day, None for days none reached
+def get_mean_std(series, days):
+    mean, std = [], []
+    for day in range(days):
+        values = [s[day] for s in series if day < len(s)]
+        mean.append(statistics.fmean(values) if values else None)
+        std.append(statistics.stdev(values) if len(values) > 1 else 0.0 if values else None)
+    return {'mean': mean, 'std': std}
+
+## Live results of a simulation from its iterations ({'iteration', 'status', 'live_series'}), laid out as the aggregated
+## results (`time', `daily' and `cumulative' mean/ std of every metric) with the number of days each iteration reached
+def summarize(iterations):
+    curves = [it['live_series'] for it in iterations if it['live_series']]
+    days = max((len(curve['time']) for curve in curves), default=0)
+    result = {
+        'time': list(range(days)),
+        'daily': {},
+        'cumulative': {},
+        'iterations': [{'iteration': it['iteration'], 'status': it['status'], 'days': len(it['live_series']['time']) if it['live_series'] else 0} for it in iterations],
+    }
+    for metric in METRICS:
+        cumulative = [curve['cumulative'].get(metric, []) for curve in curves]
+        result['cumulative'][metric] = get_mean_std(cumulative, days)
+        result['daily'][metric] = get_mean_std([get_daily(values) for values in cumulative], days)
+    return result
@@ -0,0 +1,52 @@
+"""
+backfill_instantiation_stats.py: records the statistics (see stats.py) of instantiations completed before they were
+captured at instantiation time, the artifacts are streamed record by record and never loaded whole
+- python manage.py backfill_instantiation_stats [--all]
+"""
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from interface.artifacts import ARTIFACT_FIELDS, iter_json, open_artifact
+from interface.models import campusInstantiation
+from interface.schema import CAMPUS_SCHEMA, read_campus_csv
+from interface.stats import count_artifacts, count_population, get_artifact_size, summarize_instantiation
+
+
+def read_population(campus):
+    files = {}
+    for name in ('students', 'class', 'staff'):
+        with getattr(campus, CAMPUS_SCHEMA[name][0]).open('rb') as f:
+            files[name] = read_campus_csv(name, f)
+    return count_population(files)
+
+
+class Command(BaseCommand):
+    help = 'Records the statistics of instantiations that do not have them, streaming their artifacts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Recompute the statistics of every complete instantiation')
+
+    def handle(self, *args, **options):
+        queryset = campusInstantiation.objects.filter(status='Complete').select_related('inst_name')
+        if not options['all']:
+            queryset = queryset.filter(stats__isnull=True)
+
+        done = failed = 0
+        for inst in queryset.iterator():
+            try:
+                with open_artifact(inst.agent_json) as individuals, open_artifact(inst.interaction_spaces_json) as spaces:
+                    counts = count_artifacts(iter_json(individuals), iter_json(spaces))
+                stats = summarize_instantiation(
+                    read_population(inst.inst_name),
+                    counts,
+                    {field: get_artifact_size(getattr(inst, field).path) for field in ARTIFACT_FIELDS}
+                )
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Instantiation { inst.id } ({ inst.inst_name }): { e }")
+                continue
+            campusInstantiation.objects.filter(id=inst.id).update(stats=stats, updated_on=timezone.now())
+            done += 1
+            self.stdout.write(f"Instantiation { inst.id } ({ inst.inst_name }): { stats['agents'] } agents, { stats['spaces'] } spaces")
+
+        self.stdout.write(self.style.SUCCESS(f"Recorded the statistics of { done } instantiations, { failed } failed"))
@@ -0,0 +1,78 @@
+"""
+benchmark_api_transfer.py: measures what the REST API sends for the aggregated results of a simulation
+(GET /api/sim/<id>/), as plain DRF JSON against the API as configured: orjson (`renderers.fastJSONRenderer'),
+gzip (`middleware.gzipMiddleware') and the 304 answered to a revalidation (`mixins.ConditionalRetrieveMixin')
+- the fixture (a user, a simulation and its results) is generated from a fixed seed in a transaction that is rolled
+  back at the end, nothing is left in the database
+- the requests go through the whole middleware stack with the test client, the latency does not include the network
+- reports the size of the bodies and the median/ p99 latency of every case
+- python manage.py benchmark_api_transfer [--days 1000] [--requests 50]
+"""
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from interface.helper import SERIES_METRICS, SERIES_MODES
+from interface.models import simulationParams, simulationResults, userModel
+from interface.views import simResultsViewSet
+
+
+def make_results(days, seed=0):
+    rng = np.random.default_rng(seed)
+    return dict({'time': list(range(days))}, **{mode: {
+        metric: {'mean': (rng.random(days) * 1000).tolist(), 'std': (rng.random(days) * 50).tolist()}
+        for metric in SERIES_METRICS} for mode in SERIES_MODES})
+
+def measure(client, path, count, **headers):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = client.get(path, **headers)
+        latencies.append(time.perf_counter() - start)
+    return response, np.array(latencies)
+
+
+class Command(BaseCommand):
+    help = 'Compares the size and latency of API responses: plain JSON, orjson, gzip and 304 revalidations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=1000, help='Days of every series of the results')
+        parser.add_argument('--requests', type=int, default=50, help='Requests of each case')
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options):
+        count = options['requests']
+        with transaction.atomic():
+            user = userModel.objects.create_user(f"benchmark_api_transfer_{ time.time_ns() }@localhost", None)
+            user.is_active = True
+            user.save(update_fields=['is_active'])
+            obj = simulationParams.objects.create(simulation_name='benchmark', status='Complete', created_by=user, completed_at=timezone.now())
+            simulationResults.objects.create(simulation_id=obj, agg_results=make_results(options['days']), status='A', created_by=user)
+            client = Client()
+            client.force_login(user)
+            path = f"/api/sim/{ obj.id }/"
+
+            ## the plain JSON renderer of DRF, as the API was before orjson
+            renderers = simResultsViewSet.renderer_classes
+            simResultsViewSet.renderer_classes = [JSONRenderer]
+            try:
+                cases = [('plain JSON 200', *measure(client, path, count))]
+            finally:
+                simResultsViewSet.renderer_classes = renderers
+            response, latencies = measure(client, path, count)
+            cases.append(('orjson 200', response, latencies))
+            cases.append(('orjson + gzip 200', *measure(client, path, count, HTTP_ACCEPT_ENCODING='gzip')))
+            cases.append(('revalidated 304', *measure(client, path, count, HTTP_IF_NONE_MATCH=response['ETag'])))
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"Fixture: { len(SERIES_MODES) } modes x { len(SERIES_METRICS) } metrics x { options['days'] } days, { count } requests per case")
+        baseline = len(cases[0][1].content)
+        for name, response, latencies in cases:
+            size = len(response.content)
+            self.stdout.write(f"{ name }: status { response.status_code }, { size / 1e3:.1f} kB ({ size / baseline:.1%} of plain JSON), "
+                              f"latency median { np.median(latencies) * 1000:.1f} ms, p99 { np.percentile(latencies, 99) * 1000:.1f} ms")
@@ -0,0 +1,90 @@
+"""
+benchmark_artifacts.py: measures how the instantiation artifacts are written, the former path (the whole document
+encoded by `json.dumps' into a StringIO, then saved through a django File) against the streaming writer of
+artifacts.py, plain (`write_json') and compressed as instantiations store them (`write_json_artifact')
+- the records are generated from a fixed seed with numpy types, as the campus parser returns them, and written to a
+  temporary directory that is removed afterwards
+- every path is timed on its own, then run again under tracemalloc for its peak memory (the records are allocated
+  before the tracing starts and are not counted)
+- python manage.py benchmark_artifacts [--records 200000]
+"""
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+
+from interface.artifacts import DEFAULT_CODEC, write_json, write_json_artifact
+from interface.helper import convert
+
+
+def make_records(count, seed=0):
+    rng = np.random.default_rng(seed)
+    ages = rng.integers(18, 65, count)
+    spaces = rng.integers(0, 500, (count, 4))
+    return [{
+        'id': np.int64(i),
+        'age': ages[i],
+        'lat': np.float64(rng.random() * 90),
+        'lon': np.float64(rng.random() * 180),
+        'interaction_spaces': {str(k): spaces[i, k] for k in range(4)},
+        'time_spent': [np.float64(v) for v in rng.random(4)],
+    } for i in range(count)]
+
+## The former path of `run_instantiate'
+def write_dumps(records, directory):
+    text = io.StringIO(json.dumps(records, default=convert))
+    return FileSystemStorage(location=directory).save('individuals.json', File(text))
+
+def write_stream(records, directory):
+    with open(os.path.join(directory, 'individuals.json'), 'wb') as f:
+        write_json(records, f)
+
+def write_compressed(records, directory):
+    write_json_artifact(os.path.join(directory, f"individuals.json{ DEFAULT_CODEC }"), records)
+
+def get_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+class Command(BaseCommand):
+    help = 'Compares the wall time and peak memory of writing instantiation artifacts with json.dumps and streamed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=200000, help='Number of generated records')
+
+    def handle(self, *args, **options):
+        records = make_records(options['records'])
+        paths = {
+            'json.dumps + StringIO': write_dumps,
+            'streamed (write_json)': write_stream,
+            f"streamed, compressed { DEFAULT_CODEC } (write_json_artifact)": write_compressed,
+        }
+
+        self.stdout.write(f"Fixture: { len(records) } records")
+        for name, write in paths.items():
+            directory = tempfile.mkdtemp(prefix='benchmark_artifacts_')
+            try:
+                start = time.perf_counter()
+                write(records, directory)
+                elapsed = time.perf_counter() - start
+                size = get_size(directory)
+
+                shutil.rmtree(directory)
+                os.mkdir(directory)
+                tracemalloc.start()
+                try:
+                    write(records, directory)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+            self.stdout.write(f"{ name }: { elapsed:.2f}s, peak memory { peak / 1e6:.1f} MB, { size / 1e6:.1f} MB on disk")
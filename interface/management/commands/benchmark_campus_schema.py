@@ -0,0 +1,88 @@
+"""
+benchmark_campus_schema.py: measures the memory of the parsed campus files, read with the default type inference of
+pandas (as they were before schema.py) against the declared types of `schema.CAMPUS_SCHEMA'
+- the campus files are generated from a fixed seed for every number of agents asked for (students, with a tenth as
+  many staff and a twentieth as many classes), in memory, nothing is written to disk or to the database
+- the timetable is read as a 24 column frame by default, and as a `sparseEnrollment' (and its dense float32 form
+  handed to `campus_parse') with the schema
+- reports the memory of every frame (`memory_usage(deep=True)') and the time to parse it
+- python manage.py benchmark_campus_schema [--agents 10000,100000]
+"""
+import io
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from interface.enrollment import TIMETABLE_COLUMNS
+from interface.schema import CAMPUS_SCHEMA, read_campus_csv, read_timetable
+
+
+def make_campus(agents, seed=0):
+    rng = np.random.default_rng(seed)
+    staff, classes, messes = max(agents // 10, 1), max(agents // 20, 1), 8
+    hostels = np.arange(20000, 20000 + max(agents // 500, 1))
+    frames = {
+        'students': pd.DataFrame({'id': np.arange(agents), 'age': rng.integers(17, 30, agents), 'hostel': rng.choice(hostels, agents),
+                                  'mess': rng.integers(0, messes, agents), 'dept_id': rng.integers(0, 30, agents)}),
+        'class': pd.DataFrame({'class_id': np.arange(1000, 1000 + classes), 'dept': rng.integers(0, 30, classes),
+                               'faculty_id': rng.integers(0, staff, classes), 'active_duration': rng.integers(1, 4, classes),
+                               'days': rng.choice(['1,3,5', '2,4', '1,2,3,4,5'], classes)}),
+        'staff': pd.DataFrame({'staff_id': np.arange(staff), 'dept_associated': rng.integers(0, 30, staff),
+                               'interaction_space': rng.integers(1000, 1000 + classes, staff), 'residence_block': rng.integers(0, 50, staff),
+                               'adult_family_members': rng.integers(0, 3, staff), 'num_children': rng.integers(0, 3, staff)}),
+        'mess': pd.DataFrame({'mess_id': np.arange(messes), 'active_duration': rng.integers(1, 4, messes), 'average_time_spent': rng.random(messes)}),
+        'common_areas': pd.DataFrame({'type': ['sports', 'library', 'cafeteria'], 'number': [4, 2, 6], 'average_time_spent': [1.5, 2.0, 0.5],
+                                      'starting_id': [50000, 50010, 50020], 'active_duration': [2, 3, 2]}),
+        'campus_setup': pd.DataFrame({'name': ['campus'], 'beta_hostel': [0.1], 'beta_classroom': [0.2], 'beta_residential_block': [0.05]}),
+    }
+    files = {name: df.to_csv(index=False).encode() for name, df in frames.items()}
+    files['timetable'] = '\n'.join(','.join(map(str, [i] + list(rng.integers(1000, 1000 + classes, rng.integers(3, 8)))))
+                                   for i in range(agents)).encode()
+    return files
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+def enrollment_bytes(enrollment):
+    return enrollment.students.nbytes + enrollment.indptr.nbytes + enrollment.classes.nbytes
+
+
+class Command(BaseCommand):
+    help = 'Compares the memory of the campus frames read with the default type inference and with the declared schema'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--agents', default='10000,100000', help='Numbers of agents (students) separated by commas')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(n) for n in options['agents'].split(',') if n.strip()]
+        except ValueError:
+            raise CommandError('--agents expects numbers separated by commas')
+
+        for agents in sizes:
+            files = make_campus(agents)
+            self.stdout.write(f"{ agents } agents:")
+            total_default, total_schema = 0, 0
+            for name in CAMPUS_SCHEMA:
+                default, default_time = timed(lambda: pd.read_csv(io.BytesIO(files[name])))
+                schema, schema_time = timed(lambda: read_campus_csv(name, io.BytesIO(files[name])))
+                default_bytes, schema_bytes = default.memory_usage(deep=True).sum(), schema.memory_usage(deep=True).sum()
+                total_default += default_bytes
+                total_schema += schema_bytes
+                self.stdout.write(f"  { name }: { default_bytes / 1e6:.2f} MB inferred ({ default_time * 1000:.0f} ms), "
+                                  f"{ schema_bytes / 1e6:.2f} MB with the schema ({ schema_time * 1000:.0f} ms)")
+
+            default, default_time = timed(lambda: pd.read_csv(io.BytesIO(files['timetable']), header=None, names=[str(i) for i in range(TIMETABLE_COLUMNS)]))
+            enrollment, schema_time = timed(lambda: read_timetable(io.BytesIO(files['timetable'])))
+            dense, dense_time = timed(enrollment.to_frame)
+            default_bytes, sparse_bytes, dense_bytes = default.memory_usage(deep=True).sum(), enrollment_bytes(enrollment), dense.memory_usage(deep=True).sum()
+            total_default += default_bytes
+            total_schema += sparse_bytes
+            self.stdout.write(f"  timetable: { default_bytes / 1e6:.2f} MB inferred ({ default_time * 1000:.0f} ms), "
+                              f"{ sparse_bytes / 1e6:.2f} MB sparse ({ schema_time * 1000:.0f} ms), "
+                              f"{ dense_bytes / 1e6:.2f} MB dense for campus_parse ({ dense_time * 1000:.0f} ms)")
+            self.stdout.write(f"  total: { total_default / 1e6:.2f} MB inferred, { total_schema / 1e6:.2f} MB with the schema")
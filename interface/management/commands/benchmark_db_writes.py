@@ -0,0 +1,82 @@
+"""
+benchmark_db_writes.py: measures concurrent writes to the database, as the web server and the celery workers make
+them, and counts the ones that failed with `database is locked'
+- every writer process runs short read-then-write transactions (as `counters.set_status' and `scheduler.dispatch' do)
+  on a scratch table that is dropped afterwards
+- python manage.py benchmark_db_writes [--writers 8] [--transactions 200]
+"""
+import multiprocessing
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections, transaction
+
+TABLE = 'benchmark_db_writes'
+ROWS = 16
+
+
+def run_writer(index, transactions, queue):
+    latencies, locked, failed = [], 0, 0
+    for i in range(transactions):
+        row = (index * transactions + i) % ROWS
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(f"SELECT n FROM { TABLE } WHERE id = %s", [row])
+                    n = cursor.fetchone()[0]
+                    cursor.execute(f"UPDATE { TABLE } SET n = %s WHERE id = %s", [n + 1, row])
+        except OperationalError as e:
+            if 'locked' in str(e):
+                locked += 1
+            else:
+                failed += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+    queue.put((latencies, locked, failed))
+
+
+class Command(BaseCommand):
+    help = 'Runs concurrent read-then-write transactions and reports their throughput, latency and lock errors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Number of concurrent writer processes')
+        parser.add_argument('--transactions', type=int, default=200, help='Transactions run by each writer')
+
+    def handle(self, *args, **options):
+        writers, transactions = options['writers'], options['transactions']
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS { TABLE }")
+            cursor.execute(f"CREATE TABLE { TABLE } (id integer PRIMARY KEY, n integer NOT NULL)")
+            for row in range(ROWS):
+                cursor.execute(f"INSERT INTO { TABLE } (id, n) VALUES (%s, 0)", [row])
+        ## the writers are forked, each opens its own connection
+        connections.close_all()
+
+        queue = multiprocessing.get_context('fork').Queue()
+        processes = [multiprocessing.get_context('fork').Process(target=run_writer, args=(i, transactions, queue)) for i in range(writers)]
+        start = time.perf_counter()
+        for p in processes:
+            p.start()
+        results = [queue.get() for _ in processes]
+        for p in processes:
+            p.join()
+        elapsed = time.perf_counter() - start
+
+        latencies = np.array([l for r in results for l in r[0]])
+        locked = sum(r[1] for r in results)
+        failed = sum(r[2] for r in results)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT SUM(n) FROM { TABLE }")
+            applied = cursor.fetchone()[0]
+            cursor.execute(f"DROP TABLE { TABLE }")
+
+        self.stdout.write(f"Database: { connection.vendor } ({ connection.settings_dict['ENGINE'] })")
+        self.stdout.write(f"Transactions: { len(latencies) } of { writers * transactions } committed in { elapsed:.2f}s ({ len(latencies) / elapsed:.0f}/s)")
+        if len(latencies):
+            self.stdout.write(f"Latency: median { np.median(latencies) * 1000:.1f} ms, p99 { np.percentile(latencies, 99) * 1000:.1f} ms, max { latencies.max() * 1000:.1f} ms")
+        self.stdout.write(f"Lost updates: { len(latencies) - applied }")
+        style = self.style.SUCCESS if locked == 0 and failed == 0 else self.style.ERROR
+        self.stdout.write(style(f"`database is locked' errors: { locked }, other errors: { failed }"))
@@ -0,0 +1,90 @@
+"""
+benchmark_series_transport.py: measures the encodings of the series of the comparison page (/api/simulations/series/)
+on a fixed fixture, JSON against float32 typed arrays (`renderers.float32SeriesRenderer')
+- the fixture is generated from a fixed seed, as many simulations, metrics and days as asked for, nothing is read
+  from or written to the database
+- reports the size of the bodies and the time to encode and decode them, decoding float32 only reads the JSON
+  header (the browser makes Float32Array views on the rest, see static/js/makePlots.js)
+- only the server side is measured: the time the browser takes to fetch, decode and plot the series is not, the
+  bodies written by --output <directory> (series.json, series.f32) are for timing the page against by hand
+- python manage.py benchmark_series_transport [--simulations 60] [--days 1000] [--repeat 5]
+"""
+import json
+import os
+import struct
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from interface.helper import SERIES_METRICS
+from interface.renderers import fastJSONRenderer, float32SeriesRenderer
+
+
+def make_fixture(simulations, days, seed=0):
+    rng = np.random.default_rng(seed)
+    time_ = list(range(days))
+    return {
+        'mode': 'daily',
+        'metrics': list(SERIES_METRICS),
+        'simulations': [{
+            'id': i + 1,
+            'name': f"simulation { i + 1 }",
+            'intv': f"intervention { i % 5 }",
+            'time': time_,
+            'series': {metric: {'mean': (rng.random(days) * 1000).tolist(), 'std': (rng.random(days) * 50).tolist()}
+                       for metric in SERIES_METRICS},
+        } for i in range(simulations)],
+        'missing': [],
+    }
+
+def decode_float32(body):
+    length = struct.unpack('<I', body[4:8])[0]
+    header = json.loads(body[8:8 + length])
+    data = np.frombuffer(body, dtype='<f4', offset=8 + length)
+    def unpack(node):
+        if isinstance(node, dict):
+            if '$f32' in node:
+                offset, size = node['$f32']
+                return data[offset:offset + size]
+            return {k: unpack(v) for k, v in node.items()}
+        if isinstance(node, list):
+            return [unpack(v) for v in node]
+        return node
+    return unpack(header)
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+class Command(BaseCommand):
+    help = 'Compares the size and the encoding/ decoding time of the result series in JSON and as float32 arrays'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--simulations', type=int, default=60, help='Number of simulations compared')
+        parser.add_argument('--days', type=int, default=1000, help='Days of every series')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of each measure, the best is reported')
+        parser.add_argument('--output', help='Directory the bodies are written to')
+
+    def handle(self, *args, **options):
+        data = make_fixture(options['simulations'], options['days'])
+        repeat = options['repeat']
+        encodings = {
+            'json': (fastJSONRenderer(), json.loads),
+            'f32': (float32SeriesRenderer(), decode_float32),
+        }
+
+        self.stdout.write(f"Fixture: { options['simulations'] } simulations x { len(SERIES_METRICS) } metrics x { options['days'] } days")
+        for name, (renderer, decode) in encodings.items():
+            body = renderer.render(data)
+            encode_time = best_time(lambda: renderer.render(data), repeat)
+            decode_time = best_time(lambda: decode(body), repeat)
+            self.stdout.write(f"{ name }: { len(body) / 1e6:.2f} MB, encoded in { encode_time * 1000:.1f} ms, decoded in { decode_time * 1000:.1f} ms")
+            if options['output']:
+                with open(os.path.join(options['output'], f"series.{ name }"), 'wb') as f:
+                    f.write(body)
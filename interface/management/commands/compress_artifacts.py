@@ -0,0 +1,47 @@
+"""
+compress_artifacts.py: compresses the instantiation artifacts stored before compression and removes the
+decompressed copies staged for the simulator once no simulation on the instantiation is queued or running
+- an instantiation is checked for queued or running iterations right before its copies are removed, and iterations
+  that start meanwhile keep them (they hold a lock on them, see `artifacts.release_staged')
+- python manage.py compress_artifacts [--keep-staged]
+"""
+from django.core.management.base import BaseCommand
+
+from interface.artifacts import ARTIFACT_FIELDS, compress_artifact, release_staged
+from interface.models import campusInstantiation, simulationIteration
+from interface.scheduler import ACTIVE, WAITING
+
+
+def format_bytes(n):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(n) < 1024 or unit == 'GB':
+            return f"{ n:.1f} { unit }"
+        n /= 1024
+
+
+class Command(BaseCommand):
+    help = 'Compresses the instantiation artifacts and removes idle decompressed copies, reports the storage saved'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-staged', action='store_true', help='Do not remove the decompressed copies of idle instantiations')
+
+    def handle(self, *args, **options):
+        before = after = freed = compressed = 0
+
+        for inst in campusInstantiation.objects.filter(status='Complete').iterator():
+            for field in ARTIFACT_FIELDS:
+                raw, stored = compress_artifact(inst, field)
+                if raw:
+                    compressed += 1
+                    before += raw
+                    after += stored
+                    self.stdout.write(f"{ getattr(inst, field).name }: { format_bytes(raw) } -> { format_bytes(stored) }")
+            if options['keep_staged']:
+                continue
+            if not simulationIteration.objects.filter(simulation__campus_instantiation=inst, status__in=WAITING + ACTIVE).exists():
+                freed += release_staged(inst)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Compressed { compressed } artifacts: { format_bytes(before) } -> { format_bytes(after) } "
+            f"({ format_bytes(before - after) } saved). Removed { format_bytes(freed) } of idle decompressed copies."
+        ))
@@ -0,0 +1,61 @@
+"""
+export_results.py: writes the export bundle of a set of simulations (see export.py) to a file, or to the standard
+output with `--output -', as GET /api/simulations/export/ streams it
+- the simulations are given by id, or selected by owner, campus instantiation, intervention, sweep or batch
+- python manage.py export_results [--ids 1,2] [--user <email>] [--campus 3] [--intervention 2] [--sweep 5]
+  [--batch <uuid>] [--as csv|parquet] [--raw] --output bundle.zip
+"""
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from interface.export import stream_bundle
+from interface.helper import validate_export_request
+from interface.models import simulationParams
+
+## option -> lookup on simulationParams
+FILTERS = {
+    'user': 'created_by__email',
+    'campus': 'campus_instantiation',
+    'intervention': 'intervention',
+    'sweep': 'sweep',
+    'batch': 'batch_id',
+}
+
+
+class Command(BaseCommand):
+    help = 'Writes the parameters, the aggregated results and optionally the raw outputs of simulations to a ZIP file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ids', default='', help='Simulation ids separated by commas')
+        parser.add_argument('--user', help='Email of the owner of the simulations')
+        parser.add_argument('--campus', type=int, help='Campus instantiation id')
+        parser.add_argument('--intervention', type=int, help='Intervention id')
+        parser.add_argument('--sweep', type=int, help='Sweep id')
+        parser.add_argument('--batch', help='Batch id (uuid) of simulations submitted together')
+        parser.add_argument('--as', dest='as', default='csv', help='Format of the tables: csv or parquet')
+        parser.add_argument('--raw', action='store_true', help='Include the output files of every iteration')
+        parser.add_argument('--output', required=True, help='Path of the ZIP file, - for the standard output')
+
+    def handle(self, *args, **options):
+        ids, file_format, raw, errors = validate_export_request({'ids': options['ids'], 'as': options['as'], 'raw': options['raw']})
+        if errors:
+            raise CommandError('; '.join(errors.values()))
+        queryset = simulationParams.objects.filter(**{lookup: options[option] for option, lookup in FILTERS.items() if options[option] is not None})
+        if ids:
+            queryset = queryset.filter(id__in=ids)
+        simulation_ids = list(queryset.order_by('id').values_list('id', flat=True))
+        if not simulation_ids:
+            raise CommandError('No simulation matches the options')
+
+        start, size = time.perf_counter(), 0
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for chunk in stream_bundle(simulation_ids, file_format, raw):
+                output.write(chunk)
+                size += len(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        self.stderr.write(f"Exported { len(simulation_ids) } simulations ({ size / 1e6:.1f} MB) in { time.perf_counter() - start:.1f}s")
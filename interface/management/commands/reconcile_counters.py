@@ -0,0 +1,25 @@
+"""
+reconcile_counters.py: recounts the dashboard counters (see counters.py) from the tables and repairs any drift,
+e.g. after objects were changed outside the application
+- python manage.py reconcile_counters [--dry-run]
+"""
+from django.core.management.base import BaseCommand
+
+from interface.counters import reconcile
+from interface.models import userModel
+
+
+class Command(BaseCommand):
+    help = 'Recounts the per-user dashboard counters and repairs the ones that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the counters that drifted')
+
+    def handle(self, *args, **options):
+        drift = reconcile(dry_run=options['dry_run'])
+        users = dict(userModel.objects.filter(id__in=list(drift)).values_list('id', 'email'))
+        for user_id, fields in sorted(drift.items()):
+            changes = ', '.join(f"{ field } { have } -> { actual }" for field, (have, actual) in sorted(fields.items()))
+            self.stdout.write(f"{ users.get(user_id, user_id) }: { changes }")
+        action = 'would be repaired' if options['dry_run'] else 'were repaired'
+        self.stdout.write(self.style.SUCCESS(f"The counters of { len(drift) } users { action }"))
@@ -0,0 +1,15 @@
+"""
+middleware.py: defines the middleware of the application
+- `gzipMiddleware' compresses responses as django's GZipMiddleware does, except the bodies that are compressed
+  already (the export bundles, see export.py): gzip gains nothing on them and costs CPU on every streamed chunk
+"""
+from django.middleware.gzip import GZipMiddleware
+
+## Content types of bodies that are compressed already
+COMPRESSED_TYPES = ('application/zip', 'application/gzip', 'application/zstd')
+
+class gzipMiddleware(GZipMiddleware):
+    def process_response(self, request, response):
+        if response.get('Content-Type', '').split(';')[0].strip() in COMPRESSED_TYPES:
+            return response
+        return super().process_response(request, response)
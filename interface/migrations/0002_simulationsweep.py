@@ -0,0 +1,82 @@
+# Generated by Django 3.2.25 on 2026-10-19 23:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import interface.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interface', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campusdata',
+            name='campus_setup_csv',
+            field=models.FileField(null=True, upload_to=interface.models.set_upload_path),
+        ),
+        migrations.AddField(
+            model_name='simulationparams',
+            name='daily_vaccination_capacity',
+            field=models.PositiveSmallIntegerField(default=200, null=True),
+        ),
+        migrations.AddField(
+            model_name='simulationparams',
+            name='restart',
+            field=models.PositiveSmallIntegerField(default=0, null=True),
+        ),
+        migrations.AddField(
+            model_name='simulationparams',
+            name='restart_batch_frequency',
+            field=models.PositiveSmallIntegerField(default=30, null=True),
+        ),
+        migrations.AddField(
+            model_name='simulationparams',
+            name='restart_batch_size',
+            field=models.PositiveSmallIntegerField(default=1000, null=True),
+        ),
+        migrations.AddField(
+            model_name='simulationparams',
+            name='trans_coeff_file',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='simulationparams',
+            name='vaccination_frequency',
+            field=models.PositiveSmallIntegerField(default=7, null=True),
+        ),
+        migrations.AddField(
+            model_name='simulationparams',
+            name='vax',
+            field=models.PositiveSmallIntegerField(default=0, null=True),
+        ),
+        migrations.AddField(
+            model_name='simulationparams',
+            name='vax_restart_delay',
+            field=models.PositiveSmallIntegerField(default=1, null=True),
+        ),
+        migrations.CreateModel(
+            name='simulationSweep',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sweep_name', models.CharField(max_length=30, null=True)),
+                ('sweep_spec', models.JSONField(null=True)),
+                ('mode', models.CharField(choices=[('grid', 'Grid'), ('random', 'Random sample')], default='grid', max_length=10)),
+                ('num_samples', models.PositiveSmallIntegerField(default=10, null=True)),
+                ('random_seed', models.PositiveIntegerField(blank=True, null=True)),
+                ('output_directory', models.CharField(max_length=500, null=True)),
+                ('created_on', models.DateTimeField(auto_now_add=True, null=True)),
+                ('campus_instantiation', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='interface.campusinstantiation')),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('intervention', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='interface.interventions')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='simulationparams',
+            name='sweep',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='members', to='interface.simulationsweep'),
+        ),
+    ]
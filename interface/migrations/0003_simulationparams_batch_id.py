@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 23:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interface', '0002_simulationsweep'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulationparams',
+            name='batch_id',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.25 on 2026-10-19 23:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interface', '0003_simulationparams_batch_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulationparams',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Interactive'), (1, 'Batch')], default=0),
+        ),
+        migrations.CreateModel(
+            name='simulationIteration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('iteration', models.PositiveSmallIntegerField(default=0)),
+                ('input_directory', models.CharField(max_length=500, null=True)),
+                ('output_directory', models.CharField(max_length=500, null=True)),
+                ('priority', models.PositiveSmallIntegerField(choices=[(0, 'Interactive'), (1, 'Batch')], default=0)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Dispatched', 'Dispatched'), ('Running', 'Running'), ('Complete', 'Complete'), ('Error', 'Error')], default='Pending', max_length=10)),
+                ('cpu_seconds', models.FloatField(blank=True, null=True)),
+                ('created_on', models.DateTimeField(auto_now_add=True, null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('simulation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='iterations', to='interface.simulationparams')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='simulationiteration',
+            index=models.Index(fields=['status', 'priority', 'id'], name='interface_s_status_2bea22_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='simulationiteration',
+            index=models.Index(fields=['created_by', 'status'], name='interface_s_created_2d3edd_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 23:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interface', '0004_simulationiteration'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='simulationiteration',
+            name='status',
+            field=models.CharField(choices=[('Deferred', 'Deferred'), ('Pending', 'Pending'), ('Dispatched', 'Dispatched'), ('Running', 'Running'), ('Complete', 'Complete'), ('Error', 'Error')], default='Pending', max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 23:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interface', '0005_simulationiteration_deferred'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campusinstantiation',
+            name='peak_memory',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
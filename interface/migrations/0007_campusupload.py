@@ -0,0 +1,32 @@
+# Generated by Django 3.2.25 on 2026-10-19 23:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import interface.models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interface', '0006_campusinstantiation_peak_memory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='campusUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('campus_name', models.CharField(max_length=20)),
+                ('field', models.CharField(max_length=20)),
+                ('file', models.FileField(upload_to=interface.models.set_upload_path)),
+                ('size', models.BigIntegerField()),
+                ('offset', models.BigIntegerField(default=0)),
+                ('status', models.CharField(choices=[('Uploading', 'Uploading'), ('Complete', 'Complete'), ('Invalid', 'Invalid')], default='Uploading', max_length=10)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
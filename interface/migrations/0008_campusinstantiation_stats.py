@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 23:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interface', '0007_campusupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campusinstantiation',
+            name='stats',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
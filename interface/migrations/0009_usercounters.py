@@ -0,0 +1,48 @@
+# Generated by Django 3.2.25 on 2026-10-19 23:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+## counts the objects that already exist, as `counters.count' does
+def count_existing(apps, schema_editor):
+    userCounters = apps.get_model('interface', 'userCounters')
+    fields = [f.name for f in userCounters._meta.get_fields() if f.name not in ('user', 'updated_on')]
+    counts = {}
+    for name, prefix in (('interventions', None), ('campusInstantiation', 'campuses'), ('simulationParams', 'jobs')):
+        keys = ['created_by'] + (['status'] if prefix else [])
+        for row in apps.get_model('interface', name).objects.values(*keys).annotate(n=models.Count('pk')).order_by():
+            field = f"{ prefix }_{ (row['status'] or '').lower() }" if prefix else 'interventions'
+            if row['created_by'] is not None and field in fields:
+                counts.setdefault(row['created_by'], {})
+                counts[row['created_by']][field] = counts[row['created_by']].get(field, 0) + row['n']
+    userCounters.objects.bulk_create([userCounters(user_id=user_id, **values) for user_id, values in counts.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interface', '0008_campusinstantiation_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='userCounters',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to='interface.usermodel')),
+                ('interventions', models.IntegerField(default=0)),
+                ('campuses_created', models.IntegerField(default=0)),
+                ('campuses_running', models.IntegerField(default=0)),
+                ('campuses_complete', models.IntegerField(default=0)),
+                ('campuses_error', models.IntegerField(default=0)),
+                ('jobs_created', models.IntegerField(default=0)),
+                ('jobs_queued', models.IntegerField(default=0)),
+                ('jobs_deferred', models.IntegerField(default=0)),
+                ('jobs_running', models.IntegerField(default=0)),
+                ('jobs_complete', models.IntegerField(default=0)),
+                ('jobs_error', models.IntegerField(default=0)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(count_existing, migrations.RunPython.noop),
+    ]
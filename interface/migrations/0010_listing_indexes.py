@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-19 23:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interface', '0009_usercounters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='campusinstantiation',
+            index=models.Index(fields=['created_by', 'status'], name='interface_c_created_ac88fe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='campusinstantiation',
+            index=models.Index(fields=['created_by', '-id'], name='interface_c_created_a124a0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='interventions',
+            index=models.Index(fields=['created_by', '-id'], name='interface_i_created_c16b6f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='simulationparams',
+            index=models.Index(fields=['created_by', 'status'], name='interface_s_created_749659_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='simulationparams',
+            index=models.Index(fields=['created_by', '-id'], name='interface_s_created_acf015_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='simulationresults',
+            index=models.Index(fields=['created_by', 'status'], name='interface_s_created_d9acae_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-19 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interface', '0010_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='simulationresults',
+            name='interface_s_created_d9acae_idx',
+        ),
+        migrations.AddIndex(
+            model_name='simulationresults',
+            index=models.Index(fields=['created_by', 'status', '-simulation_id'], name='interface_s_created_cc4b1a_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-20 00:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interface', '0011_results_listing_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulationiteration',
+            name='live_series',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
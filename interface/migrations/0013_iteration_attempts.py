@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-20 00:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interface', '0012_iteration_live_series'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulationiteration',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='simulationiteration',
+            name='dispatched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
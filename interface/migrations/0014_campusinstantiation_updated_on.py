@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-20 00:49
+
+from django.db import migrations, models
+
+
+## instantiations written before the field existed were last written when they completed (`created_on')
+def set_updated_on(apps, schema_editor):
+    apps.get_model('interface', 'campusInstantiation').objects.update(updated_on=models.F('created_on'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interface', '0013_iteration_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campusinstantiation',
+            name='updated_on',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.RunPython(set_updated_on, migrations.RunPython.noop),
+    ]
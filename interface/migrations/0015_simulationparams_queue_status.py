@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-20 00:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interface', '0014_campusinstantiation_updated_on'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='simulationparams',
+            name='status',
+            field=models.CharField(choices=[('Created', 'Created'), ('Deferred', 'Deferred'), ('Queued', 'Queued'), ('Running', 'Running'), ('Complete', 'Complete'), ('Error', 'Error')], default='Created', max_length=10, null=True),
+        ),
+    ]
@@ -3,9 +3,18 @@ mixins.py: defines classes that share methods to inheriting classes in the appli
 - Eg: 'AnonymousRequired' mixin ensures that the class (specified in views.py) that inherits
 this mixin is available only when the user is un-authenticated.
 """
+import datetime
+import hashlib
+
 from django.urls import reverse
 from django.shortcuts import redirect
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date, quote_etag
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
 
 class AddSnippetsToContext:
     def get_context_data(self, **kwargs):
@@ -25,3 +34,105 @@ class AnonymousRequired:
         if self.request.user.is_authenticated:
             return redirect(reverse('profile'))
         return super().dispatch(*args, **kwargs)
+
+
+## Adds ETag/ Last-Modified validators to the `retrieve' action of a viewset
+## - `last_modified_field' names the datetime field that changes when the object is re-written
+## - `get_version' can be overridden to add fields that change without touching that datetime
+## A matching If-None-Match/ If-Modified-Since returns a 304 without serializing the object
+class ConditionalRetrieveMixin:
+    last_modified_field = None
+
+    def get_version(self, instance):
+        return ''
+
+    def get_validators(self, instance):
+        modified = getattr(instance, self.last_modified_field, None) if self.last_modified_field else None
+        ## the ETag keeps the full precision of the datetime, Last-Modified only has whole seconds
+        ## the representation also depends on the fields asked for and on its encoding (JSON, float32 series)
+        version = (f"{ instance.pk }:{ modified.isoformat() if modified else None }:{ self.get_version(instance) }:"
+                   f"{ self.request.query_params.get('fields', '') }:{ getattr(self.request, 'accepted_media_type', '') }")
+        etag = quote_etag(hashlib.md5(version.encode('utf-8')).hexdigest())
+        return etag, int(modified.timestamp()) if modified else None
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag, last_modified = self.get_validators(instance)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = Response(self.get_serializer(instance).data)
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True) #clients always revalidate
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+
+## Scopes an API viewset to the objects of the requesting user, staff see every user's objects and can pick one
+## with `?owner=<id or email>'
+## - `filter_params' maps query parameters to lookups (`?campus=3' -> `campus_instantiation=3'), `date_field' is
+##   filtered with `?<date_param>_after=' and `?<date_param>_before=' (ISO dates or datetimes)
+## - `heavy_fields' are only loaded and serialized in lists when asked for with `?fields=', the detail view returns
+##   every field unless `?fields=' is given
+class ScopedListMixin:
+    owner_field = 'created_by'
+    filter_params = {}
+    date_field = None
+    date_param = 'created'
+    heavy_fields = ()
+
+    def get_requested_fields(self):
+        fields = self.request.query_params.get('fields')
+        if fields:
+            return [f.strip() for f in fields.split(',') if f.strip()]
+        if self.action == 'list':
+            return [f for f in self.get_serializer_class().Meta.fields if f not in self.heavy_fields]
+        return None
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.get_requested_fields()
+        return context
+
+    ## ISO date or datetime, a date given as `_before' includes that whole day
+    def parse_date_param(self, name):
+        value = self.request.query_params[name]
+        try:
+            parsed = parse_datetime(value)
+            if parsed is None:
+                parsed = datetime.datetime.combine(parse_date(value), datetime.time.min)
+                if name.endswith('_before'):
+                    parsed += datetime.timedelta(days=1)
+        except (TypeError, ValueError):
+            raise ValidationError({name: f"{ value } is not an ISO date or datetime"})
+        return parsed
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        params = self.request.query_params
+        if not user.is_staff:
+            queryset = queryset.filter(**{self.owner_field: user})
+        elif params.get('owner'):
+            owner = params['owner']
+            queryset = queryset.filter(**{self.owner_field if owner.isdigit() else f"{ self.owner_field }__email": owner})
+
+        lookups = {lookup: params[param] for param, lookup in self.filter_params.items() if params.get(param)}
+        if self.date_field:
+            if params.get(f"{ self.date_param }_after"):
+                lookups[f"{ self.date_field }__gte"] = self.parse_date_param(f"{ self.date_param }_after")
+            if params.get(f"{ self.date_param }_before"):
+                lookups[f"{ self.date_field }__lt"] = self.parse_date_param(f"{ self.date_param }_before")
+        try:
+            queryset = queryset.filter(**lookups)
+        except (ValueError, DjangoValidationError) as e:
+            raise ValidationError({'detail': f"Invalid filter: { e }"})
+
+        ## heavy columns that are not serialized are not read either
+        fields = self.get_requested_fields()
+        if fields is not None:
+            skipped = [f for f in self.heavy_fields if f not in fields]
+            if skipped:
+                queryset = queryset.defer(*skipped)
+        return queryset
@@ -2,8 +2,11 @@
 models.py: provides the defintions for the database tables used in the application
 """
 import datetime
+import json
+import uuid
 
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 
 from .managers import UserManager
@@ -57,6 +60,11 @@ class interventions(models.Model):
     created_on = models.DateTimeField(auto_now_add=True, null=True)
     updated_at = models.DateTimeField(auto_now_add=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_by', '-id']),
+        ]
+
     @classmethod
     def get_count_by(self, user):
         if not user.is_staff:
@@ -67,16 +75,16 @@ class interventions(models.Model):
     @classmethod
     def get_topk_latest(self, user, k=5):
         if not user.is_staff:
-            return self.objects.filter(created_by=user).reverse()[:k]
+            return self.objects.filter(created_by=user).defer('intv_json').order_by('-id')[:k]
         else:
-            return self.objects.reverse()[:k]
+            return self.objects.defer('intv_json').order_by('-id')[:k]
 
     @classmethod
     def get_all(self, user):
         if not user.is_staff:
-            return self.objects.filter(created_by=user).all()
+            return self.objects.filter(created_by=user).defer('intv_json').order_by('id')
         else:
-            return self.objects.all()
+            return self.objects.defer('intv_json').order_by('id')
 
     def __str__(self):
         return self.intv_name
@@ -96,6 +104,19 @@ class testingParams(models.Model):
         else:
             return self.objects.count()
 
+    @classmethod
+    def get_default(self):
+        try:
+            return self.objects.get(testing_protocol_name='default')
+        except self.DoesNotExist:
+            obj = self(
+                testing_protocol_name='default',
+                testing_protocol_file=json.load(open('./media/testing_protocol_001.json', 'r')),
+                created_on=timezone.now()
+            )
+            obj.save()
+            return obj
+
     def __str__(self):
         return self.testing_protocol_name
 
@@ -119,21 +140,44 @@ class campusData(models.Model):
     @classmethod
     def get_all(self, user):
         if not user.is_staff:
-            return self.objects.filter(created_by=user).all()
+            return self.objects.filter(created_by=user).order_by('id')
         else:
-            return self.objects.all()
+            return self.objects.order_by('id')
 
     @classmethod
     def get_topk_latest(self, user, k=5):
         if not user.is_staff:
-            return self.objects.filter(created_by=user).reverse()[:k]
+            return self.objects.filter(created_by=user).order_by('-id')[:k]
         else:
-            return self.objects.reverse()[:k]
+            return self.objects.order_by('-id')[:k]
 
     def __str__(self):
         return self.campus_name
 
 
+## A chunked, resumable upload of one of the files of a campus (see uploads.py)
+## The file is assembled in place at the path `set_upload_path' gives it, `offset' is the number of bytes received so far
+class campusUpload(models.Model):
+    STATUS_CHOICE = (
+            ('Uploading', 'Uploading'),
+            ('Complete', 'Complete'),
+            ('Invalid', 'Invalid'),
+        )
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    campus_name = models.CharField(max_length=20)
+    field = models.CharField(max_length=20) # the campusData file field the upload is for
+    file = models.FileField(upload_to=set_upload_path)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICE, default='Uploading')
+    error = models.TextField(null=True, blank=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+    created_by = models.ForeignKey(userModel, on_delete=models.CASCADE)
+
+    def __str__(self):
+        return f"{ self.campus_name }: { self.field }"
+
+
 ## definition for storing the instantiation campus's file paths
 def set_instantiation_filePath(instance, filename):
     if filename != '':
@@ -153,9 +197,19 @@ class campusInstantiation(models.Model):
     interaction_spaces_json = models.FileField(upload_to=set_instantiation_filePath, null=True)
     trans_coeff_file = models.JSONField(null=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICE, default='Created', null=True)
+    peak_memory = models.BigIntegerField(null=True, blank=True) # bytes, peak resident memory of the instantiation process
+    stats = models.JSONField(null=True, blank=True) # population, agents and spaces by type, artifact sizes and timings (see stats.py)
     created_on = models.DateTimeField(auto_now_add=True, null=True, blank=True)
+    updated_on = models.DateTimeField(auto_now=True, null=True, blank=True) # also set by the updates of querysets that change what the API shows
     created_by = models.ForeignKey(userModel, null=True, on_delete=models.CASCADE)
 
+    ## listings and counts by owner (`get_all', `get_topk_latest', `get_latest', `get_count_by_status')
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_by', 'status']),
+            models.Index(fields=['created_by', '-id']),
+        ]
+
     @property
     def get_inst_path(self):
         if self.agent_json:
@@ -171,12 +225,17 @@ class campusInstantiation(models.Model):
             status = campusInstantiation.STATUS_CHOICE['Error'][1]
         return status
 
+    ## Instantiations to list: the campus name (`__str__') is joined in, the coefficients are not loaded
+    @classmethod
+    def get_listing(self):
+        return self.objects.select_related('inst_name').defer('trans_coeff_file')
+
     @classmethod
     def get_topk_latest(self, user, k=5):
         if not user.is_staff:
-            return self.objects.filter(created_by=user).reverse()[:k]
+            return self.get_listing().filter(created_by=user).order_by('-id')[:k]
         else:
-            return self.objects.reverse()[:k]
+            return self.get_listing().order_by('-id')[:k]
 
     @classmethod
     def get_count_by(self, user):
@@ -195,9 +254,9 @@ class campusInstantiation(models.Model):
     @classmethod
     def get_all(self, user):
         if not user.is_staff:
-            return self.objects.filter(created_by=user).all()
+            return self.get_listing().filter(created_by=user).order_by('id')
         else:
-            return self.objects.all()
+            return self.get_listing().order_by('id')
 
     @classmethod
     def get_latest(self, user):
@@ -209,14 +268,71 @@ class campusInstantiation(models.Model):
     def __str__(self):
         return self.inst_name.campus_name
 
+## definition for storing a parameter sweep, i.e. a batch of simulations expanded from
+## lists/ ranges of simulation parameters and transmission coefficients (see `helper.expand_sweep')
+class simulationSweep(models.Model):
+    MODE_CHOICE = (
+            ('grid', 'Grid'),
+            ('random', 'Random sample'),
+        )
+    sweep_name = models.CharField(max_length=30, null=True)
+    campus_instantiation = models.ForeignKey(campusInstantiation, null=True, on_delete=models.SET_NULL)
+    intervention = models.ForeignKey(interventions, null=True, on_delete=models.SET_NULL)
+    sweep_spec = models.JSONField(null=True)
+    mode = models.CharField(max_length=10, choices=MODE_CHOICE, default='grid')
+    num_samples = models.PositiveSmallIntegerField(default=10, null=True)
+    random_seed = models.PositiveIntegerField(null=True, blank=True)
+    output_directory = models.CharField(max_length=500, null=True)
+    created_on = models.DateTimeField(auto_now_add=True, null=True)
+    created_by = models.ForeignKey(userModel, null=True, on_delete=models.CASCADE)
+
+    @property
+    def get_progress(self):
+        counts = dict(self.members.values_list('status').annotate(n=models.Count('id')))
+        total = sum(counts.values())
+        done = counts.get('Complete', 0) + counts.get('Error', 0)
+        return {
+            'total': total,
+            'queued': counts.get('Queued', 0) + counts.get('Deferred', 0) + counts.get('Created', 0),
+            'running': counts.get('Running', 0),
+            'complete': counts.get('Complete', 0),
+            'error': counts.get('Error', 0),
+            'percent': int(100 * done / total) if total else 0,
+        }
+
+    @classmethod
+    def get_topk_latest(self, user, k=5):
+        if not user.is_staff:
+            return self.objects.filter(created_by=user).order_by('-id')[:k]
+        else:
+            return self.objects.order_by('-id')[:k]
+
+    @classmethod
+    def get_all(self, user):
+        if not user.is_staff:
+            return self.objects.filter(created_by=user).order_by('id')
+        else:
+            return self.objects.order_by('id')
+
+    def __str__(self):
+        return self.sweep_name
+
 ## defintion for storing the simulation parameters
 class simulationParams(models.Model):
     STATUS_CHOICE = (
             ('Created', 'Created'),
+            ('Deferred', 'Deferred'),
+            ('Queued', 'Queued'),
             ('Running', 'Running'),
             ('Complete', 'Complete'),
             ('Error', 'Error'),
         )
+    INTERACTIVE = 0
+    BATCH = 1
+    PRIORITY_CHOICE = (
+            (INTERACTIVE, 'Interactive'),
+            (BATCH, 'Batch'),
+        )
     simulation_name = models.CharField(max_length=30, null=True)
     days_to_simulate = models.PositiveSmallIntegerField(default=100, null=True)
     init_infected_seed = models.PositiveSmallIntegerField(default=200, null=True)
@@ -240,12 +356,23 @@ class simulationParams(models.Model):
     vaccination_frequency = models.PositiveSmallIntegerField(default=7, null=True)
     vax_restart_delay = models.PositiveSmallIntegerField(default=1, null=True)
     daily_vaccination_capacity = models.PositiveSmallIntegerField(default=200, null=True)
+    trans_coeff_file = models.JSONField(null=True, blank=True) #set when the simulation overrides the campus coefficients
+    sweep = models.ForeignKey(simulationSweep, null=True, blank=True, related_name='members', on_delete=models.CASCADE)
+    batch_id = models.UUIDField(null=True, blank=True, db_index=True) #set for simulations submitted together through the REST API
+    priority = models.PositiveSmallIntegerField(choices=PRIORITY_CHOICE, default=INTERACTIVE)
     status = models.CharField(max_length=10, choices=STATUS_CHOICE, default='Created', null=True)
     created_on = models.DateTimeField(auto_now_add=True, null=True)
     updated_on = models.DateTimeField(auto_now_add=True, null=True)
     completed_at = models.DateTimeField(auto_now_add=True, null=True)
     created_by = models.ForeignKey(userModel, null=True, on_delete=models.CASCADE)
 
+    ## listings and counts by owner (`get_all', `get_topk_latest', `get_latest', `get_count_by_status')
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_by', 'status']),
+            models.Index(fields=['created_by', '-id']),
+        ]
+
     @property
     def get_status(self):
         try:
@@ -257,9 +384,9 @@ class simulationParams(models.Model):
     @classmethod
     def get_topk_latest(self, user, k=5):
         if not user.is_staff:
-            return self.objects.filter(created_by=user).reverse()[:k]
+            return self.objects.filter(created_by=user).defer('trans_coeff_file').order_by('-id')[:k]
         else:
-            return self.objects.reverse()[:k]
+            return self.objects.defer('trans_coeff_file').order_by('-id')[:k]
 
     @classmethod
     def get_count_by(self, user):
@@ -273,14 +400,14 @@ class simulationParams(models.Model):
         if not user.is_staff:
             return self.objects.filter(created_by=user, status=status).count()
         else:
-            return self.objects.count()
+            return self.objects.filter(status=status).count()
 
     @classmethod
     def get_all(self, user):
         if not user.is_staff:
-            return self.objects.filter(created_by=user).all()
+            return self.objects.filter(created_by=user).defer('trans_coeff_file').order_by('id')
         else:
-            return self.objects.all()
+            return self.objects.defer('trans_coeff_file').order_by('id')
 
     @classmethod
     def get_latest(self, user):
@@ -292,6 +419,41 @@ class simulationParams(models.Model):
     def __str__(self):
         return self.simulation_name
 
+## definition for a unit of simulation work, i.e. one iteration of a simulation
+## iterations are queued by `scheduler.submit' and dispatched to simQueue by `scheduler.dispatch'
+class simulationIteration(models.Model):
+    STATUS_CHOICE = (
+            ('Deferred', 'Deferred'),
+            ('Pending', 'Pending'),
+            ('Dispatched', 'Dispatched'),
+            ('Running', 'Running'),
+            ('Complete', 'Complete'),
+            ('Error', 'Error'),
+        )
+    simulation = models.ForeignKey(simulationParams, related_name='iterations', on_delete=models.CASCADE)
+    iteration = models.PositiveSmallIntegerField(default=0)
+    input_directory = models.CharField(max_length=500, null=True)
+    output_directory = models.CharField(max_length=500, null=True)
+    priority = models.PositiveSmallIntegerField(choices=simulationParams.PRIORITY_CHOICE, default=simulationParams.INTERACTIVE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICE, default='Pending')
+    cpu_seconds = models.FloatField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0) # times the iteration was handed to a worker, see scheduler.py
+    live_series = models.JSONField(null=True, blank=True) # day by day counts read while the iteration runs, see live.py
+    created_on = models.DateTimeField(auto_now_add=True, null=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    created_by = models.ForeignKey(userModel, null=True, on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'priority', 'id']),
+            models.Index(fields=['created_by', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{ self.simulation.simulation_name } ({ self.iteration })"
+
 ## definiton for storing the aggregated results for a simulation
 class simulationResults(models.Model):
     simulation_id = models.OneToOneField(simulationParams, primary_key=True, on_delete=models.CASCADE)
@@ -300,5 +462,40 @@ class simulationResults(models.Model):
     completed_at = models.DateTimeField(auto_now_add=True, null=True)
     created_by = models.ForeignKey(userModel, null=True, on_delete=models.CASCADE)
 
+    ## the comparison page and the series API list a user's available results, newest first (the primary key
+    ## is not the rowid, so the order has to be in the index for a page to be read without sorting)
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_by', 'status', '-simulation_id']),
+        ]
+
     def __str__(self):
         return self.simulation_id.simulation_name
+
+## definition for the per-user counters shown on the profile page, maintained by counters.py as objects are
+## created, deleted and change status, and repaired by `python manage.py reconcile_counters'
+class userCounters(models.Model):
+    user = models.OneToOneField(userModel, primary_key=True, related_name='counters', on_delete=models.CASCADE)
+    interventions = models.IntegerField(default=0)
+    campuses_created = models.IntegerField(default=0)
+    campuses_running = models.IntegerField(default=0)
+    campuses_complete = models.IntegerField(default=0)
+    campuses_error = models.IntegerField(default=0)
+    jobs_created = models.IntegerField(default=0)
+    jobs_queued = models.IntegerField(default=0)
+    jobs_deferred = models.IntegerField(default=0)
+    jobs_running = models.IntegerField(default=0)
+    jobs_complete = models.IntegerField(default=0)
+    jobs_error = models.IntegerField(default=0)
+    updated_on = models.DateTimeField(auto_now=True)
+
+    @property
+    def campuses(self):
+        return self.campuses_created + self.campuses_running + self.campuses_complete + self.campuses_error
+
+    @property
+    def jobs(self):
+        return self.jobs_created + self.jobs_queued + self.jobs_deferred + self.jobs_running + self.jobs_complete + self.jobs_error
+
+    def __str__(self):
+        return f"{ self.user }"
@@ -0,0 +1,13 @@
+"""
+pagination.py: defines the pagination used by the list end-points of the REST API
+- cursor pagination over the primary key: a page is read with an indexed range scan whatever its position,
+  there is no COUNT of the table and no OFFSET to skip, so list latency does not grow with the table
+"""
+from rest_framework.pagination import CursorPagination
+
+## Newest first, `?page_size=' between 1 and `max_page_size'
+class idCursorPagination(CursorPagination):
+    ordering = '-pk'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
@@ -0,0 +1,126 @@
+"""
+progress.py: publishes job status transitions and iteration progress to the web processes, which push them to the
+browsers of the owners of the jobs (see events.py)
+- events are published once the transaction that made the change commits, by `counters.set_status' for every
+  status transition and by `tasks.run_iteration' as iterations start and finish
+- the pub/sub backend is chosen by settings.PROGRESS_PUBSUB['BACKEND']:
+  'amqp' publishes on a fanout exchange of the celery broker, every web process consumes it with its own
+  exclusive queue so that every process sees every event
+  'local' delivers the events within the process that published them (development server with eager tasks, tests)
+- publishing never fails a task, an event that cannot be published is logged and dropped, the pages show the
+  current state again when they are loaded
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+import logging
+log = logging.getLogger('interface_log')
+
+## events waiting for a slow browser, past this the oldest are dropped (the page catches up when reloaded)
+MAX_PENDING = 1000
+
+## Connected streams of the process, events are handed over to their event loop from any thread
+class progressHub:
+    def __init__(self):
+        self.listeners = defaultdict(set)
+        self.loop = None
+        self.lock = threading.Lock()
+        self.listening = False
+
+    ## Stream of the events of `user_id' (of every user when it is None), to be called from the event loop
+    def subscribe(self, user_id):
+        self.loop = asyncio.get_running_loop()
+        with self.lock:
+            if not self.listening:
+                get_backend().listen(self)
+                self.listening = True
+        queue = asyncio.Queue(maxsize=MAX_PENDING)
+        self.listeners[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        self.listeners[user_id].discard(queue)
+        if not self.listeners[user_id]:
+            del self.listeners[user_id]
+
+    def deliver(self, event):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.dispatch, event)
+
+    def dispatch(self, event):
+        for key in (event.get('user'), None):
+            for queue in self.listeners.get(key, ()):
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(event)
+
+hub = progressHub()
+
+## Delivers the events to the streams of this process only
+class localBackend:
+    def __init__(self, conf):
+        pass
+
+    def publish(self, event):
+        hub.deliver(event)
+
+    def listen(self, hub):
+        pass
+
+## Publishes the events on a fanout exchange of the celery broker, each listening process binds its own queue
+class amqpBackend:
+    def __init__(self, conf):
+        from kombu import Exchange
+        self.exchange = Exchange(conf['EXCHANGE'], type='fanout', durable=False, delivery_mode='transient')
+
+    def publish(self, event):
+        from config.celery import app
+        with app.producer_pool.acquire(block=True) as producer:
+            producer.publish(event, exchange=self.exchange, routing_key='', serializer='json', declare=[self.exchange],
+                             retry=True, retry_policy={'max_retries': 1})
+
+    ## The consumer runs in a daemon thread and reconnects by itself when the broker goes away
+    def listen(self, hub):
+        from kombu import Queue
+        from kombu.mixins import ConsumerMixin
+        from config.celery import app
+        exchange = self.exchange
+
+        class progressConsumer(ConsumerMixin):
+            def __init__(self, connection):
+                self.connection = connection
+
+            def get_consumers(self, Consumer, channel):
+                queue = Queue('', exchange=exchange, exclusive=True, auto_delete=True, durable=False)
+                return [Consumer(queues=[queue], callbacks=[self.on_message], accept=['json'], no_ack=True)]
+
+            def on_message(self, body, message):
+                hub.deliver(body)
+
+        consumer = progressConsumer(app.connection_for_read())
+        threading.Thread(target=consumer.run, name='progress-consumer', daemon=True).start()
+
+BACKENDS = {'local': localBackend, 'amqp': amqpBackend}
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = BACKENDS[settings.PROGRESS_PUBSUB['BACKEND']](settings.PROGRESS_PUBSUB)
+    return _backend
+
+## Publishes {'user', 'kind', ...} once the current transaction commits (immediately outside of one)
+## `kind' is 'jobs' or 'campuses' for status transitions (as the counter prefixes of counters.py), 'iteration',
+## 'series' (new days of the live counts, see live.py) or 'results' (aggregated)
+def publish(user_id, kind, **data):
+    event = dict(data, user=user_id, kind=kind)
+    def send():
+        try:
+            get_backend().publish(event)
+        except Exception as e:
+            log.warning(f"Progress event { kind } for user { user_id } was not published: { e }")
+    transaction.on_commit(send)
@@ -0,0 +1,72 @@
+"""
+renderers.py: defines the renderers used by the REST API end-points
+- `orjson' is used when it is installed, else the default DRF JSON renderer is used
+- the series of results can also be rendered as float32 typed arrays (`float32SeriesRenderer')
+"""
+import json
+import math
+import struct
+import sys
+from array import array
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+## Renders API responses with orjson, numpy arrays and scalars in the aggregated results
+## are serialized natively instead of going through a python-level default hook
+class fastJSONRenderer(JSONRenderer):
+    options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        try:
+            return orjson.dumps(data, option=self.options)
+        except TypeError:
+            ## objects orjson does not know about (lazy strings, decimals) use the DRF encoder
+            return super().render(data, accepted_media_type, renderer_context)
+
+## Renders the series of results (the `time', `mean' and `std' lists, as in the aggregated results) as float32
+## typed arrays, for plotting many simulations in the browser without parsing JSON numbers (static/js/makePlots.js)
+## - the body is MAGIC, the length of a JSON header (uint32), the header, padding to 4 bytes and the float32 data
+##   (little endian), every series is replaced in the header by {"$f32": [offset, length]} (in floats, from the
+##   start of the data), missing values are NaN
+## - requested with `?format=f32' or `Accept: application/x-float32-series'
+class float32SeriesRenderer(BaseRenderer):
+    media_type = 'application/x-float32-series'
+    format = 'f32'
+    charset = None
+    render_style = 'binary'
+    MAGIC = b'F32S'
+    array_keys = ('time', 'mean', 'std')
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        arrays, size = [], 0
+
+        def pack(node, key=None):
+            nonlocal size
+            if isinstance(node, dict):
+                return {k: pack(v, k) for k, v in node.items()}
+            if isinstance(node, list):
+                if key in self.array_keys:
+                    values = array('f', [math.nan if v is None else v for v in node])
+                    arrays.append(values)
+                    size += len(values)
+                    return {'$f32': [size - len(values), len(values)]}
+                return [pack(v) for v in node]
+            return node
+
+        header = json.dumps(pack(data), separators=(',', ':')).encode()
+        header += b' ' * (-(len(self.MAGIC) + 4 + len(header)) % 4)
+        body = [self.MAGIC, struct.pack('<I', len(header)), header]
+        for values in arrays:
+            if sys.byteorder == 'big':
+                values.byteswap()
+            body.append(values.tobytes())
+        return b''.join(body)
@@ -0,0 +1,243 @@
+"""
+scheduler.py: decides which simulation iterations run next on simQueue
+- simulations are split into iterations (`simulationIteration') when they are submitted
+- only as many iterations as there are slots (settings.SIM_SCHEDULER['SLOTS']) are handed to the workers,
+  the rest wait in the database so the order they run in can be decided when a slot frees up
+- interactive simulations run before batch simulations (sweeps, REST API batches)
+- within a priority, the user with the least recently consumed CPU time goes first (fair share)
+  and a user cannot hold more than settings.SIM_SCHEDULER['USER_MAX_RUNNING'] slots
+- admission control: batch simulations are deferred when the backlog of queued iterations is past
+  settings.SIM_SCHEDULER['DEFER_BACKLOG'] and rejected past settings.SIM_SCHEDULER['REJECT_BACKLOG'],
+  interactive simulations are always admitted
+- iterations lost with their worker (dispatched but never started, or still 'Running' past the run timeout) are
+  dispatched again, up to settings.SIM_SCHEDULER['MAX_ATTEMPTS'] times, and failed after that. Every dispatch is a new
+  attempt, a worker only runs and records the attempt it was handed (see `start_iteration')
+"""
+import datetime
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from . import counters
+from .models import simulationIteration, simulationParams
+
+import logging
+log = logging.getLogger('interface_log')
+
+ACTIVE = ('Dispatched', 'Running')
+WAITING = ('Deferred', 'Pending')
+
+## Raised when the backlog is too large to accept more batch simulations
+class AdmissionError(Exception):
+    pass
+
+## Number of iterations that are queued or running
+def get_backlog():
+    return simulationIteration.objects.filter(status__in=WAITING + ACTIVE).count()
+
+## Decides if `iterations' more iterations of the given priority are admitted now ('Pending'),
+## admitted to run once the backlog drains ('Deferred'), or rejected (AdmissionError)
+def check_admission(iterations, priority=simulationParams.INTERACTIVE):
+    conf = settings.SIM_SCHEDULER
+    if priority == simulationParams.INTERACTIVE:
+        return 'Pending'
+    backlog = get_backlog()
+    if backlog + iterations > conf['REJECT_BACKLOG']:
+        raise AdmissionError(f"The simulation queue is full ({ backlog } iterations are waiting), please submit again later")
+    if backlog + iterations > conf['DEFER_BACKLOG'] or simulationIteration.objects.filter(status='Deferred').exists():
+        return 'Deferred'
+    return 'Pending'
+
+## Queues the iterations of the given simulations, `simulations' is a list of (simulationParams, input directory)
+## Batch simulations past the deferral threshold are held back as 'Deferred' until the backlog drains
+## `admission' is the decision of `check_admission' when the caller took it with the simulations it created,
+## the simulations are then queued as admitted, whatever the backlog has become
+def submit(simulations, priority=simulationParams.INTERACTIVE, admission=None):
+    now = timezone.now()
+    status = admission or check_admission(sum(obj.simulation_iterations for obj, _ in simulations), priority)
+    items = []
+    for obj, dirName in simulations:
+        obj.output_directory = f"{ dirName }/{ obj.simulation_name.replace(' ', '_') }_{ obj.intervention.intv_name }"
+        obj.priority = priority
+        obj.status = 'Queued' if status == 'Pending' else 'Deferred'
+        items += [simulationIteration(
+            simulation=obj,
+            iteration=i,
+            input_directory=dirName,
+            output_directory=f"{ obj.output_directory }_id_{ i }",
+            priority=priority,
+            status=status,
+            created_by_id=obj.created_by_id,
+            created_on=now
+        ) for i in range(obj.simulation_iterations)]
+
+    with transaction.atomic():
+        simulationParams.objects.bulk_update([obj for obj, _ in simulations], ['output_directory', 'priority'])
+        ## the status goes through the counters (see counters.py)
+        counters.set_status(simulationParams.objects.filter(id__in=[obj.id for obj, _ in simulations]), 'Queued' if status == 'Pending' else 'Deferred')
+        simulationIteration.objects.bulk_create(items)
+    log.info(f"{ len(items) } iterations of { len(simulations) } simulations were queued with priority { priority } ({ status })")
+    return dispatch()
+
+## CPU time consumed by each user in the recent past, older usage decays with the configured half-life
+## Iterations that are still running are counted with the time they have been running for
+def get_recent_usage():
+    conf = settings.SIM_SCHEDULER
+    now = timezone.now()
+    since = now - datetime.timedelta(seconds=conf['USAGE_WINDOW'])
+    usage = defaultdict(float)
+
+    completed = simulationIteration.objects.filter(completed_at__gte=since, cpu_seconds__isnull=False)
+    for user, cpu, completed_at in completed.values_list('created_by', 'cpu_seconds', 'completed_at').iterator():
+        age = (now - completed_at).total_seconds()
+        usage[user] += cpu * 0.5 ** (age / conf['USAGE_HALF_LIFE'])
+    for user, started_at in simulationIteration.objects.filter(status='Running', started_at__isnull=False).values_list('created_by', 'started_at'):
+        usage[user] += (now - started_at).total_seconds()
+    return usage
+
+## Estimated CPU time of one iteration, used to charge a user for the iterations dispatched in the same round
+def get_iteration_cost():
+    recent = simulationIteration.objects.filter(cpu_seconds__isnull=False).order_by('-completed_at').values_list('cpu_seconds', flat=True)[:100]
+    recent = list(recent)
+    return sum(recent) / len(recent) if recent else 60.0
+
+## Moves deferred iterations (oldest simulations first) to pending while the backlog is under the deferral threshold
+def release_deferred():
+    room = settings.SIM_SCHEDULER['DEFER_BACKLOG'] - simulationIteration.objects.filter(status__in=('Pending',) + ACTIVE).count()
+    if room <= 0:
+        return 0
+    ids = list(simulationIteration.objects.filter(status='Deferred').order_by('id').values_list('id', flat=True)[:room])
+    released = simulationIteration.objects.filter(id__in=ids, status='Deferred').update(status='Pending')
+    if released:
+        counters.set_status(simulationParams.objects.filter(iterations__id__in=ids, status='Deferred'), 'Queued')
+    return released
+
+## Takes back the iterations whose worker was lost: dispatched more than LOST_AFTER ago and not started (the task
+## message was lost), or running for longer than RUN_TIMEOUT + LOST_AFTER (the worker stops the simulator at RUN_TIMEOUT)
+## They are made pending again, or failed once they were dispatched MAX_ATTEMPTS times. Returns the failed iterations
+def recover_lost():
+    conf = settings.SIM_SCHEDULER
+    now = timezone.now()
+    lost_after = datetime.timedelta(seconds=conf['LOST_AFTER'])
+    lost = simulationIteration.objects.filter(
+        Q(status='Dispatched', dispatched_at__lt=now - lost_after) |
+        Q(status='Running', started_at__lt=now - lost_after - datetime.timedelta(seconds=conf['RUN_TIMEOUT'])))
+    failed = []
+    for pk, status, attempts in lost.values_list('id', 'status', 'attempts'):
+        if attempts < conf['MAX_ATTEMPTS']:
+            fields = {'status': 'Pending', 'dispatched_at': None, 'started_at': None, 'live_series': None}
+            message = f"Iteration { pk } was lost while { status }, it will be dispatched again"
+        else:
+            fields = {'status': 'Error', 'completed_at': now}
+            message = f"Iteration { pk } was lost while { status } and failed after { attempts } attempts"
+        ## a worker that starts or ends the iteration meanwhile wins
+        if not simulationIteration.objects.filter(id=pk, status=status, attempts=attempts).update(**fields):
+            continue
+        log.warning(message)
+        if fields['status'] == 'Error':
+            failed.append(pk)
+    return failed
+
+## Marks attempt `attempt' of an iteration as running, returns the attempt the worker is to run or None when the
+## iteration is no longer its to run (it was dispatched again, it ended or another worker runs it)
+## A task redelivered because its worker died takes over the iteration left 'Running' as a new attempt, so that the
+## end of the lost run is not recorded, until MAX_ATTEMPTS (then `recover_lost' fails it)
+def start_iteration(item_id, attempt, redelivered=False):
+    now = timezone.now()
+    iterations = simulationIteration.objects.filter(id=item_id, attempts=attempt)
+    if iterations.filter(status='Dispatched').update(status='Running', started_at=now):
+        return attempt
+    if redelivered and iterations.filter(status='Running', attempts__lt=settings.SIM_SCHEDULER['MAX_ATTEMPTS']).update(
+            attempts=F('attempts') + 1, started_at=now, live_series=None):
+        return attempt + 1
+    return None
+
+## Estimated position in the queue and start/ finish times of `n' waiting iterations of the given priority,
+## the first of which is the iteration with id `first'
+## The position counts the iterations that run first: higher priorities, then older ones of the same priority
+def estimate_from(priority, first, n):
+    conf = settings.SIM_SCHEDULER
+    cost = get_iteration_cost()
+    waiting = simulationIteration.objects.filter(status__in=WAITING)
+    running = simulationIteration.objects.filter(status__in=ACTIVE).count()
+    ahead = waiting.filter(priority__lt=priority).count() + waiting.filter(priority=priority, id__lt=first).count()
+    start = timezone.now() + datetime.timedelta(seconds=cost * math.floor((ahead + running) / conf['SLOTS']))
+    return {
+        'position': ahead + 1,
+        'start': start,
+        'finish': start + datetime.timedelta(seconds=cost * math.ceil(n / min(conf['SLOTS'], conf['USER_MAX_RUNNING']))),
+    }
+
+## Estimates (see `estimate_from') for each of the given simulations that has waiting iterations
+def estimate(simulation_ids):
+    waiting = (simulationIteration.objects.filter(status__in=WAITING, simulation_id__in=simulation_ids)
+               .values('simulation_id', 'priority').annotate(first=Min('id'), n=Count('id')).order_by())
+    return {w['simulation_id']: estimate_from(w['priority'], w['first'], w['n']) for w in waiting}
+
+## Estimate for a group of simulations submitted together (sweeps, REST API batches) as a whole
+def estimate_group(simulation_ids):
+    waiting = (simulationIteration.objects.filter(status__in=WAITING, simulation_id__in=simulation_ids)
+               .aggregate(priority=Min('priority'), first=Min('id'), n=Count('id')))
+    if not waiting['n']:
+        return None
+    return estimate_from(waiting['priority'], waiting['first'], waiting['n'])
+
+## Hands pending iterations to simQueue until all the slots are used
+## Safe to call at any time: on submission, after an iteration ends and periodically from celery beat, which
+## takes back the slots of lost iterations
+def dispatch():
+    from .tasks import close_simulation, run_iteration
+
+    conf = settings.SIM_SCHEDULER
+    with transaction.atomic():
+        for obj in simulationParams.objects.filter(iterations__id__in=recover_lost()).distinct():
+            close_simulation(obj)
+        release_deferred()
+        active = list(simulationIteration.objects.select_for_update().filter(status__in=ACTIVE).values_list('created_by', flat=True))
+        free = conf['SLOTS'] - len(active)
+        if free <= 0:
+            return []
+
+        running = defaultdict(int)
+        for user in active:
+            running[user] += 1
+        waiting = dict(simulationIteration.objects.filter(status='Pending').values_list('created_by').annotate(p=Min('priority')).order_by())
+        usage = get_recent_usage()
+        cost = get_iteration_cost()
+
+        picked = []
+        while free > 0:
+            users = [u for u in waiting if running[u] < conf['USER_MAX_RUNNING']]
+            if not users:
+                break
+            user = min(users, key=lambda u: (waiting[u], usage[u]))
+            item = (simulationIteration.objects.filter(status='Pending', created_by=user)
+                    .exclude(id__in=picked).order_by('priority', 'id').values_list('id', 'priority').first())
+            if item is None:
+                del waiting[user]
+                continue
+            picked.append(item[0])
+            running[user] += 1
+            usage[user] += cost
+            free -= 1
+            ## the user's next pending iteration may be of a lower priority
+            nxt = (simulationIteration.objects.filter(status='Pending', created_by=user)
+                   .exclude(id__in=picked).aggregate(p=Min('priority'))['p'])
+            if nxt is None:
+                del waiting[user]
+            else:
+                waiting[user] = nxt
+
+        ## an iteration picked by a concurrent dispatch is skipped, the workers' concurrency is the hard limit on slots
+        dispatched = [pk for pk in picked if simulationIteration.objects.filter(id=pk, status='Pending').update(
+            status='Dispatched', dispatched_at=timezone.now(), attempts=F('attempts') + 1)]
+        attempts = dict(simulationIteration.objects.filter(id__in=dispatched).values_list('id', 'attempts'))
+        transaction.on_commit(lambda: [run_iteration.apply_async(queue='simQueue', kwargs={'item_id': pk, 'attempt': attempts[pk]}) for pk in dispatched])
+
+    if dispatched:
+        log.info(f"Dispatched { len(dispatched) } simulation iterations to simQueue")
+    return dispatched
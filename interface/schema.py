@@ -0,0 +1,284 @@
+"""
+schema.py: declares the columns and types of the campus input files
+- ids are read as int32, small counts and department ids as int16, names of types as categories
+- required columns cannot have missing values, a `SchemaError' names the file and column that failed
+- the timetable has no header: a student id followed by its class ids, it is kept as a `sparseEnrollment'
+  and only made dense (NaN padded float32) for `campus_parse'
+- the uploads are parsed once: cross-file references are checked on the parsed frames, which are then
+  cached for the instantiation task, as plain arrays (.npz, read back without unpickling anything) in a private
+  directory (settings.CAMPUS_CACHE_ROOT) outside of the media tree, removed with the campus
+- numpy and pandas (and enrollment.py) are imported by the functions that parse or check files, the web processes
+  only load them when a campus is uploaded
+"""
+import os
+
+from django.conf import settings
+
+## Raised when a campus file does not match its declared schema
+class SchemaError(ValueError):
+    pass
+
+## file key (as passed to `campus_parse') -> (campusData field, {column: dtype})
+CAMPUS_SCHEMA = {
+    'students': ('students_csv', {
+        'id': 'int32',
+        'age': 'int16',
+        'hostel': 'int32',
+        'mess': 'int32',
+        'dept_id': 'int16',
+    }),
+    'class': ('classes_csv', {
+        'class_id': 'int32',
+        'dept': 'int16',
+        'faculty_id': 'int32',
+        'active_duration': 'int16',
+        'days': 'str',
+    }),
+    'staff': ('staff_csv', {
+        'staff_id': 'int32',
+        'dept_associated': 'int16',
+        'interaction_space': 'int32',
+        'residence_block': 'int32',
+        'adult_family_members': 'int16',
+        'num_children': 'int16',
+    }),
+    'mess': ('mess_csv', {
+        'mess_id': 'int32',
+        'active_duration': 'int16',
+        'average_time_spent': 'float64',
+    }),
+    'common_areas': ('common_areas_csv', {
+        'type': 'category',
+        'number': 'int16',
+        'average_time_spent': 'float64',
+        'starting_id': 'int32',
+        'active_duration': 'int16',
+    }),
+    'campus_setup': ('campus_setup_csv', {
+        'name': 'category',
+        'beta_hostel': 'float64',
+        'beta_classroom': 'float64',
+        'beta_residential_block': 'float64',
+    }),
+}
+TIMETABLE_FIELD = 'timetable_csv'
+
+## Checks that a file has the declared columns, `header' is the list of column names of the file
+def check_header(name, header):
+    missing = [col for col in CAMPUS_SCHEMA[name][1] if col not in header]
+    if missing:
+        raise SchemaError(f"{ CAMPUS_SCHEMA[name][0] } is missing the columns: { ', '.join(missing) }")
+
+## Reads one of the campus files (other than the timetable) with its declared types, in a single pass
+## Columns that are not declared are read with the default type inference
+def read_campus_csv(name, f):
+    import pandas as pd
+    field, columns = CAMPUS_SCHEMA[name]
+
+    ## integer columns are read as nullable first so that missing values can be reported by column,
+    ## types of declared columns that are absent from the file are ignored by pandas and reported by `check_header'
+    dtypes = {col: (dtype.capitalize() if dtype.startswith('int') else dtype) for col, dtype in columns.items()}
+    try:
+        df = pd.read_csv(f, delimiter=',', dtype=dtypes)
+    except (ValueError, TypeError) as e:
+        raise SchemaError(f"{ field } has values that do not match the expected types: { e }")
+    check_header(name, df.columns.tolist())
+    for col, dtype in columns.items():
+        if df[col].isna().any():
+            raise SchemaError(f"{ field } has missing values in the column { col } (row { int(df[col].isna().values.argmax()) + 2 })")
+        if dtype.startswith('int'):
+            df[col] = df[col].astype(dtype)
+    return df
+
+## Reads the timetable as a `sparseEnrollment' (the student id and the class ids of each student)
+def read_timetable(f):
+    from .enrollment import EnrollmentError, read_enrollment
+    try:
+        return read_enrollment(f)
+    except EnrollmentError as e:
+        raise SchemaError(f"{ TIMETABLE_FIELD }: { e }")
+
+## Reads every uploaded file of `addCampusDataForm', `uploads' maps the campusData field to the file
+## Returns the parsed frames (keyed as in `read_campus_files') and a dict of field -> error message
+def read_uploads(uploads):
+    files, errors = {}, {}
+    for name, field in [(name, spec[0]) for name, spec in CAMPUS_SCHEMA.items()] + [('timetable', TIMETABLE_FIELD)]:
+        f = uploads.get(field)
+        if f is None:
+            continue
+        try:
+            files[name] = read_timetable(f) if name == 'timetable' else read_campus_csv(name, f)
+        except SchemaError as e:
+            errors[field] = str(e)
+        except Exception:
+            errors[field] = "Ensure files uploaded are only in .csv format"
+        finally:
+            f.seek(0)
+    return files, errors
+
+## Lists the ids of `values' that are not in `known', for error messages
+def describe_unknown(values, known, limit=5):
+    import pandas as pd
+    unknown = pd.unique(values[~values.isin(known)])
+    listed = ', '.join(str(int(v)) for v in unknown[:limit])
+    return f"{ listed } and { len(unknown) - limit } more" if len(unknown) > limit else listed
+
+## Cross-file checks on the parsed campus files, every check is a vectorized set membership test
+## Interaction spaces share one id space: classes, hostels (only known through students.csv), messes and common areas
+## Returns a dict of field -> error message
+def check_integrity(files):
+    import numpy as np
+    import pandas as pd
+    errors = {}
+    def fail(name, message):
+        field = TIMETABLE_FIELD if name == 'timetable' else CAMPUS_SCHEMA[name][0]
+        errors[field] = f"{ errors[field] } { message }" if field in errors else message
+
+    students, classes, mess = files.get('students'), files.get('class'), files.get('mess')
+    staff, common, timetable = files.get('staff'), files.get('common_areas'), files.get('timetable')
+
+    if students is not None and mess is not None:
+        bad = ~students['mess'].isin(mess['mess_id'])
+        if bad.any():
+            fail('students', f"students.csv refers to messes that are not in mess.csv: { describe_unknown(students['mess'], mess['mess_id']) }.")
+
+    space_ids = {}
+    if classes is not None:
+        space_ids['classes.csv'] = classes['class_id']
+    if mess is not None:
+        space_ids['mess.csv'] = mess['mess_id']
+    if common is not None:
+        ## each type of common area covers the ids starting_id, ..., starting_id + number - 1
+        space_ids['common_areas.csv'] = pd.Series(np.concatenate([np.arange(start, start + n) for start, n in zip(common['starting_id'], common['number'])] or [[]]))
+
+    if students is not None:
+        for source, ids in space_ids.items():
+            clash = students['hostel'].isin(ids)
+            if clash.any():
+                fail('students', f"hostel ids in students.csv are also used by { source }: { ', '.join(str(v) for v in pd.unique(students['hostel'][clash])[:5]) }.")
+
+    if timetable is not None:
+        if students is not None:
+            bad = ~np.isin(timetable.students, students['id'])
+            if bad.any():
+                fail('timetable', f"the timetable has students that are not in students.csv: { describe_unknown(pd.Series(timetable.students), students['id']) }.")
+        if classes is not None:
+            bad = ~np.isin(timetable.classes, classes['class_id'])
+            if bad.any():
+                fail('timetable', f"the timetable has classes that are not in classes.csv: { describe_unknown(pd.Series(timetable.classes), classes['class_id']) }.")
+
+    if classes is not None and staff is not None:
+        bad = ~classes['faculty_id'].isin(staff['staff_id'])
+        if bad.any():
+            fail('class', f"classes.csv has faculty that are not in staff.csv: { describe_unknown(classes['faculty_id'], staff['staff_id']) }.")
+
+    if staff is not None and space_ids:
+        ## -1 is a staff member without an interaction space
+        known = pd.concat([pd.Series([-1])] + list(space_ids.values()) + ([students['hostel']] if students is not None else []))
+        bad = ~staff['interaction_space'].isin(known)
+        if bad.any():
+            fail('staff', f"staff.csv refers to interaction spaces that do not exist: { describe_unknown(staff['interaction_space'], known) }.")
+    return errors
+
+## Path of the cached frames of `key' (a campus or an upload)
+def get_cache_path(key):
+    return os.path.join(settings.CAMPUS_CACHE_ROOT, f"{ key }.npz")
+
+## Stores parsed campus files (keyed as in `read_campus_files') as arrays: a frame is stored column by column, text
+## and categories as unicode arrays with their pandas type and a mask of their missing values, the timetable as its
+## three CSR arrays
+def save_frames(path, files):
+    import numpy as np
+    import pandas as pd
+    arrays = {}
+    for name, frame in files.items():
+        if name == 'timetable':
+            arrays.update({'timetable:students': frame.students, 'timetable:indptr': frame.indptr, 'timetable:classes': frame.classes})
+            continue
+        arrays[f"{ name }:columns"] = np.array(frame.columns, dtype=str)
+        for i, col in enumerate(frame.columns):
+            values = frame[col]
+            if pd.api.types.is_numeric_dtype(values.dtype) and not isinstance(values.dtype, pd.CategoricalDtype):
+                arrays[f"{ name }:{ i }"] = values.to_numpy()
+            else:
+                arrays[f"{ name }:{ i }:na"] = values.isna().to_numpy()
+                arrays[f"{ name }:{ i }:dtype"] = np.array(str(values.dtype))
+                arrays[f"{ name }:{ i }"] = np.array(values.astype(object).fillna('').tolist(), dtype=str)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    ## written aside and renamed, a reader never sees a partial file
+    with open(f"{ path }.tmp", 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(f"{ path }.tmp", path)
+
+## Reads back the files stored by `save_frames', with the types they were stored with
+def load_frames(path):
+    import numpy as np
+    import pandas as pd
+    from .enrollment import sparseEnrollment
+    files = {}
+    with np.load(path, allow_pickle=False) as data:
+        for name in {key.split(':')[0] for key in data.files}:
+            if name == 'timetable':
+                files[name] = sparseEnrollment(data['timetable:students'], data['timetable:indptr'], data['timetable:classes'])
+                continue
+            columns = data[f"{ name }:columns"].tolist()
+            frame = {}
+            for i, col in enumerate(columns):
+                values = data[f"{ name }:{ i }"]
+                if values.dtype.kind == 'U':
+                    values = pd.Series(values, dtype=object).mask(data[f"{ name }:{ i }:na"]).astype(str(data[f"{ name }:{ i }:dtype"]))
+                frame[col] = values
+            files[name] = pd.DataFrame(frame, columns=columns)
+    return files
+
+def remove_cache(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def get_campus_cache_path(campus):
+    return get_cache_path(f"campus_{ campus.pk }")
+
+## Stores the frames parsed while validating the upload of `campus', for its instantiation
+def cache_campus_files(campus, files):
+    save_frames(get_campus_cache_path(campus), files)
+
+## The cached frames of a campus that was never instantiated are removed with it
+def on_campus_delete(sender, instance, **kwargs):
+    remove_cache(get_campus_cache_path(instance))
+
+## Connected when the application is ready (see apps.py)
+def connect():
+    from django.db.models.signals import post_delete
+    from .models import campusData
+    post_delete.connect(on_campus_delete, sender=campusData, dispatch_uid='schema_campus_delete')
+
+## Paths of the files of a campus (and of the frames cached at upload), as read by `read_campus_files'
+def get_campus_paths(campus):
+    paths = {name: getattr(campus, field).path for name, (field, _) in CAMPUS_SCHEMA.items()}
+    paths['timetable'] = getattr(campus, TIMETABLE_FIELD).path
+    paths['cache'] = get_campus_cache_path(campus)
+    return paths
+
+## Reads all the campus files (see `get_campus_paths') into the dataframes expected by `campus_parse', the timetable is made dense here
+## The frames cached at upload are used (and removed) when present, else the files are parsed
+## Only reads files, so that it can be run in a process without a database connection
+def read_campus_files(paths):
+    if os.path.exists(paths['cache']):
+        try:
+            files = load_frames(paths['cache'])
+            if set(files) == set(CAMPUS_SCHEMA) | {'timetable'}:
+                files['timetable'] = files['timetable'].to_frame()
+                return files
+        finally:
+            remove_cache(paths['cache'])
+
+    files = {}
+    for name in CAMPUS_SCHEMA:
+        with open(paths[name], 'rb') as f:
+            files[name] = read_campus_csv(name, f)
+    with open(paths['timetable'], 'rb') as f:
+        files['timetable'] = read_timetable(f).to_frame()
+    return files
@@ -5,15 +5,38 @@ The serializers query the objects stored in a model using their `id` field
 from rest_framework import serializers
 from .models import campusInstantiation, simulationParams, simulationResults
 
-## API for transmission coefficient JSONs for all campus instantiations, search by 'object id'
-class campusTransCoeffSerializer(serializers.HyperlinkedModelSerializer):
+## Serializes only the fields the view asks for (`fields' in the serializer context, see mixins.ScopedListMixin)
+class SparseFieldsMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+## API for transmission coefficient JSONs and statistics (see stats.py) for all campus instantiations, search by 'object id'
+class campusTransCoeffSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
+    campus = serializers.PrimaryKeyRelatedField(source='inst_name', read_only=True)
+    campus_name = serializers.CharField(source='inst_name.campus_name', read_only=True)
     class Meta:
         model = campusInstantiation
-        fields = ['id', 'trans_coeff_file']
+        fields = ['id', 'campus', 'campus_name', 'status', 'created_on', 'trans_coeff_file', 'stats', 'peak_memory']
+
+## API for the parameters and status of simulations, search by 'object id'
+class simulationParamsSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
+    campus_instantiation = serializers.PrimaryKeyRelatedField(read_only=True)
+    intervention = serializers.PrimaryKeyRelatedField(read_only=True)
+    sweep = serializers.PrimaryKeyRelatedField(read_only=True)
+    class Meta:
+        model = simulationParams
+        fields = ['id', 'simulation_name', 'campus_instantiation', 'intervention', 'sweep', 'batch_id', 'status', 'priority',
+                  'days_to_simulate', 'simulation_iterations', 'init_infected_seed', 'enable_testing', 'created_on',
+                  'completed_at', 'trans_coeff_file']
 
 ## API for aggregated simulation results for all simulations done, search by 'object id'
-class simResultsSerializer(serializers.HyperlinkedModelSerializer):
+class simResultsSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     simulation_id = serializers.HyperlinkedRelatedField(view_name='rest_sim_result', queryset=simulationParams.objects.all())
+    simulation_name = serializers.CharField(source='simulation_id.simulation_name', read_only=True)
     class Meta:
         model = simulationResults
-        fields = ['simulation_id', 'agg_results']
+        fields = ['simulation_id', 'simulation_name', 'completed_at', 'agg_results']
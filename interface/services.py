@@ -3,18 +3,18 @@ services.py: queries models to get required inputs to launch a task in the backg
 - this scripts abstracts the functions specified in tasks.py
 """
 import uuid
-from io import StringIO
 
 import os
-import pandas as pd
 from django.urls import reverse
 from django.contrib.sites.shortcuts import get_current_site
-from .tasks import run_simulation, send_mail, run_instantiate
+from .tasks import send_mail, run_instantiate
+from . import counters, scheduler
 from .helper import get_activation_url, convert
-from .models import (UserRegisterToken, UserPasswordResetToken, campusInstantiation, simulationParams)
+from .artifacts import get_staged_path
+from .models import (UserRegisterToken, UserPasswordResetToken, campusInstantiation, simulationParams, simulationSweep)
 import json
-from simulator.staticInst.config import configCreate
 from django.contrib import messages
+from django.utils import timezone
 import logging
 log = logging.getLogger('interface_log')
 
@@ -87,11 +87,13 @@ def updateTransCoeff(campusId, BETA):
         trans_coeff_file=json.dumps(
             transmission_coefficients_json,
             default=convert
-        )
+        ),
+        updated_on=timezone.now()
     )
     return True
 
 def addConfigJSON(obj, outPath):
+    from simulator.staticInst.config import configCreate
     min_group_size =  int(obj.min_grp_size)
     max_group_size = int(obj.max_grp_size)
     beta_scaling_factor = int(obj.betaScale)
@@ -111,18 +113,9 @@ def instantiateTask(request):
     obj = campusInstantiation.get_latest(user=user) #gives id of the object
     obj = campusInstantiation.objects.filter(created_by=user, id=obj.id)[0]
 
-    inputFiles = {
-        'students': pd.read_csv(StringIO(obj.inst_name.students_csv.read().decode('utf-8')), delimiter=',').to_dict(),
-        'class': pd.read_csv(StringIO(obj.inst_name.classes_csv.read().decode('utf-8')), delimiter=',').to_dict(),
-        'timetable': pd.read_csv(StringIO(obj.inst_name.timetable_csv.read().decode('utf-8')), delimiter=',', header=None, names=[i for i in range(24)]).to_dict(),
-        'staff': pd.read_csv(StringIO(obj.inst_name.staff_csv.read().decode('utf-8')), delimiter=',').to_dict(),
-        'mess': pd.read_csv(StringIO(obj.inst_name.mess_csv.read().decode('utf-8')), delimiter=',').to_dict(),
-        'common_areas': pd.read_csv(StringIO(obj.inst_name.common_areas_csv.read().decode('utf-8')), delimiter=',').to_dict(),
-        'campus_setup' : pd.read_csv(StringIO(obj.inst_name.campus_setup_csv.read().decode('utf-8')), delimiter=',').to_dict(),
-        'objid': obj.id
-    }
-    campusInstantiation.objects.filter(created_by=user, id=obj.id).update(status='Running')
-    run_instantiate.apply_async(queue='instQueue', kwargs={'inputFiles': json.dumps(inputFiles)})
+    ## only the id is sent through the broker, the worker reads the campus files from storage
+    counters.set_status(campusInstantiation.objects.filter(created_by=user, id=obj.id), 'Running')
+    run_instantiate.apply_async(queue='instQueue', kwargs={'id': obj.id})
     return True
     # if res.get():
     #     messages.success(request, f"instantiation job name: { obj.inst_name } is complete")
@@ -155,8 +148,7 @@ def launchSimulationTask(request, campusId, BETA):
     json.dump(obj.testing_protocol.testing_protocol_file, open(f"{ dirName }/testing_protocol.json", 'w'), default=convert)
     addConfigJSON(obj, dirName)
 
-    simulationParams.objects.filter(created_by=user, id=obj.id).update(status='Queued')
-    res = run_simulation.apply_async(queue='simQueue', kwargs={'id': obj.id, 'dirName': dirName, 'enable_testing': obj.enable_testing, 'intv_name': obj.intervention.intv_name})
+    scheduler.submit([(obj, dirName)], priority=simulationParams.INTERACTIVE)
     # if res.get():
     #     messages.success(request, f"Simulation job name: { obj.simulation_name } is complete")
     #     log.info(f"Simulation job name: { obj.simulation_name } is complete")
@@ -167,6 +159,71 @@ def launchSimulationTask(request, campusId, BETA):
 
 
 
+## Writes the inputs shared by a group of simulations on the same campus and intervention once,
+## returns the mapping of input file names to their staged paths
+def stageSharedInputs(inst, intervention, testing_protocol, stagingDir):
+    os.makedirs(stagingDir, exist_ok=True)
+    with open(f"{ stagingDir }/{ intervention.intv_name }.json", "w") as f:
+        f.write(json.dumps(json.loads(intervention.intv_json)))
+    with open(f"{ stagingDir }/testing_protocol.json", "w") as f:
+        json.dump(testing_protocol.testing_protocol_file, f, default=convert)
+    return {
+        'individuals.json': get_staged_path(inst.agent_json.path),
+        'interaction_spaces.json': get_staged_path(inst.interaction_spaces_json.path),
+        f"{ intervention.intv_name }.json": f"{ stagingDir }/{ intervention.intv_name }.json",
+        'testing_protocol.json': f"{ stagingDir }/testing_protocol.json",
+    }
+
+## Links the shared inputs into a simulation's own input directory and writes the
+## inputs specific to it (transmission coefficients and config.json)
+def stageMemberInputs(obj, memberDir, shared):
+    os.makedirs(memberDir, exist_ok=True)
+    for name, src in shared.items():
+        if not os.path.lexists(f"{ memberDir }/{ name }"):
+            os.symlink(src, f"{ memberDir }/{ name }")
+    with open(f"{ memberDir }/transmission_coefficients.json", "w") as f:
+        f.write(obj.trans_coeff_file)
+    addConfigJSON(obj, memberDir)
+    return (obj, memberDir)
+
+## Stages the inputs of a parameter sweep and queues its member simulations with batch priority
+## - inputs shared by all members (agents, interaction spaces, intervention, testing protocol) are written once
+##   in the sweep directory and linked into each member's input directory
+## - each member's input directory gets its own transmission coefficients and config.json
+## - `admission' is the decision of `scheduler.check_admission' taken when the members were created
+def launchSweepTask(sweep, admission=None):
+    inst = sweep.campus_instantiation
+    sweepDir = f"{ os.path.dirname(inst.agent_json.path) }/sweep_{ sweep.id }"
+    members = list(simulationParams.objects.filter(sweep=sweep).select_related('testing_protocol', 'intervention').order_by('id'))
+
+    shared = stageSharedInputs(inst, sweep.intervention, members[0].testing_protocol, sweepDir)
+    staged = [stageMemberInputs(member, f"{ sweepDir }/{ member.id }", shared) for member in members]
+
+    simulationSweep.objects.filter(id=sweep.id).update(output_directory=sweepDir)
+    scheduler.submit(staged, priority=simulationParams.BATCH, admission=admission)
+    log.info(f"Sweep { sweep.sweep_name } with { len(staged) } simulations was queued")
+    return True
+
+## Stages and queues a batch of simulations submitted through the REST API
+## - shared inputs are staged once per distinct campus instantiation and intervention
+## - all the simulations are queued together with batch priority, as admitted (`admission') when they were created
+def launchBatchTask(batch_id, admission=None):
+    members = list(simulationParams.objects.filter(batch_id=batch_id)
+                   .select_related('campus_instantiation', 'intervention', 'testing_protocol').order_by('id'))
+    shared = {}
+    staged = []
+    for member in members:
+        key = (member.campus_instantiation_id, member.intervention_id)
+        batchDir = f"{ os.path.dirname(member.campus_instantiation.agent_json.path) }/batch_{ batch_id.hex }_{ key[0] }_{ key[1] }"
+        if key not in shared:
+            shared[key] = stageSharedInputs(member.campus_instantiation, member.intervention, member.testing_protocol, batchDir)
+        staged.append(stageMemberInputs(member, f"{ batchDir }/{ member.id }", shared[key]))
+
+    scheduler.submit(staged, priority=simulationParams.BATCH, admission=admission)
+    log.info(f"Batch { batch_id } with { len(staged) } simulations was queued")
+    return [member.id for member in members]
+
+
 def send_result_available_email(request, user):
     to_email = user.email
     simulationResults.objects.filter(user=user, completed_at=datetime.datetime.now())
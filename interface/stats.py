@@ -0,0 +1,79 @@
+"""
+stats.py: statistics of an instantiated campus, recorded on `campusInstantiation.stats'
+- the population by role comes from the campus files: students, faculty (staff who teach a class) and other staff
+- agents and interaction spaces (by type) are counted from the instantiation artifacts
+- artifact sizes come from their index (see artifacts.py), timings are only known for instantiations run since
+  the statistics were introduced
+"""
+import os
+from collections import Counter
+
+from .artifacts import read_index
+
+## interaction space codes of simulator/cpp-simulator/models.h (as in static/js/interventions.js)
+SPACE_TYPES = {
+    1: 'Classroom',
+    2: 'Hostel',
+    3: 'Mess',
+    4: 'Cafeteria',
+    5: 'Library',
+    6: 'Sports facility',
+    7: 'Recreational facility',
+    8: 'Residential block',
+    9: 'House',
+    10: 'Small network',
+}
+
+AGENT_SPACES_KEY = 'interaction_spaces'
+
+def get_type_name(code):
+    try:
+        return SPACE_TYPES.get(int(code), f"Type { code }")
+    except (TypeError, ValueError):
+        return str(code)
+
+## Population by role from the parsed campus files (see schema.py)
+def count_population(files):
+    faculty = files['class']['faculty_id'].isin(files['staff']['staff_id'])
+    num_faculty = files['class']['faculty_id'][faculty].nunique()
+    return {
+        'student': int(len(files['students'])),
+        'faculty': int(num_faculty),
+        'staff': int(len(files['staff']) - num_faculty),
+    }
+
+## Counts the agents and the interaction spaces by type, `individuals' and `spaces' are iterables of records
+## (`spaces' may also be a dict of id -> record) so that they can be streamed from the artifacts
+def count_artifacts(individuals, spaces):
+    if isinstance(spaces, dict):
+        spaces = spaces.values()
+    agents = memberships = 0
+    for agent in individuals:
+        agents += 1
+        memberships += len(agent.get(AGENT_SPACES_KEY) or ())
+    by_type = Counter(get_type_name(space.get('type')) for space in spaces)
+    return {
+        'agents': agents,
+        'memberships': memberships,
+        'spaces': sum(by_type.values()),
+        'spaces_by_type': dict(sorted(by_type.items())),
+    }
+
+## Size of a stored artifact before and after compression
+def get_artifact_size(path):
+    index = read_index(path)
+    if index is not None:
+        return {'bytes': index['bytes'], 'stored_bytes': index['stored_bytes']}
+    size = os.path.getsize(path)
+    return {'bytes': size, 'stored_bytes': size}
+
+## Statistics summary of an instantiation
+def summarize_instantiation(population, counts, artifacts, timings=None):
+    return {
+        'population': population,
+        **counts,
+        'artifacts': artifacts,
+        'bytes': sum(a['bytes'] for a in artifacts.values()),
+        'stored_bytes': sum(a['stored_bytes'] for a in artifacts.values()),
+        'timings': timings or {},
+    }
@@ -1,116 +1,284 @@
 from __future__ import absolute_import
 from .helper import  convert, run_aggregate_sims
-from django.core.files import File
+from .schema import get_campus_paths, read_campus_files
+from .stats import count_artifacts, count_population, summarize_instantiation
 from celery import shared_task
+from celery.signals import worker_init
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
+from django.db import transaction
 from anymail.exceptions import AnymailError
 from config.celery import app
-from .models import simulationParams, campusInstantiation
-from io import StringIO
+from .models import simulationParams, simulationIteration, campusInstantiation
+from . import counters, live, progress, scheduler
+from .artifacts import get_artifact_name, hold_staged, stage_artifacts, write_json_artifact
 import json
-import pandas as pd
 from django.utils import timezone
 import sys
 import os
-import billiard as multiprocessing
+import resource
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
 
 ## logging
 import logging
 log = logging.getLogger('celery_log')
 
-## Custom modules taken from submodule
-from simulator.staticInst.campus_parse_and_instantiate import campus_parse
-from simulator.staticInst.default_betas import default_betas
+## The simulator submodule and the scientific stack are imported by the tasks that use them, so that the web
+## processes (which import this module to queue tasks) do not load them
+## Celery workers load them once at start-up, the pool processes forked from the worker share them
+HEAVY_MODULES = ['numpy', 'pandas', 'simulator.staticInst.campus_parse_and_instantiate', 'simulator.staticInst.default_betas']
 
+@worker_init.connect
+def preload_modules(**kwargs):
+    import importlib
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
 
-@app.task()
-def run_instantiate(inputFiles):
-    inputFiles = json.loads(inputFiles)
-    inputFiles['students'] = pd.DataFrame.from_dict(inputFiles['students'])
-    df = pd.DataFrame.from_dict(inputFiles['class'])
-    df = df.astype({'faculty_id': int})
-    inputFiles['class'] = df
-    del df
-    inputFiles['timetable'] = pd.DataFrame.from_dict(inputFiles['timetable'])
-    inputFiles['staff'] = pd.DataFrame.from_dict(inputFiles['staff'])
-    inputFiles['mess'] = pd.DataFrame.from_dict(inputFiles['mess'])
-    inputFiles['common_areas'] = pd.DataFrame.from_dict(inputFiles['common_areas'])
-    inputFiles['campus_setup'] = pd.DataFrame.from_dict(inputFiles['campus_setup'])
-    campusSetupDf = pd.DataFrame(inputFiles['campus_setup'])
+
+## Runs in the child process started by `run_instantiate': parses the campus files and writes the artifacts
+## to `artifacts' (field -> path), the result is written as JSON to `result_path', the database is not used here
+def instantiate_campus(id, paths, artifacts, result_path, memory_limit):
+    from simulator.staticInst.campus_parse_and_instantiate import campus_parse
+    from simulator.staticInst.default_betas import default_betas
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_DATA, (memory_limit, memory_limit))
     try:
+        start = time.perf_counter()
+        inputFiles = read_campus_files(paths)
+        inputFiles['objid'] = id
+        population = count_population(inputFiles)
+        campusSetupDf = inputFiles['campus_setup']
         individuals, interactionSpace, transCoeff2 =  campus_parse(inputFiles)
-        # print("\nPrinting Input Files\n")
-        # print(inputFiles)
-        # print(campusSetupDf)
         transCoeff = default_betas(campusSetupDf)
+        parsed = time.perf_counter()
 
-        indF = StringIO(json.dumps(individuals, default=convert))
-        intF = StringIO(json.dumps(interactionSpace, default=convert))
-        campusInstantiation.objects.filter(id=inputFiles['objid'])[0].agent_json.save('individuals.json', File(indF))
-        campusInstantiation.objects.filter(id=inputFiles['objid'])[0].interaction_spaces_json.save('interaction_spaces.json', File(intF))
+        ## artifacts are streamed to storage record by record
+        written = {
+            'agent_json': write_json_artifact(artifacts['agent_json'], individuals),
+            'interaction_spaces_json': write_json_artifact(artifacts['interaction_spaces_json'], interactionSpace),
+        }
+        result = {
+            'status': 'Complete',
+            'trans_coeff': transCoeff,
+            'artifacts': written,
+            'stats': summarize_instantiation(
+                population,
+                count_artifacts(individuals, interactionSpace),
+                {field: {'bytes': a['bytes'], 'stored_bytes': a['stored_bytes']} for field, a in written.items()},
+                {'parse_seconds': parsed - start, 'serialize_seconds': sum(a['seconds'] for a in written.values())}
+            ),
+        }
+        del individuals, interactionSpace
+    except MemoryError:
+        result = {'status': 'Error', 'error': f"the instantiation needs more memory than the { memory_limit } bytes allowed (INSTANTIATION_MEMORY_LIMIT)"}
+    except Exception as e:
+        result = {'status': 'Error', 'error': f"{ e }"}
+    result['peak_memory'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    with open(result_path, 'w') as f:
+        json.dump(result, f, default=convert)
 
-        campusInstantiation.objects.filter(id=inputFiles['objid']).update(
-            trans_coeff_file = json.dumps(transCoeff, default=convert),
-            status = 'Complete',
-            created_on = timezone.now()
+## Instantiates a campus: campus_parse runs in a forked child process so that the memory it allocates is returned
+## to the OS when the child exits, instead of staying with the long-lived worker
+@app.task()
+def run_instantiate(id):
+    import billiard as multiprocessing
+    obj = campusInstantiation.objects.select_related('inst_name').get(id=id)
+    names = {
+        'agent_json': get_artifact_name(obj, 'agent_json', 'individuals.json'),
+        'interaction_spaces_json': get_artifact_name(obj, 'interaction_spaces_json', 'interaction_spaces.json'),
+    }
+    with tempfile.TemporaryDirectory() as tmpDir:
+        resultPath = f"{ tmpDir }/result.json"
+        child = multiprocessing.get_context('fork').Process(
+            target=instantiate_campus,
+            args=(id, get_campus_paths(obj.inst_name), {field: obj.agent_json.storage.path(name) for field, name in names.items()}, resultPath, settings.INSTANTIATION_MEMORY_LIMIT)
         )
-        log.info(f"Instantiaion job {campusInstantiation.objects.filter(id=inputFiles['objid'])[0].inst_name.campus_name} was completed successfully.")
-        del individuals, interactionSpace, transCoeff
-        return True
-    except Exception as e:
-        campusInstantiation.objects.filter(id=inputFiles['objid']).update(
-            status = 'Error',
-            created_on = timezone.now()
+        child.start()
+        child.join()
+        try:
+            with open(resultPath) as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            ## the child was killed before it could report (e.g. by the OOM killer)
+            result = {'status': 'Error', 'error': f"the instantiation process exited with code { child.exitcode }", 'peak_memory': None}
+
+    if result['status'] != 'Complete':
+        counters.set_status(
+            campusInstantiation.objects.filter(id=id),
+            'Error',
+            peak_memory = result['peak_memory'],
+            created_on = timezone.now(),
+            updated_on = timezone.now()
         )
-        log.error(f"Instantiaion job {campusInstantiation.objects.filter(id=inputFiles['objid'])[0].inst_name.campus_name} terminated abruptly with error {e} at {sys.exc_info()}.")
+        log.error(f"Instantiaion job {obj.inst_name.campus_name} terminated abruptly with error {result['error']} (peak memory {result['peak_memory']} bytes).")
         return False
 
+    stats = result['artifacts']
+    counters.set_status(
+        campusInstantiation.objects.filter(id=id),
+        'Complete',
+        trans_coeff_file = json.dumps(result['trans_coeff'], default=convert),
+        peak_memory = result['peak_memory'],
+        stats = result['stats'],
+        created_on = timezone.now(),
+        updated_on = timezone.now(),
+        **names
+    )
+    log.info(f"Instantiation job {obj.inst_name.campus_name} wrote {sum(a['bytes'] for a in stats.values())} bytes of artifacts ({sum(a['stored_bytes'] for a in stats.values())} bytes compressed) in {sum(a['seconds'] for a in stats.values()):.2f}s.")
+    log.info(f"Instantiaion job {obj.inst_name.campus_name} was completed successfully (peak memory {result['peak_memory']} bytes).")
+    return True
 
-def run_cmd(prgCall):
-    print(prgCall)
-    outName = prgCall[1]
-    if not os.path.exists(outName):
-        os.mkdir(outName)
-    os.system(prgCall[0] + outName)
-
-@app.task()
-def run_simulation(id, dirName, enable_testing, intv_name):
-    obj = simulationParams.objects.filter(id=id)
-    obj.update(status='Running')
-    obj = obj[0]
-    log.info(f"Simulation job { obj.simulation_name } is now running.")
+## Builds the simulator command for one iteration of a simulation
+def simulator_command(obj, dirName, outName):
+    intv_name = obj.intervention.intv_name
     cmd = f"./simulator/cpp-simulator/drive_simulator --SEED_FIXED_NUMBER --INIT_FIXED_NUMBER_INFECTED { obj.init_infected_seed } --intervention_filename ./{intv_name}.json --NUM_DAYS { obj.days_to_simulate }"
 
-    if(enable_testing):
+    if(obj.enable_testing):
         cmd += f" --ENABLE_TESTING  --testing_protocol_filename ./testing_protocol.json"
 
-    cmd += f" --input_directory { dirName } --output_directory "
-
-    list_of_sims = [(cmd , f"{ dirName }/{obj.simulation_name.replace(' ', '_')}_{ intv_name }_id_{ i }") for i in range(obj.simulation_iterations)]
+    cmd += f" --input_directory { dirName } --output_directory { outName }"
+    return cmd
 
-    pool = multiprocessing.Pool(multiprocessing.cpu_count() - 1)
-    r = pool.map_async(run_cmd, list_of_sims)
+## Closes a simulation once all its iterations are done, returns True when its results are to be aggregated
+## The conditional status update ensures only the last iteration to finish aggregates the results
+def close_simulation(obj):
+    iterations = simulationIteration.objects.filter(simulation_id=obj.id)
+    if iterations.exclude(status__in=['Complete', 'Error']).exists():
+        return False
+    if iterations.filter(status='Error').exists():
+        if counters.set_status(simulationParams.objects.filter(id=obj.id).exclude(status='Error'), 'Error', completed_at=timezone.now()):
+            log.error(f"Simulation job { obj.simulation_name } has failed iterations.")
+        return False
+    return bool(counters.set_status(simulationParams.objects.filter(id=obj.id).exclude(status__in=['Complete', 'Error']), 'Complete', completed_at=timezone.now()))
 
-    r.wait()
+## Aggregates the results of a simulation closed by `close_simulation'
+def finish_simulation(obj):
     try:
-        log.info(f" Running sims for {obj.simulation_name } are complete")
-        simulationParams.objects.filter(id=id).update(
-        output_directory=f"{ dirName }/{obj.simulation_name.replace(' ', '_')}_{ intv_name }",
-        status='Complete',
-        completed_at=timezone.now()
-        )
-        run_aggregate_sims(id)
+        run_aggregate_sims(obj.id)
+        progress.publish(obj.created_by_id, 'results', simulation=obj.id)
         log.info(f"Simulation job { obj.simulation_name } is complete and the results are aggregated.")
         return True
     except Exception as e:
-        simulationParams.objects.filter(id=id).update(
-            status = 'Error',
-            created_on = timezone.now()
-        )
+        counters.set_status(simulationParams.objects.filter(id=obj.id), 'Error')
         log.error(f"Simulation job { obj.simulation_name } terminated abruptly with error {e} at {sys.exc_info()}.")
         return False
 
+## Publishes the progress of a simulation when one of its iterations starts or finishes (see progress.py)
+def publish_iteration(obj, item, status):
+    done = simulationIteration.objects.filter(simulation_id=obj.id, status__in=['Complete', 'Error']).count()
+    progress.publish(obj.created_by_id, 'iteration', simulation=obj.id, iteration=item.iteration, status=status,
+                     done=done, total=obj.simulation_iterations)
+
+## Reads what the simulator has written since the last call (see live.py), the curve is stored and published once
+## settings.LIVE_SERIES_DAYS new days were read, and with whatever days are left when the iteration ends (`final')
+## A failure here is logged and does not stop the iteration
+def update_live_series(obj, item, watcher, final=False):
+    try:
+        watcher.poll()
+        if watcher.days - watcher.stored >= settings.LIVE_SERIES_DAYS or (final and watcher.days > watcher.stored):
+            simulationIteration.objects.filter(id=item.id).update(live_series=watcher.curve())
+            watcher.stored = watcher.days
+            progress.publish(obj.created_by_id, 'series', simulation=obj.id, iteration=item.iteration, days=watcher.days)
+    except Exception as e:
+        log.warning(f"Live results of iteration { item.iteration } of simulation job { obj.simulation_name } could not be read: { e }")
+
+## Stops the simulator and whatever it started, it runs in a process group of its own
+def stop_process(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+## Runs attempt `attempt' of one iteration of a simulation, dispatched by `scheduler.dispatch'
+## The status writes at the start and at the end of an iteration are made in one transaction each, in between the
+## live series is written every settings.LIVE_SERIES_DAYS simulated days (see `update_live_series')
+## Safe to run again: a task whose attempt is no longer current does nothing (see `scheduler.start_iteration'),
+## the task is redelivered if its worker dies (reject_on_worker_lost) and a new attempt starts from an empty
+## output directory. The simulator is stopped past settings.SIM_SCHEDULER['RUN_TIMEOUT']
+## The output files are tailed while the simulator runs, for the live day by day counts
+@app.task(bind=True, reject_on_worker_lost=True)
+def run_iteration(self, item_id, attempt=None):
+    item = simulationIteration.objects.select_related('simulation', 'simulation__intervention', 'simulation__campus_instantiation').get(id=item_id)
+    obj = item.simulation
+    redelivered = bool((self.request.delivery_info or {}).get('redelivered'))
+    with transaction.atomic():
+        attempt = scheduler.start_iteration(item_id, item.attempts if attempt is None else attempt, redelivered)
+        if attempt is None:
+            log.info(f"Iteration { item.iteration } of simulation job { obj.simulation_name } was dispatched again or has ended, this task is skipped.")
+            return False
+        started = counters.set_status(simulationParams.objects.filter(id=obj.id, status='Queued'), 'Running')
+        publish_iteration(obj, item, 'Running')
+    if started:
+        log.info(f"Simulation job { obj.simulation_name } is now running.")
+
+    status, process, staged = 'Error', None, None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    try:
+        ## the simulator reads plain JSON, compressed artifacts are decompressed next to them if needed and kept
+        ## until it exits (see `artifacts.release_staged')
+        staged = hold_staged(obj.campus_instantiation)
+        stage_artifacts(obj.campus_instantiation)
+        ## a lost attempt may have left files behind
+        shutil.rmtree(item.output_directory, ignore_errors=True)
+        os.mkdir(item.output_directory)
+        watcher = live.iterationWatcher(item.output_directory)
+        deadline = time.monotonic() + settings.SIM_SCHEDULER['RUN_TIMEOUT']
+        process = subprocess.Popen(simulator_command(obj, item.input_directory, item.output_directory), shell=True, start_new_session=True)
+        while True:
+            try:
+                process.wait(timeout=settings.LIVE_SERIES_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                update_live_series(obj, item, watcher)
+                if time.monotonic() > deadline:
+                    log.error(f"Iteration { item.iteration } of simulation job { obj.simulation_name } ran out of time and was stopped.")
+                    stop_process(process)
+                    break
+        update_live_series(obj, item, watcher, final=True)
+        if process.returncode == 0:
+            status = 'Complete'
+    except Exception as e:
+        log.error(f"Iteration { item.iteration } of simulation job { obj.simulation_name } terminated abruptly with error {e} at {sys.exc_info()}.")
+    finally:
+        ## the simulator does not outlive a task that was interrupted (time limit, worker shutdown)
+        if process is not None and process.poll() is None:
+            stop_process(process)
+        if staged is not None:
+            staged.close()
+        end = resource.getrusage(resource.RUSAGE_CHILDREN)
+        closed = False
+        ## the freed slot is handed on before the results are aggregated
+        with transaction.atomic():
+            ## not recorded when the iteration was taken back meanwhile (see `scheduler.recover_lost')
+            ended = simulationIteration.objects.filter(id=item_id, status='Running', attempts=attempt).update(
+                status=status,
+                cpu_seconds=(end.ru_utime - usage.ru_utime) + (end.ru_stime - usage.ru_stime),
+                completed_at=timezone.now()
+            )
+            if ended:
+                publish_iteration(obj, item, status)
+                closed = close_simulation(obj)
+            scheduler.dispatch()
+        if closed:
+            finish_simulation(obj)
+    return status == 'Complete'
+
+## Periodic (celery beat) dispatch, takes back the iterations of workers that were lost (see `scheduler.recover_lost')
+@app.task()
+def dispatch_simulations():
+    return len(scheduler.dispatch())
+
+## Periodic (celery beat) removal of the chunked uploads that were never made into a campus (see `uploads.remove_stale_uploads')
+@app.task()
+def remove_stale_uploads():
+    from .uploads import remove_stale_uploads
+    return remove_stale_uploads()
+
 @shared_task(bind=True, max_retries=settings.CELERY_TASK_MAX_RETRIES)
 def send_mail(self, recipient, subject, html_message, context, **kwargs):
     # Subject and body can't be empty. Empty string or space return index out of range error
@@ -1,3 +1,1072 @@
-from django.test import TestCase
+import csv
+import datetime
+import hashlib
+import io
+import json
+import math
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import uuid
+import zipfile
+from array import array
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import artifacts, counters, live, progress, scheduler, schema, services, uploads
+from .services import updateTransCoeff
+from .export import stream_bundle
+from .enrollment import TIMETABLE_COLUMNS, EnrollmentError, read_enrollment
+from .helper import convert, describe_estimate, expand_sweep, sample_indices, summarize_results, validate_sweep_spec
+from .renderers import float32SeriesRenderer
+from .models import (campusData, campusInstantiation, campusUpload, interventions, simulationIteration, simulationParams, simulationResults,
+                     simulationSweep, userCounters, userModel)
+from .tasks import run_iteration
+
+
+## Listing pages run the same number of queries however many campuses, interventions and simulations a user owns
+class ListingQueryCountTest(TestCase):
+    pages = ['profile', 'userActivity', 'visualizeMultiSimulations', 'createSimulation', 'createSweep']
+
+    def setUp(self):
+        self.user = userModel.objects.create_user('listing@example.com', 'password')
+        userModel.objects.filter(id=self.user.id).update(is_active=True)
+        self.user.refresh_from_db()
+        self.client.force_login(self.user)
+
+    def add_simulations(self, n):
+        for i in range(n):
+            campus = campusData.objects.create(campus_name=f"campus { i }", created_by=self.user)
+            inst = campusInstantiation.objects.create(inst_name=campus, status='Complete', trans_coeff_file='[]', created_by=self.user)
+            intv = interventions.objects.create(intv_name=f"intv { i }", intv_json={}, created_by=self.user)
+            sim = simulationParams.objects.create(
+                simulation_name=f"sim { i }",
+                campus_instantiation=inst,
+                intervention=intv,
+                status='Complete',
+                trans_coeff_file='[]',
+                created_by=self.user
+            )
+            simulationResults.objects.create(simulation_id=sim, agg_results={'time': []}, status='A', created_by=self.user)
+            simulationSweep.objects.create(sweep_name=f"sweep { i }", campus_instantiation=inst, intervention=intv, sweep_spec={}, created_by=self.user)
+
+    def count_queries(self, name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_constant_queries(self):
+        self.add_simulations(1)
+        few = {name: self.count_queries(name) for name in self.pages}
+        self.add_simulations(10)
+        many = {name: self.count_queries(name) for name in self.pages}
+        self.assertEqual(few, many)
+
+    def test_results_not_loaded(self):
+        self.add_simulations(2)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('visualizeMultiSimulations'))
+        self.assertFalse(any('agg_results' in query['sql'] for query in queries.captured_queries))
+
+
+## Start-up cost of a web process: loading the URLconf (and with it every view) does not import the scientific
+## stack or the simulator, which only the views and tasks that use them import
+class WebImportTest(SimpleTestCase):
+    heavy = ['numpy', 'pandas', 'scipy', 'simulator']
+    script = """
+import json, resource, sys, time
+## peak resident memory of this program, ru_maxrss also counts the test runner it was forked from
+def peak_rss():
+    try:
+        with open('/proc/self/status') as f:
+            return next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+    except (OSError, StopIteration):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+import django
+django.setup()
+import interface.urls
+web = {'seconds': time.perf_counter() - start, 'rss': peak_rss(), 'modules': sorted(name for name in HEAVY if name in sys.modules)}
+start = time.perf_counter()
+import numpy, pandas, scipy.sparse
+heavy = {'seconds': time.perf_counter() - start, 'rss': peak_rss()}
+print(json.dumps({'web': web, 'heavy': heavy}))
+"""
+
+    ## the imports are measured in a fresh interpreter, the test runner has already imported everything
+    def measure(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings.dev'))
+        script = f"HEAVY = { self.heavy !r}" + self.script
+        out = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True)
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+    def test_heavy_modules_not_imported(self):
+        result = self.measure()
+        self.assertEqual(result['web']['modules'], [], result)
+        ## loading the stack afterwards still costs memory, i.e. the web process did not pay for it
+        self.assertGreater(result['heavy']['rss'], result['web']['rss'], result)
+
+
+def create_active_user(email):
+    user = userModel.objects.create_user(email, 'password')
+    userModel.objects.filter(id=user.id).update(is_active=True)
+    user.refresh_from_db()
+    return user
+
+
+## The dashboard counters follow every status transition and delete, and always match a recount from the tables
+class CountersTest(TestCase):
+    def setUp(self):
+        self.user = create_active_user('counters@example.com')
+        self.intv = interventions.objects.create(intv_name='intv', intv_json={}, created_by=self.user)
+
+    def assertCounted(self):
+        stored = userCounters.objects.filter(user=self.user).values(*counters.COUNTER_FIELDS).first()
+        actual = counters.count([self.user.id])[self.user.id]
+        self.assertEqual(stored, {field: actual[field] for field in counters.COUNTER_FIELDS})
+
+    def simulations(self, *ids):
+        return simulationParams.objects.filter(id__in=ids)
+
+    def test_lifecycle(self):
+        sims = [simulationParams.objects.create(simulation_name=f"sim { i }", intervention=self.intv, status='Created', created_by=self.user).id for i in range(4)]
+        self.assertCounted()
+        for status in ('Queued', 'Running'):
+            self.assertEqual(counters.set_status(self.simulations(*sims), status), 4)
+            self.assertCounted()
+        counters.set_status(self.simulations(*sims[:3]), 'Complete', completed_at=timezone.now())
+        counters.set_status(self.simulations(sims[3]), 'Error')
+        self.assertCounted()
+        simulationParams.objects.get(id=sims[0]).delete()
+        self.assertCounted()
+        counts = userCounters.objects.get(user=self.user)
+        self.assertEqual((counts.jobs_complete, counts.jobs_error, counts.jobs_running, counts.jobs_created), (2, 1, 0, 0))
+
+    def test_repeated_transition(self):
+        sim = simulationParams.objects.create(simulation_name='sim', intervention=self.intv, status='Queued', created_by=self.user)
+        stale = list(self.simulations(sim.id).values_list('pk', 'created_by_id', 'status'))
+        self.assertEqual(counters.set_status(self.simulations(sim.id).filter(status='Queued'), 'Running'), 1)
+        self.assertEqual(counters.set_status(self.simulations(sim.id).filter(status='Queued'), 'Running'), 0)
+        counters.set_status(self.simulations(sim.id), 'Running')
+        ## a concurrent transition that read the row before the first one committed finds it moved already
+        with mock.patch('django.db.models.query.QuerySet.values_list', return_value=stale):
+            self.assertEqual(counters.set_status(self.simulations(sim.id), 'Running'), 0)
+        self.assertEqual(userCounters.objects.get(user=self.user).jobs_running, 1)
+        self.assertCounted()
+
+    def test_reconcile_repairs_drift(self):
+        simulationParams.objects.create(simulation_name='sim', intervention=self.intv, status='Created', created_by=self.user)
+        userCounters.objects.filter(user=self.user).update(jobs_created=5)
+        self.assertEqual(counters.reconcile([self.user.id])[self.user.id]['jobs_created'], (5, 1))
+        self.assertCounted()
+
+
+## The API lists and details only show a user's own simulations and results, page after page, staff can see everyone's
+class ScopedApiTest(TestCase):
+    def setUp(self):
+        self.users = [create_active_user('alice@example.com'), create_active_user('bob@example.com')]
+        self.sims = {}
+        for user in self.users:
+            name = user.email.split('@')[0]
+            self.sims[user.id] = [simulationParams.objects.create(simulation_name=f"{ name } { i }", status='Complete', created_by=user) for i in range(5)]
+            for sim in self.sims[user.id]:
+                simulationResults.objects.create(simulation_id=sim, agg_results={'time': []}, status='A', created_by=user)
+
+    ## every row of a list, following the cursors two rows at a time
+    def list_all(self, path, **params):
+        rows, response = [], self.client.get(path, dict(params, page_size=2))
+        while True:
+            self.assertEqual(response.status_code, 200)
+            rows += response.json()['results']
+            if not response.json()['next']:
+                return [row['simulation_name'] for row in rows]
+            response = self.client.get(response.json()['next'])
+
+    def test_own_rows(self):
+        alice, bob = self.users
+        self.client.force_login(alice)
+        names = [f"alice { i }" for i in reversed(range(5))]
+        for path in ['/api/simulations/', '/api/sim/']:
+            self.assertEqual(self.list_all(path), names)
+            ## not even when asked for
+            self.assertEqual(self.list_all(path, owner=bob.id), names)
+            self.assertEqual(self.list_all(path, owner=bob.email), names)
+
+        other = self.sims[bob.id][0]
+        for path in [f"/api/simulations/{ other.id }/", f"/api/simulations/{ other.id }/live/", f"/api/sim/{ other.id }/"]:
+            self.assertEqual(self.client.get(path).status_code, 404)
+        self.assertEqual(self.client.get(f"/api/simulations/export/?ids={ other.id }").status_code, 400)
+        own = self.sims[alice.id][0]
+        for path in [f"/api/simulations/{ own.id }/", f"/api/sim/{ own.id }/"]:
+            self.assertEqual(self.client.get(path).status_code, 200)
+
+    def test_staff(self):
+        alice, bob = self.users
+        staff = create_active_user('staff@example.com')
+        userModel.objects.filter(id=staff.id).update(is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(len(self.list_all('/api/simulations/')), 10)
+        self.assertEqual(self.list_all('/api/sim/', owner=bob.email), [f"bob { i }" for i in reversed(range(5))])
+        self.assertEqual(self.client.get(f"/api/sim/{ self.sims[alice.id][0].id }/").status_code, 200)
+
+    def test_anonymous(self):
+        for path in ['/api/simulations/', '/api/sim/', f"/api/sim/{ self.sims[self.users[0].id][0].id }/"]:
+            self.assertIn(self.client.get(path).status_code, (401, 403))
+
+## Dispatch order, admission control and the recovery of iterations lost with their worker (scheduler.py)
+## The tasks are not sent, `run_iteration.apply_async' records what would have been
+@override_settings(SIM_SCHEDULER=dict(settings.SIM_SCHEDULER, SLOTS=2, USER_MAX_RUNNING=1, DEFER_BACKLOG=6, REJECT_BACKLOG=10,
+                                      RUN_TIMEOUT=3600, LOST_AFTER=600, MAX_ATTEMPTS=2))
+class SchedulerTest(TestCase):
+    def setUp(self):
+        self.users = [create_active_user(f"scheduler{ i }@example.com") for i in range(2)]
+        self.intv = interventions.objects.create(intv_name='intv', intv_json={}, created_by=self.users[0])
+        self.sent = []
+        patches = [mock.patch.object(run_iteration, 'apply_async', lambda queue, kwargs: self.sent.append(kwargs)),
+                   mock.patch.object(progress, 'get_backend')]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def submit(self, user, iterations, priority=simulationParams.INTERACTIVE):
+        obj = simulationParams.objects.create(simulation_name='sim', intervention=self.intv, status='Created', simulation_iterations=iterations, created_by=user)
+        with self.captureOnCommitCallbacks(execute=True):
+            scheduler.submit([(obj, '/tmp/inputs')], priority)
+        return obj
+
+    def dispatch(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return scheduler.dispatch()
+
+    def test_fair_share(self):
+        self.submit(self.users[0], 3)
+        self.submit(self.users[1], 1)
+        active = simulationIteration.objects.filter(status__in=scheduler.ACTIVE)
+        self.assertEqual(sorted(active.values_list('created_by', flat=True)), sorted(u.id for u in self.users))
+        self.assertEqual([kwargs['attempt'] for kwargs in self.sent], [1, 1])
+
+    def test_interactive_first(self):
+        batch = self.submit(self.users[0], 2, simulationParams.BATCH)
+        interactive = self.submit(self.users[0], 2)
+        simulationIteration.objects.filter(status__in=scheduler.ACTIVE).update(status='Complete')
+        self.dispatch()
+        self.assertEqual(simulationIteration.objects.get(status='Dispatched').simulation_id, interactive.id)
+        self.assertEqual(simulationIteration.objects.filter(simulation=batch, status='Pending').count(), 1)
+
+    def test_queued_status_is_valid(self):
+        obj = self.submit(self.users[0], 1)
+        obj.refresh_from_db()
+        self.assertEqual(obj.get_status_display(), 'Queued')
+        obj.full_clean(exclude=['campus_instantiation', 'intervention', 'output_directory'])
+
+    def test_admission(self):
+        self.assertEqual(scheduler.check_admission(6, simulationParams.BATCH), 'Pending')
+        self.assertEqual(scheduler.check_admission(7, simulationParams.BATCH), 'Deferred')
+        with self.assertRaises(scheduler.AdmissionError):
+            scheduler.check_admission(11, simulationParams.BATCH)
+        self.assertEqual(scheduler.check_admission(100, simulationParams.INTERACTIVE), 'Pending')
+
+        self.submit(self.users[0], 4, simulationParams.BATCH)
+        ## past DEFER_BACKLOG, only what fits under it is released to run
+        deferred = self.submit(self.users[1], 4, simulationParams.BATCH)
+        self.assertEqual(simulationIteration.objects.filter(simulation=deferred, status='Deferred').count(), 2)
+        self.assertEqual(simulationParams.objects.get(id=deferred.id).status, 'Queued')
+        ## while iterations are deferred, later batches wait behind them
+        self.assertEqual(scheduler.check_admission(1, simulationParams.BATCH), 'Deferred')
+        with self.assertRaises(scheduler.AdmissionError):
+            scheduler.check_admission(3, simulationParams.BATCH)
+
+    def test_release_when_drained(self):
+        first = self.submit(self.users[0], 4, simulationParams.BATCH)
+        deferred = self.submit(self.users[1], 6, simulationParams.BATCH)
+        self.assertEqual(simulationIteration.objects.filter(simulation=deferred, status='Deferred').count(), 4)
+        simulationIteration.objects.filter(simulation=first).update(status='Complete')
+        self.dispatch()
+        self.assertFalse(simulationIteration.objects.filter(status='Deferred').exists())
+        self.assertEqual(simulationIteration.objects.filter(simulation=deferred, status__in=scheduler.ACTIVE).count(), 1)
+
+    def test_queue_position(self):
+        interactive = self.submit(self.users[0], 3)
+        batch = self.submit(self.users[1], 3, simulationParams.BATCH)
+        estimates = scheduler.estimate([interactive.id, batch.id])
+        ## the batch iterations wait behind both pending interactive ones, whoever submitted first
+        self.assertEqual((estimates[interactive.id]['position'], estimates[batch.id]['position']), (1, 3))
+        self.assertLessEqual(estimates[interactive.id]['start'], estimates[batch.id]['start'])
+        self.assertEqual(scheduler.estimate_group([interactive.id, batch.id])['position'], 1)
+        self.assertIn('Position in the queue: 3,', describe_estimate(estimates[batch.id]))
+        self.assertEqual(describe_estimate(None), '')
+
+    def test_lost_iterations(self):
+        obj = self.submit(self.users[0], 2)
+        item = simulationIteration.objects.get(simulation=obj, status='Dispatched')
+        simulationIteration.objects.filter(id=item.id).update(dispatched_at=timezone.now() - datetime.timedelta(hours=1))
+        self.dispatch()
+        item.refresh_from_db()
+        self.assertEqual((item.status, item.attempts), ('Dispatched', 2))
+        ## the task of the lost attempt does nothing, the current one runs once
+        self.assertIsNone(scheduler.start_iteration(item.id, 1))
+        self.assertEqual(scheduler.start_iteration(item.id, 2), 2)
+        self.assertIsNone(scheduler.start_iteration(item.id, 2))
+
+        simulationIteration.objects.filter(id=item.id).update(started_at=timezone.now() - datetime.timedelta(hours=2))
+        simulationIteration.objects.filter(simulation=obj).exclude(id=item.id).update(status='Complete')
+        self.dispatch()
+        item.refresh_from_db()
+        self.assertEqual(item.status, 'Error')
+        self.assertEqual(simulationParams.objects.get(id=obj.id).status, 'Error')
+
+
+SAMPLE_FILES = {'students': 'student.csv', 'class': 'classes.csv', 'staff': 'staff.csv', 'mess': 'mess.csv', 'common_areas': 'common_areas.csv'}
+SAMPLE_SETUP = b'name,beta_hostel,beta_classroom,beta_residential_block\ncampus,0.1,0.2,0.05\n'
+
+## The sample campus of static/sampleData parsed with the schema, `read_campus_files' keys
+def read_sample_campus():
+    files = {}
+    for name, filename in SAMPLE_FILES.items():
+        with open(os.path.join(settings.BASE_DIR, 'static/sampleData', filename), 'rb') as f:
+            files[name] = schema.read_campus_csv(name, f)
+    files['campus_setup'] = schema.read_campus_csv('campus_setup', io.BytesIO(SAMPLE_SETUP))
+    with open(os.path.join(settings.BASE_DIR, 'static/sampleData/timetable.csv'), 'rb') as f:
+        files['timetable'] = schema.read_timetable(f)
+    return files
+
+## Artifacts are written and read back record by record, whatever the codec they are stored with (artifacts.py)
+class ArtifactTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        import numpy as np
+        self.records = [{'id': np.int32(i), 'age': np.int16(i % 90), 'beta': np.float64(i / 7), 'name': f"café { i }",
+                         'spaces': [i, i + 1.5, None], 'student': bool(i % 2)} for i in range(500)]
+
+    ## small chunks, so that records and numbers are cut at chunk boundaries on both ends
+    def assertRoundTrip(self, codec):
+        path = os.path.join(self.directory, f"individuals.json{ codec }")
+        with mock.patch.object(artifacts, 'CHUNK_SIZE', 61):
+            if codec:
+                stats = artifacts.write_json_artifact(path, self.records)
+            else:
+                with open(path, 'wb') as f:
+                    written = artifacts.write_json(self.records, f)[0]
+                stats = {'bytes': written, 'stored_bytes': os.path.getsize(path)}
+            fieldfile = mock.Mock(path=path)
+            with artifacts.open_artifact(fieldfile) as f:
+                self.assertEqual(list(artifacts.iter_json(f)), self.records)
+            with artifacts.open_artifact(fieldfile) as f:
+                data = f.read()
+
+        self.assertEqual(json.loads(data), json.loads(json.dumps(self.records, default=convert)))
+        self.assertEqual((stats['bytes'], stats['stored_bytes']), (len(data), os.path.getsize(path)))
+        if codec:
+            self.assertEqual(artifacts.read_index(path), {'codec': codec.lstrip('.'), 'bytes': len(data), 'stored_bytes': os.path.getsize(path),
+                                                          'sha256': hashlib.sha256(data).hexdigest()})
+            self.assertLess(stats['stored_bytes'], stats['bytes'])
+            ## the simulator reads the staged plain copy
+            staged = artifacts.stage_artifact(fieldfile)
+            self.assertEqual(staged, os.path.join(self.directory, 'individuals.json'))
+            with open(staged, 'rb') as f:
+                self.assertEqual(f.read(), data)
+
+    def test_plain(self):
+        self.assertRoundTrip('')
+
+    def test_gzip(self):
+        self.assertRoundTrip('.gz')
+
+    @skipUnless(artifacts.zstandard, "zstandard is not installed")
+    def test_zstd(self):
+        self.assertRoundTrip('.zst')
+
+    def test_documents(self):
+        def round_trip(document):
+            f = io.BytesIO()
+            artifacts.write_json(document, f)
+            f.seek(0)
+            return list(artifacts.iter_json(f))
+        self.assertEqual(round_trip([]), [])
+        self.assertEqual(round_trip({}), [])
+        self.assertEqual(round_trip({1: {'a': 1}, 'b': [2, 3]}), [{'a': 1}, [2, 3]])
+        self.assertEqual(list(artifacts.iter_json(io.BytesIO(b' [ 1 ,\n 2.5e3 , "x" ] '))), [1, 2500.0, 'x'])
+        for bad in [b'1', b'[1 2]', b'{"a" 1}', b'[1,']:
+            with self.assertRaises(ValueError):
+                list(artifacts.iter_json(io.BytesIO(bad)))
+
+## Runs a test with settings.CAMPUS_CACHE_ROOT (and settings.MEDIA_ROOT) in temporary directories
+class TemporaryStorageMixin:
+    def setUp(self):
+        super().setUp()
+        for setting in ('MEDIA_ROOT', 'CAMPUS_CACHE_ROOT'):
+            directory = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+            override = override_settings(**{setting: directory})
+            override.enable()
+            self.addCleanup(override.disable)
+
+
+## Frames parsed at upload are cached as arrays, outside of the media tree, and read back with their types (schema.py)
+class CampusCacheTest(TemporaryStorageMixin, TestCase):
+    def test_round_trip(self):
+        files = read_sample_campus()
+        files['class']['note'] = ['a', None] + ['b'] * (len(files['class']) - 2)
+        path = schema.get_cache_path('sample')
+        schema.save_frames(path, files)
+        self.assertFalse(path.startswith(str(settings.MEDIA_ROOT)))
+        loaded = schema.load_frames(path)
+        self.assertEqual(set(loaded), set(files))
+        for name in schema.CAMPUS_SCHEMA:
+            self.assertTrue(loaded[name].equals(files[name]), name)
+            self.assertEqual(loaded[name].dtypes.to_dict(), files[name].dtypes.to_dict(), name)
+        for array in ('students', 'indptr', 'classes'):
+            self.assertTrue((getattr(loaded['timetable'], array) == getattr(files['timetable'], array)).all())
+
+    def test_removed_with_the_campus(self):
+        user = create_active_user('cache@example.com')
+        campus = campusData.objects.create(campus_name='campus', created_by=user)
+        schema.cache_campus_files(campus, read_sample_campus())
+        path = schema.get_campus_cache_path(campus)
+        self.assertTrue(os.path.exists(path))
+        campus.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_read_once(self):
+        files = read_sample_campus()
+        path = schema.get_cache_path('sample')
+        schema.save_frames(path, files)
+        frames = schema.read_campus_files({'cache': path})
+        self.assertEqual(list(frames['timetable'].columns[:2]), ['0', '1'])
+        self.assertFalse(os.path.exists(path))
+
+
+## Chunked, resumable uploads of the campus files (uploads.py)
+class ChunkedUploadTest(TemporaryStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = create_active_user('uploads@example.com')
+        self.client.force_login(self.user)
+        with open(os.path.join(settings.BASE_DIR, 'static/sampleData/student.csv'), 'rb') as f:
+            self.data = f.read()
+
+    def start(self, field='students_csv'):
+        response = self.client.post(reverse('campusUpload'), {'campus_name': 'campus', 'field': field, 'filename': 'file.csv', 'size': len(self.data)}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def put(self, upload_id, offset, chunk, checksum=None):
+        return self.client.generic('PUT', reverse('campusUploadChunk', args=[upload_id]), chunk, content_type='application/octet-stream',
+                                   HTTP_UPLOAD_OFFSET=str(offset), HTTP_UPLOAD_CHECKSUM=checksum or hashlib.sha256(chunk).hexdigest())
+
+    def upload(self, field, data):
+        self.data = data
+        upload_id = self.start(field)
+        self.assertEqual(self.put(upload_id, 0, data).json()['status'], 'Complete')
+        return upload_id
+
+    def test_resumable_upload(self):
+        upload_id, half = self.start(), len(self.data) // 2
+        response = self.put(upload_id, 0, self.data[:half], checksum='0' * 64)
+        self.assertEqual((response.status_code, response.json()['offset']), (409, 0))
+        self.assertEqual(self.put(upload_id, 0, self.data[:half]).json()['offset'], half)
+        ## a retried chunk is not appended twice, the client is told where to resume
+        response = self.put(upload_id, 0, self.data[:half])
+        self.assertEqual((response.status_code, response.json()['offset']), (409, half))
+        self.assertEqual(self.client.get(reverse('campusUploadChunk', args=[upload_id])).json()['offset'], half)
+        self.assertEqual(self.put(upload_id, half, self.data[half:]).json()['status'], 'Complete')
+        upload = campusUpload.objects.get(id=upload_id)
+        with open(upload.file.path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_invalid_file(self):
+        self.data = b'id,age\n1,20\n'
+        upload_id = self.start()
+        response = self.put(upload_id, 0, self.data)
+        self.assertEqual(response.json()['status'], 'Invalid')
+        self.assertIn('missing the columns', response.json()['error'])
+
+    def test_upload_ids(self):
+        upload_id = self.start()
+        self.assertEqual(self.client.get(f"/api/uploads/{ upload_id[:8] }/").status_code, 404)
+        self.assertEqual(self.client.get(reverse('campusUploadChunk', args=[uuid.uuid4()])).status_code, 404)
+        other = create_active_user('other@example.com')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('campusUploadChunk', args=[upload_id])).status_code, 404)
+
+    def test_create_campus(self):
+        sample = {field: os.path.join(settings.BASE_DIR, 'static/sampleData', SAMPLE_FILES[name]) for field, name in uploads.UPLOAD_FIELDS.items() if name in SAMPLE_FILES}
+        sample[schema.TIMETABLE_FIELD] = os.path.join(settings.BASE_DIR, 'static/sampleData/timetable.csv')
+        ids = {}
+        for field, path in sample.items():
+            with open(path, 'rb') as f:
+                ids[field] = self.upload(field, f.read())
+        ids['campus_setup_csv'] = self.upload('campus_setup_csv', SAMPLE_SETUP)
+        frames = [uploads.get_frame_path(campusUpload(id=pk)) for pk in ids.values()]
+        self.assertTrue(all(os.path.exists(path) for path in frames))
+
+        campus, errors = uploads.create_campus(self.user, 'campus', ids)
+        self.assertEqual(errors, {})
+        ## the files are the campus's, the frames of the uploads are merged into the cache of the campus
+        self.assertFalse(campusUpload.objects.exists())
+        self.assertFalse(any(os.path.exists(path) for path in frames))
+        self.assertTrue(os.path.exists(campus.students_csv.path))
+        self.assertEqual(set(schema.load_frames(schema.get_campus_cache_path(campus))), set(uploads.UPLOAD_FIELDS.values()))
+
+    def test_stale_uploads(self):
+        stale, fresh = self.upload('students_csv', self.data), self.start()
+        campusUpload.objects.filter(id=stale).update(created_on=timezone.now() - datetime.timedelta(seconds=settings.UPLOAD_EXPIRY + 1))
+        upload = campusUpload.objects.get(id=stale)
+        self.assertEqual(uploads.remove_stale_uploads(), 1)
+        self.assertEqual(list(campusUpload.objects.values_list('id', flat=True)), [uuid.UUID(fresh)])
+        self.assertFalse(os.path.exists(upload.file.path))
+        self.assertFalse(os.path.exists(uploads.get_frame_path(upload)))
+
+
+## Expansion and validation of sweep specifications, and the summary of each member's results (helper.py)
+class SweepTest(SimpleTestCase):
+    def test_grid(self):
+        combinations = expand_sweep({'beta_1': [0.1, 0.2], 'days_to_simulate': {'start': 10, 'stop': 30, 'step': 10}})
+        self.assertEqual(len(combinations), 6)
+        self.assertEqual(combinations[0], {'beta_1': 0.1, 'days_to_simulate': 10.0})
+        self.assertEqual(combinations[-1], {'beta_1': 0.2, 'days_to_simulate': 30.0})
+        self.assertEqual(expand_sweep({'init_infected_seed': {'start': 0, 'stop': 1, 'num': 3}}), [{'init_infected_seed': v} for v in (0.0, 0.5, 1.0)])
+
+    def test_random(self):
+        spec = {'beta_1': {'start': 0, 'stop': 1, 'num': 50}, 'vax': list(range(40))}
+        sample = expand_sweep(spec, mode='random', num_samples=20, seed=1)
+        self.assertEqual(len(sample), 20)
+        self.assertEqual(len({tuple(sorted(c.items())) for c in sample}), 20)
+        self.assertEqual(sample, expand_sweep(spec, mode='random', num_samples=20, seed=1))
+        ## asking for more samples than the grid has gives the grid
+        self.assertEqual(len(expand_sweep({'vax': [0, 1]}, mode='random', num_samples=5)), 2)
+
+    def test_validation(self):
+        validate_sweep_spec({'beta_1': [0.1, 0.5], 'periodicity': [7]}, beta_types=[1, 2])
+        for spec, message in [
+                ({}, 'at least one parameter'),
+                ({'beta_3': [0.1]}, 'not an interaction space type'),
+                ({'beta_x': [0.1]}, 'not an interaction space type'),
+                ({'beta_1': [0.5, 1.5]}, 'between 0 and 1'),
+                ({'simulation_name': ['a']}, 'cannot be varied'),
+                ({'vax': {'start': 0, 'stop': 5}}, 'should be a list or a range'),
+                ({'vax': {'start': 0, 'stop': 5, 'step': 0}}, 'should be a list or a range'),
+                ({'vax': []}, 'should be a list or a range'),
+                ({'vax': ['many']}, 'should be a list or a range')]:
+            with self.assertRaises(ValidationError, msg=spec) as error:
+                validate_sweep_spec(spec, beta_types=[1, 2])
+            self.assertIn(message, str(error.exception))
+
+    def test_summary(self):
+        mean = lambda values: {'mean': values}
+        results = {
+            'time': [0, 1, 2],
+            'daily': {'infected': mean([1.0, 5.0, 2.0])},
+            'cumulative': {'infected': mean([1, 6, 8]), 'fatalities': mean([0, 0, float('nan')]), 'positive_cases': mean([0, 2, 3])},
+        }
+        self.assertEqual(summarize_results(results), {'peak_daily_infected': 5.0, 'peak_day': 1, 'total_infected': 8.0,
+                                                      'total_fatalities': 0.0, 'total_positive_cases': 3.0})
+        ## a member whose series are all NaN, or results from before positive cases were recorded
+        results['daily']['infected'] = mean([float('nan')] * 3)
+        del results['cumulative']['positive_cases']
+        summary = summarize_results(results)
+        self.assertEqual((summary['peak_daily_infected'], summary['peak_day'], summary['total_positive_cases']), (None, None, None))
+        self.assertEqual(summary['total_infected'], 8.0)
+        self.assertEqual(summarize_results({'time': []}), {})
+
+
+## The series end-point returns the metrics and mode asked for, thinned to the point budget (views.simulationSeriesView)
+class SeriesApiTest(TestCase):
+    def setUp(self):
+        self.user = create_active_user('compare@example.com')
+        self.client.force_login(self.user)
+        self.sims = []
+        for i in range(2):
+            sim = simulationParams.objects.create(simulation_name=f"sim { i }", status='Complete', created_by=self.user)
+            series = lambda offset: {'mean': [float(day + offset) for day in range(10)], 'std': [0.5] * 10}
+            simulationResults.objects.create(simulation_id=sim, status='A', created_by=self.user, agg_results={
+                'time': list(range(10)),
+                'daily': {metric: series(i) for metric in ['infected', 'recovered', 'fatalities']},
+                'cumulative': {metric: series(100 + i) for metric in ['infected', 'recovered', 'fatalities']},
+            })
+            self.sims.append(sim)
+
+    def get(self, **params):
+        return self.client.get('/api/simulations/series/', params)
+
+    def test_sample_indices(self):
+        self.assertIsNone(sample_indices(10))
+        self.assertIsNone(sample_indices(10, 10))
+        self.assertEqual(sample_indices(10, 4).tolist(), [0, 3, 6, 9])
+        self.assertEqual(sample_indices(10, 2).tolist(), [0, 9])
+        for n, points in [(365, 50), (1000, 7), (11, 10)]:
+            indices = sample_indices(n, points).tolist()
+            self.assertLessEqual(len(indices), points)
+            self.assertEqual((indices[0], indices[-1]), (0, n - 1))
+            self.assertEqual(indices, sorted(set(indices)))
+
+    def test_selection(self):
+        other = simulationParams.objects.create(simulation_name='other', status='Complete', created_by=create_active_user('other@example.com'))
+        simulationResults.objects.create(simulation_id=other, agg_results={'time': [0]}, status='A', created_by=other.created_by)
+        ids = f"{ self.sims[1].id },{ self.sims[0].id },{ other.id },9999"
+        body = self.get(ids=ids, metrics='fatalities,infected', mode='cumulative').json()
+        self.assertEqual((body['mode'], body['metrics'], body['missing']), ('cumulative', ['fatalities', 'infected'], [other.id, 9999]))
+        self.assertEqual([(sim['id'], sim['name']) for sim in body['simulations']], [(self.sims[1].id, 'sim 1'), (self.sims[0].id, 'sim 0')])
+        first = body['simulations'][0]
+        self.assertEqual(set(first['series']), {'fatalities', 'infected'})
+        self.assertEqual(first['time'], list(range(10)))
+        self.assertEqual(first['series']['infected']['mean'], [float(day + 101) for day in range(10)])
+
+        ## the daily series by default, a metric without a series gives empty values
+        body = self.get(ids=self.sims[0].id, metrics='recovered,positive_cases').json()
+        self.assertEqual(body['mode'], 'daily')
+        self.assertEqual(body['simulations'][0]['series']['recovered']['mean'][:2], [0.0, 1.0])
+        self.assertEqual(body['simulations'][0]['series']['positive_cases'], {'mean': None, 'std': None})
+
+    def test_points(self):
+        body = self.get(ids=self.sims[0].id, metrics='infected', points=4).json()
+        sim = body['simulations'][0]
+        self.assertEqual(sim['time'], [0, 3, 6, 9])
+        self.assertEqual(sim['series']['infected'], {'mean': [0.0, 3.0, 6.0, 9.0], 'std': [0.5] * 4})
+        self.assertEqual(self.get(ids=self.sims[0].id, metrics='infected', points=50).json()['simulations'][0]['time'], list(range(10)))
+
+    def test_bad_requests(self):
+        for params, field in [({'metrics': 'infected'}, 'ids'), ({'ids': 'a', 'metrics': 'infected'}, 'ids'),
+                              ({'ids': '1', 'metrics': 'infected,deaths'}, 'metrics'), ({'ids': '1'}, 'metrics'),
+                              ({'ids': '1', 'metrics': 'infected', 'mode': 'weekly'}, 'mode'),
+                              ({'ids': '1', 'metrics': 'infected', 'points': '1'}, 'points'),
+                              ({'ids': '1', 'metrics': 'infected', 'points': 'ten'}, 'points'),
+                              ({'ids': ','.join(str(i) for i in range(201)), 'metrics': 'infected'}, 'ids')]:
+            response = self.get(**params)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(list(response.json()['errors']), [field])
+
+## Decodes a body of `float32SeriesRenderer' the way static/js/makePlots.js does: the JSON header, then views on the data
+def decode_float32(body):
+    self = float32SeriesRenderer
+    length = struct.unpack('<I', body[len(self.MAGIC):len(self.MAGIC) + 4])[0]
+    start = len(self.MAGIC) + 4 + length
+    data = array('f', body[start:])
+    def unpack(node):
+        if isinstance(node, dict):
+            if '$f32' in node:
+                offset, size = node['$f32']
+                return data[offset:offset + size].tolist()
+            return {k: unpack(v) for k, v in node.items()}
+        if isinstance(node, list):
+            return [unpack(v) for v in node]
+        return node
+    return body[:len(self.MAGIC)], start, unpack(json.loads(body[len(self.MAGIC) + 4:start]))
+
+
+## Series rendered as float32 typed arrays decode to the values of the JSON encoding (renderers.py)
+class Float32SeriesTest(TestCase):
+    def assertSameSeries(self, decoded, expected, key=None):
+        if isinstance(expected, dict):
+            self.assertEqual(set(decoded), set(expected))
+            for k in expected:
+                self.assertSameSeries(decoded[k], expected[k], k)
+        elif isinstance(expected, list) and key in float32SeriesRenderer.array_keys:
+            self.assertEqual(len(decoded), len(expected))
+            for got, value in zip(decoded, expected):
+                if value is None:
+                    self.assertTrue(math.isnan(got))
+                else:
+                    self.assertEqual(got, array('f', [value])[0])
+        elif isinstance(expected, list):
+            self.assertEqual(len(decoded), len(expected))
+            for got, value in zip(decoded, expected):
+                self.assertSameSeries(got, value)
+        else:
+            self.assertEqual(decoded, expected)
+
+    def test_decode(self):
+        data = {'mode': 'daily', 'metrics': ['infected'], 'missing': [3], 'simulations': [
+            {'id': 1, 'time': [0, 1, 2], 'series': {'infected': {'mean': [0.1, 2.5, None], 'std': [1e6, 0.0, 3.3333]}}},
+            {'id': 2, 'time': [], 'series': {'infected': {'mean': [], 'std': []}}},
+        ]}
+        magic, start, decoded = decode_float32(float32SeriesRenderer().render(data))
+        self.assertEqual((magic, start % 4), (float32SeriesRenderer.MAGIC, 0))
+        self.assertSameSeries(decoded, data)
+
+    def test_results_api(self):
+        user = create_active_user('series@example.com')
+        sim = simulationParams.objects.create(simulation_name='sim', status='Complete', created_by=user)
+        agg_results = {'time': list(range(5)), 'daily': {'infected': {'mean': [0.5, 1.25, 7.1, None, 3.0], 'std': [0.1] * 5}}}
+        simulationResults.objects.create(simulation_id=sim, agg_results=agg_results, status='A', created_by=user)
+        self.client.force_login(user)
+        path = f"/api/sim/{ sim.id }/"
+        response = self.client.get(path, {'format': 'f32'})
+        self.assertEqual(response['Content-Type'], float32SeriesRenderer.media_type)
+        self.assertSameSeries(decode_float32(response.content)[2]['agg_results'], self.client.get(path).json()['agg_results'])
+
+
+## Conditional GET of the results and campus APIs: a revalidation with the current validators gets a 304, an edit
+## changes them (mixins.ConditionalRetrieveMixin)
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.user = create_active_user('conditional@example.com')
+        self.client.force_login(self.user)
+
+    def get(self, path, **headers):
+        return self.client.get(path, **headers)
+
+    def assertRevalidated(self, path):
+        response = self.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.get(path, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        return response
+
+    def test_results(self):
+        sim = simulationParams.objects.create(simulation_name='sim', status='Complete', created_by=self.user)
+        result = simulationResults.objects.create(simulation_id=sim, agg_results={'time': [0, 1]}, status='A', created_by=self.user)
+        path = f"/api/sim/{ sim.id }/"
+        response = self.assertRevalidated(path)
+        revalidated = self.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((revalidated.content, revalidated['ETag']), (b'', response['ETag']))
+        ## the other encoding and a selection of fields are other representations
+        self.assertNotEqual(self.get(path, HTTP_ACCEPT=float32SeriesRenderer.media_type)['ETag'], response['ETag'])
+        self.assertNotEqual(self.get(path + '?fields=status')['ETag'], response['ETag'])
+
+        ## results written again (as `run_aggregate_sims' does), within the same second
+        simulationResults.objects.filter(simulation_id=sim).update(agg_results={'time': [0, 1, 2]}, completed_at=result.completed_at + datetime.timedelta(microseconds=1))
+        response = self.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['agg_results'], {'time': [0, 1, 2]})
+
+    def test_campus(self):
+        campus = campusData.objects.create(campus_name='campus', created_by=self.user)
+        inst = campusInstantiation.objects.create(inst_name=campus, status='Complete', trans_coeff_file='[{"type": 1, "beta": 0.1}]', created_by=self.user)
+        path = f"/api/campus/{ inst.id }/"
+        etag = self.assertRevalidated(path)['ETag']
+        updateTransCoeff(inst.id, [{'type': 1, 'beta': '0.3'}])
+        response = self.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('0.3', response.json()['trans_coeff_file'])
+        self.assertRevalidated(path)
+
+
+## Batch submission through the REST API (/api/simulations/batch/): a batch is validated as a whole, its simulations
+## are created together under one batch id and counted, then queued with batch priority
+class BatchSubmitTest(TestCase):
+    def setUp(self):
+        self.user = create_active_user('batch@example.com')
+        self.client.force_login(self.user)
+        campus = campusData.objects.create(campus_name='campus', created_by=self.user)
+        self.inst = campusInstantiation.objects.create(inst_name=campus, status='Complete', agent_json='instantiation/campus/individuals.json',
+                                                       trans_coeff_file='[{"type": 1, "beta": 0.1}, {"type": 2, "beta": 0.2}]', created_by=self.user)
+        self.intv = interventions.objects.create(intv_name='intv', intv_json='{}', created_by=self.user)
+        ## inputs are not staged and tasks are not sent
+        patches = [mock.patch.object(services, 'stageSharedInputs', return_value={}),
+                   mock.patch.object(services, 'stageMemberInputs', lambda obj, memberDir, shared: (obj, memberDir)),
+                   mock.patch.object(run_iteration, 'apply_async'),
+                   mock.patch.object(progress, 'get_backend')]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def spec(self, **fields):
+        return dict({'simulation_name': 'batch sim', 'campus_instantiation': self.inst.id, 'intervention': self.intv.id, 'simulation_iterations': 2}, **fields)
+
+    def post(self, specs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('simulationBatch'), {'simulations': specs}, content_type='application/json')
+
+    def test_batch(self):
+        response = self.post([self.spec(), self.spec(beta_1=0.5), self.spec(days_to_simulate=30)])
+        self.assertEqual(response.status_code, 201, response.content)
+        body = response.json()
+        ## bulk_create does not return the primary keys on SQLite, the simulations are read back by batch id
+        created = simulationParams.objects.filter(batch_id=body['batch_id']).order_by('id')
+        self.assertEqual(body['ids'], list(created.values_list('id', flat=True)))
+        self.assertEqual(len(body['ids']), 3)
+        self.assertEqual(body['queue']['position'], 1)
+        self.assertEqual(set(created.values_list('status', 'priority')), {('Queued', simulationParams.BATCH)})
+        self.assertEqual([json.loads(sim.trans_coeff_file)[0]['beta'] for sim in created], [0.1, 0.5, 0.1])
+        self.assertEqual(created[2].days_to_simulate, 30)
+        self.assertEqual(simulationIteration.objects.filter(simulation__in=created).count(), 6)
+        self.assertEqual(userCounters.objects.get(user=self.user).jobs_queued, 3)
+        self.assertEqual(userCounters.objects.filter(user=self.user).values(*counters.COUNTER_FIELDS).first(),
+                         {field: counters.count([self.user.id])[self.user.id][field] for field in counters.COUNTER_FIELDS})
+
+        ## a second batch gets its own id
+        other = self.post([self.spec()]).json()
+        self.assertNotEqual(other['batch_id'], body['batch_id'])
+        self.assertEqual(simulationParams.objects.filter(batch_id=other['batch_id']).count(), 1)
+
+    def test_partially_invalid(self):
+        other = create_active_user('batch-other@example.com')
+        foreign = interventions.objects.create(intv_name='foreign', intv_json='{}', created_by=other)
+        response = self.post([self.spec(), self.spec(simulation_name=None, beta_3=0.1), self.spec(intervention=foreign.id, color='red'),
+                              self.spec(min_grp_size=20, beta_1=2)])
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual(set(errors), {'1', '2', '3'})
+        self.assertIn('simulation_name is required', errors['1'])
+        self.assertIn('beta_3 is not an interaction space type of the campus instantiation', errors['1'])
+        self.assertIn('intervention is not an intervention of the user', errors['2'])
+        self.assertIn('color is not a simulation parameter', errors['2'])
+        self.assertIn('min_grp_size should be positive and less than max_grp_size', errors['3'])
+        self.assertIn('beta_1 should be a number between 0 and 1', errors['3'])
+        ## nothing of the batch is created
+        self.assertFalse(simulationParams.objects.exists())
+        self.assertEqual(self.post([]).status_code, 400)
+
+    @override_settings(SIM_SCHEDULER=dict(settings.SIM_SCHEDULER, REJECT_BACKLOG=3))
+    def test_rejected(self):
+        response = self.post([self.spec(), self.spec()])
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertFalse(simulationParams.objects.exists())
+        self.assertFalse(userCounters.objects.filter(user=self.user, jobs_created__gt=0).exists())
+
+
+## Sparse enrollment of the timetable and its dense form for `campus_parse' (enrollment.py)
+class EnrollmentTest(SimpleTestCase):
+    def test_read(self):
+        enrollment = read_enrollment(io.BytesIO(b'1,10,11\r\n\n2,12,\n3\n'))
+        self.assertEqual(enrollment.students.tolist(), [1, 2, 3])
+        self.assertEqual(enrollment.indptr.tolist(), [0, 2, 3, 3])
+        self.assertEqual(enrollment.classes.tolist(), [10, 11, 12])
+        self.assertEqual(len(read_enrollment(io.BytesIO(b''))), 0)
+
+    def test_errors(self):
+        for data, message in [(b'1,10\n2,,11\n', 'line 2 has an empty id'),
+                              (b'1,10.5\n', 'whole numbers'),
+                              (b'1,a\n', 'only student and class ids'),
+                              (b'1\n2,' + b','.join(b'%d' % i for i in range(TIMETABLE_COLUMNS)) + b'\n', f"line 2 has more than { TIMETABLE_COLUMNS - 1 } classes")]:
+            with self.assertRaises(EnrollmentError, msg=data) as error:
+                read_enrollment(io.BytesIO(data))
+            self.assertIn(message, str(error.exception))
+
+    ## the dense frame has the columns and values of the timetable as the instantiation read it before the enrollment
+    ## was sparse: 24 integer-named columns, serialized to JSON for the broker and read back
+    def test_dense_matches_baseline(self):
+        import numpy as np
+        import pandas as pd
+        with open(os.path.join(settings.BASE_DIR, 'static/sampleData/timetable.csv'), 'rb') as f:
+            data = f.read()
+        baseline = pd.read_csv(io.StringIO(data.decode('utf-8')), delimiter=',', header=None, names=[i for i in range(24)]).to_dict()
+        baseline = pd.DataFrame.from_dict(json.loads(json.dumps(baseline)))
+        dense = read_enrollment(io.BytesIO(data)).to_frame()
+        self.assertEqual(list(dense.columns), list(baseline.columns))
+        self.assertTrue(np.array_equal(dense.to_numpy(dtype=float), baseline.to_numpy(dtype=float), equal_nan=True))
+
+
+## Typed reads of the campus files and the checks across files (schema.py)
+class CampusSchemaTest(SimpleTestCase):
+    def read(self, name, data):
+        return schema.read_campus_csv(name, io.BytesIO(data))
+
+    def assertSchemaError(self, name, data, message):
+        with self.assertRaises(schema.SchemaError) as error:
+            self.read(name, data)
+        self.assertIn(message, str(error.exception))
+
+    def test_types(self):
+        files = read_sample_campus()
+        self.assertEqual(str(files['students']['id'].dtype), 'int32')
+        self.assertEqual(str(files['students']['age'].dtype), 'int16')
+        self.assertEqual(str(files['common_areas']['type'].dtype), 'category')
+        self.assertEqual(schema.check_integrity(files), {})
+
+    def test_bad_files(self):
+        self.assertSchemaError('mess', b'mess_id,average_time_spent\n1,0.5\n', 'mess_csv is missing the columns: active_duration')
+        self.assertSchemaError('mess', b'mess_id,active_duration,average_time_spent\n1,two,0.5\n', 'mess_csv has values that do not match the expected types')
+        self.assertSchemaError('mess', b'mess_id,active_duration,average_time_spent\n1,2,0.5\n2,,0.5\n', 'mess_csv has missing values in the column active_duration (row 3)')
+        with self.assertRaises(schema.SchemaError) as error:
+            schema.read_timetable(io.BytesIO(b'1,10\n2,x\n'))
+        self.assertIn('timetable_csv: only student and class ids', str(error.exception))
+
+    def test_dangling_ids(self):
+        files = read_sample_campus()
+        files['students'].loc[0, 'mess'] = 9999
+        files['class'].loc[0, 'faculty_id'] = 8888
+        files['staff'].loc[0, 'interaction_space'] = 7777
+        files['timetable'].classes[0] = 6666
+        errors = schema.check_integrity(files)
+        self.assertEqual(set(errors), {'students_csv', 'classes_csv', 'staff_csv', 'timetable_csv'})
+        self.assertEqual(errors['students_csv'], 'students.csv refers to messes that are not in mess.csv: 9999.')
+        self.assertEqual(errors['classes_csv'], 'classes.csv has faculty that are not in staff.csv: 8888.')
+        self.assertEqual(errors['staff_csv'], 'staff.csv refers to interaction spaces that do not exist: 7777.')
+        self.assertEqual(errors['timetable_csv'], 'the timetable has classes that are not in classes.csv: 6666.')
+
+        files = read_sample_campus()
+        files['students'].loc[0, 'hostel'] = files['mess']['mess_id'][0]
+        self.assertIn('hostel ids in students.csv are also used by mess.csv', schema.check_integrity(files)['students_csv'])
+
+
+## Tails of the output files and the live day by day counts of running iterations (live.py)
+class LiveSeriesTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def write(self, name, data, mode='ab'):
+        with open(os.path.join(self.directory, name), mode) as f:
+            f.write(data)
+
+    def write_days(self, metric, values, mode='ab'):
+        name, column = live.METRICS[metric]
+        header = f"time,{ column }\n" if mode == 'wb' else ''
+        self.write(name, (header + ''.join(f"{ i },{ v }\n" for i, v in enumerate(values) for _ in range(live.STEPS_PER_DAY))).encode(), mode)
+
+    def test_tail(self):
+        tail = live.csvTail(os.path.join(self.directory, 'num_affected.csv'), 'num_affected')
+        self.assertEqual(tail.read(), [])
+        self.write('num_affected.csv', b'time,num_affected\n0,1\n1,2\n2,')
+        self.assertEqual(tail.read(), [1.0, 2.0])
+        self.write('num_affected.csv', b'3\n3,5\n')
+        self.assertEqual(tail.read(), [3.0, 5.0])
+        self.assertEqual(tail.read(), [])
+        self.assertFalse(tail.restarted)
+
+        ## rewritten shorter: read again from the header
+        self.write('num_affected.csv', b'time,num_affected\n0,7\n', 'wb')
+        self.assertEqual(tail.read(), [7.0])
+        self.assertTrue(tail.restarted)
+
+    def test_bad_files(self):
+        tail = live.csvTail(os.path.join(self.directory, 'num_affected.csv'), 'num_affected')
+        self.write('num_affected.csv', b'time,affected\n0,1\n')
+        self.assertEqual(tail.read(), [])
+        self.assertEqual(tail.error, 'num_affected.csv has no column num_affected')
+        self.write('num_affected.csv', b'1,2\n')
+        self.assertEqual(tail.read(), [])
+
+        ## until it is rewritten
+        self.write('num_affected.csv', b'num_affected\n', 'wb')
+        self.assertEqual(tail.read(), [])
+        self.assertIsNone(tail.error)
+        self.write('num_affected.csv', b'2\n')
+        self.assertEqual(tail.read(), [2.0])
+
+        tail = live.csvTail(os.path.join(self.directory, 'num_recovered.csv'), 'num_recovered')
+        self.write('num_recovered.csv', b'time,num_recovered\n0,1\n1,nan?\n2,3\n')
+        self.assertEqual(tail.read(), [1.0])
+        self.assertIn('has a line without a number in the column num_recovered: 1,nan?', tail.error)
+        self.write('num_recovered.csv', b'3,4\n')
+        self.assertEqual(tail.read(), [])
+
+        tail = live.csvTail(os.path.join(self.directory, 'short.csv'), 'num_affected')
+        self.write('short.csv', b'time,num_affected\n0\n')
+        self.assertEqual(tail.read(), [])
+        self.assertIsNotNone(tail.error)
+
+    def test_watcher(self):
+        watcher = live.iterationWatcher(self.directory)
+        self.assertFalse(watcher.poll())
+        self.write_days('infected', [1, 3, 6], 'wb')
+        self.write_days('recovered', [0, 1], 'wb')
+        self.write_days('fatalities', [0, 0, 1], 'wb')
+        self.assertTrue(watcher.poll())
+        self.assertEqual(watcher.curve(), {'time': [0, 1], 'cumulative': {'infected': [1.0, 3.0], 'recovered': [0.0, 1.0], 'fatalities': [0.0, 0.0]}})
+        ## only the first row of a day is kept
+        self.write('num_recovered.csv', b'2,2\n')
+        self.assertTrue(watcher.poll())
+        self.assertEqual(watcher.days, 3)
+        self.write('num_recovered.csv', b'2,9\n')
+        self.assertFalse(watcher.poll())
+        self.assertEqual(watcher.curve()['cumulative']['recovered'], [0.0, 1.0, 2.0])
+
+        ## a metric that cannot be read stops, the others go on
+        self.write('num_fatalities.csv', b'3,x\n')
+        self.write_days('infected', [8])
+        self.write_days('recovered', [4])
+        with self.assertLogs('interface_log', 'WARNING'):
+            self.assertTrue(watcher.poll())
+        self.assertEqual(watcher.curve(), {'time': [0, 1, 2, 3], 'cumulative': {'infected': [1.0, 3.0, 6.0, 8.0], 'recovered': [0.0, 1.0, 2.0, 4.0], 'fatalities': [0.0, 0.0, 1.0]}})
+
+        ## a rewritten file starts its metric over
+        watcher.stored = 4
+        self.write_days('infected', [2], 'wb')
+        self.assertFalse(watcher.poll())
+        self.assertEqual((watcher.days, watcher.stored), (1, 1))
+        self.assertEqual(watcher.curve()['cumulative']['infected'], [2.0])
+
+    def test_summarize(self):
+        iterations = [
+            {'iteration': 0, 'status': 'Complete', 'live_series': {'time': [0, 1, 2], 'cumulative': {'infected': [1.0, 3.0, 6.0], 'recovered': [0.0, 1.0, 2.0], 'fatalities': [0.0, 0.0, 1.0]}}},
+            {'iteration': 1, 'status': 'Running', 'live_series': {'time': [0, 1], 'cumulative': {'infected': [3.0, 5.0], 'recovered': [0.0, 1.0], 'fatalities': [0.0]}}},
+            {'iteration': 2, 'status': 'Queued', 'live_series': None},
+        ]
+        result = live.summarize(iterations)
+        self.assertEqual(result['time'], [0, 1, 2])
+        self.assertEqual([it['days'] for it in result['iterations']], [3, 2, 0])
+        self.assertEqual(result['cumulative']['infected'], {'mean': [2.0, 4.0, 6.0], 'std': [math.sqrt(2), math.sqrt(2), 0.0]})
+        self.assertEqual(result['daily']['infected'], {'mean': [2.0, 2.0, 3.0], 'std': [math.sqrt(2), 0.0, 0.0]})
+        self.assertEqual(result['cumulative']['fatalities']['mean'], [0.0, 0.0, 1.0])
+
+        iterations[0]['live_series']['cumulative'].pop('fatalities')
+        self.assertEqual(live.summarize(iterations)['cumulative']['fatalities'], {'mean': [0.0, None, None], 'std': [0.0, None, None]})
+        self.assertEqual(live.summarize(iterations[2:]), {'time': [], 'daily': {m: {'mean': [], 'std': []} for m in live.METRICS},
+                                                          'cumulative': {m: {'mean': [], 'std': []} for m in live.METRICS},
+                                                          'iterations': [{'iteration': 2, 'status': 'Queued', 'days': 0}]})
+
+
+## The streamed export bundle is a valid ZIP file with the parameters, the series and the raw outputs (export.py)
+class ExportTest(TestCase):
+    def setUp(self):
+        self.user = create_active_user('export@example.com')
+        self.outputs = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.outputs, ignore_errors=True)
+        self.sims = []
+        for i in range(2):
+            sim = simulationParams.objects.create(simulation_name=f"sim { i }", status='Complete', simulation_iterations=2, days_to_simulate=3,
+                                                  output_directory=os.path.join(self.outputs, f"sim_{ i }"), created_by=self.user)
+            series = {'mean': [1.0 + i, 2.5, 4.0], 'std': [0.0, 0.5, 1.0]}
+            simulationResults.objects.create(simulation_id=sim, agg_results={'time': [0, 1, 2], 'daily': {'infected': series}, 'cumulative': {'infected': series}},
+                                             status='A', created_by=self.user)
+            self.sims.append(sim)
+        ## only the first iteration of the first simulation has outputs
+        os.makedirs(os.path.join(self.outputs, 'sim_0_id_0', 'cases'))
+        with open(os.path.join(self.outputs, 'sim_0_id_0', 'num_cases.csv'), 'w') as f:
+            f.write('day,cases\n0,1\n')
+        with open(os.path.join(self.outputs, 'sim_0_id_0', 'cases', 'ages.csv'), 'w') as f:
+            f.write('age\n20\n')
+
+    def bundle(self, **options):
+        self.data = b''.join(stream_bundle([sim.id for sim in self.sims], **options))
+        bundle = zipfile.ZipFile(io.BytesIO(self.data))
+        self.assertIsNone(bundle.testzip())
+        return bundle
+
+    ## the local header of an entry written for sizes over 4 GiB has a zip64 extra field (id 1)
+    def is_zip64(self, info):
+        name_length, extra_length = struct.unpack('<2H', self.data[info.header_offset + 26:info.header_offset + 30])
+        extra = info.header_offset + 30 + name_length
+        return extra_length >= 4 and struct.unpack('<H', self.data[extra:extra + 2])[0] == 1
+
+    def read_csv(self, bundle, name):
+        return list(csv.DictReader(io.TextIOWrapper(bundle.open(name), encoding='utf-8')))
+
+    def test_tables(self):
+        bundle = self.bundle()
+        self.assertEqual(bundle.namelist(), ['parameters.csv', 'series.csv'])
+        parameters = self.read_csv(bundle, 'parameters.csv')
+        self.assertEqual([(int(row['id']), row['simulation_name'], row['days_to_simulate']) for row in parameters],
+                         [(sim.id, sim.simulation_name, '3') for sim in self.sims])
+        series = self.read_csv(bundle, 'series.csv')
+        self.assertEqual(len(series), 2 * 2 * 3)
+        self.assertEqual(series[0], {'simulation': str(self.sims[0].id), 'mode': 'daily', 'metric': 'infected', 'day': '0', 'mean': '1.0', 'std': '0.0'})
+        self.assertEqual(series[-1]['mean'], '4.0')
+
+    def test_raw(self):
+        bundle = self.bundle(raw=True)
+        prefix = f"raw/{ self.sims[0].id }/iteration_0/"
+        self.assertEqual(bundle.read(prefix + 'num_cases.csv'), b'day,cases\n0,1\n')
+        self.assertEqual(bundle.read(prefix + 'cases/ages.csv'), b'age\n20\n')
+        ## the raw entries are written with zip64 extra fields, so outputs over 2 GiB fit
+        self.assertTrue(all(self.is_zip64(info) for info in bundle.infolist() if info.filename != 'raw/missing.txt'))
+        missing = bundle.read('raw/missing.txt').decode().splitlines()
+        self.assertEqual(len(missing), 3)
+        self.assertIn(f"raw/{ self.sims[0].id }/iteration_1/: the output directory was not found", missing)
@@ -0,0 +1,170 @@
+"""
+uploads.py: chunked, resumable uploads of the campus files
+- an upload (`campusUpload') is created with the campusData field, the file name and its size, the file is
+  assembled in place at the storage path `set_upload_path' gives it, nothing is copied once it is complete
+- chunks are sent in order with their offset and sha256: a chunk that does not match its checksum is discarded,
+  and the offset of an upload tells a client where to resume after an interruption
+- a file is parsed and validated as soon as its last chunk arrives, the parsed frame is cached (see
+  `schema.save_frames') until the campus is created from its uploads, when the files are checked against each other
+- uploads that are not made into a campus within settings.UPLOAD_EXPIRY are removed with their file and frame
+"""
+import datetime
+import fcntl
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models.signals import post_delete
+from django.utils import timezone
+
+from .models import campusData, campusUpload
+from .schema import (CAMPUS_SCHEMA, TIMETABLE_FIELD, SchemaError, cache_campus_files, check_integrity, get_cache_path, load_frames,
+                     read_campus_csv, read_timetable, remove_cache, save_frames)
+
+import logging
+log = logging.getLogger('interface_log')
+
+## campusData file field -> file key (as in `read_campus_files')
+UPLOAD_FIELDS = dict([(field, name) for name, (field, _) in CAMPUS_SCHEMA.items()] + [(TIMETABLE_FIELD, 'timetable')])
+CHUNK_MAX_SIZE = 8 * 1024 * 1024
+MAX_FILE_SIZE = 1024 ** 3
+BLOCK_SIZE = 64 * 1024
+
+## Raised when an upload or a chunk is rejected, `offset' is where the client should resume from
+class UploadError(Exception):
+    def __init__(self, message, offset=None):
+        super().__init__(message)
+        self.offset = offset
+
+def get_frame_path(upload):
+    return get_cache_path(f"upload_{ upload.id }")
+
+## Starts the upload of a campus file, an empty file is created to reserve its name in storage
+def create_upload(user, campus_name, field, filename, size):
+    if field not in UPLOAD_FIELDS:
+        raise UploadError(f"{ field } is not one of the campus files: { ', '.join(UPLOAD_FIELDS) }")
+    if not campus_name or not filename:
+        raise UploadError("The campus name and the file name are required")
+    if len(campus_name) > campusUpload._meta.get_field('campus_name').max_length:
+        raise UploadError(f"The campus name can have at most { campusUpload._meta.get_field('campus_name').max_length } characters")
+    if not 0 < size <= MAX_FILE_SIZE:
+        raise UploadError(f"The file size should be between 1 and { MAX_FILE_SIZE } bytes")
+
+    upload = campusUpload(campus_name=campus_name, field=field, size=size, created_by=user)
+    fileField = upload._meta.get_field('file')
+    name = default_storage.get_available_name(fileField.generate_filename(upload, os.path.basename(filename)), max_length=fileField.max_length)
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    upload.file.name = name
+    upload.save()
+    return upload
+
+## Appends the chunk of `length' bytes read from `stream' at `offset', the chunk is hashed while it is written
+## and cut off again if it is short or does not match `sha256'
+## The file is locked while the chunk is written so that concurrent retries cannot interleave, the database is only
+## written once the chunk is in place, with an update conditional on the offset (a slow client never holds the
+## write lock of the database)
+def write_chunk(upload_id, user, offset, length, sha256, stream):
+    upload = campusUpload.objects.get(id=upload_id, created_by=user)
+    with open(upload.file.path, 'r+b') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        upload.refresh_from_db(fields=['offset', 'status'])
+        if upload.status != 'Uploading':
+            raise UploadError(f"The upload is { upload.status.lower() }", upload.offset)
+        if offset != upload.offset:
+            raise UploadError(f"Expected the chunk at offset { upload.offset }", upload.offset)
+        if not 0 < length <= CHUNK_MAX_SIZE or offset + length > upload.size:
+            raise UploadError(f"Chunks should be between 1 and { CHUNK_MAX_SIZE } bytes and end within the file", upload.offset)
+
+        digest, received = hashlib.sha256(), 0
+        f.seek(offset)
+        f.truncate(offset)
+        while received < length:
+            data = stream.read(min(BLOCK_SIZE, length - received))
+            if not data:
+                break
+            digest.update(data)
+            f.write(data)
+            received += len(data)
+        if received != length or digest.hexdigest() != sha256.lower():
+            f.truncate(offset)
+            raise UploadError("The chunk was incomplete or did not match its checksum, send it again", upload.offset)
+
+        f.flush()
+        ## the upload was finished or cancelled meanwhile: the chunk is discarded
+        if not campusUpload.objects.filter(id=upload.id, offset=offset, status='Uploading').update(offset=offset + length):
+            f.truncate(offset)
+            upload.refresh_from_db(fields=['offset', 'status'])
+            raise UploadError(f"The upload is { upload.status.lower() }" if upload.status != 'Uploading' else
+                              f"Expected the chunk at offset { upload.offset }", upload.offset)
+        upload.offset = offset + length
+    if upload.offset == upload.size:
+        finish_upload(upload)
+    return upload
+
+## Validates a completed file on its own and caches the parsed frame
+def finish_upload(upload):
+    name = UPLOAD_FIELDS[upload.field]
+    try:
+        with open(upload.file.path, 'rb') as f:
+            frame = read_timetable(f) if name == 'timetable' else read_campus_csv(name, f)
+    except SchemaError as e:
+        upload.status, upload.error = 'Invalid', str(e)
+    except Exception:
+        upload.status, upload.error = 'Invalid', "Ensure files uploaded are only in .csv format"
+    else:
+        save_frames(get_frame_path(upload), {name: frame})
+        upload.status = 'Complete'
+    upload.save(update_fields=['status', 'error'])
+    return upload
+
+## Creates a campus from one completed upload of each of its files, after checking the files against each other
+## Returns (campusData, {}) or (None, {field: error})
+def create_campus(user, campus_name, upload_ids):
+    if len(campus_name) > campusData._meta.get_field('campus_name').max_length:
+        return None, {'campus_name': f"The campus name can have at most { campusData._meta.get_field('campus_name').max_length } characters"}
+    uploads = {u.field: u for u in campusUpload.objects.filter(id__in=list(upload_ids.values()), created_by=user)}
+    errors = {field: "A completed upload is required" for field in UPLOAD_FIELDS if field not in uploads or uploads[field].status != 'Complete'}
+    errors.update({field: uploads[field].error for field in errors if field in uploads and uploads[field].status == 'Invalid'})
+    if errors:
+        return None, errors
+
+    frames = {}
+    for upload in uploads.values():
+        frames.update(load_frames(get_frame_path(upload)))
+    errors = check_integrity(frames)
+    if errors:
+        return None, errors
+
+    obj = campusData.objects.create(
+        campus_name=campus_name,
+        created_by=user,
+        created_on=timezone.now(),
+        **{field: upload.file.name for field, upload in uploads.items()}
+    )
+    cache_campus_files(obj, frames)
+    ## the files now belong to the campus, the frames are removed with the uploads (see `on_upload_delete')
+    for upload in uploads.values():
+        upload.delete()
+    return obj, {}
+
+## Removes the uploads started more than settings.UPLOAD_EXPIRY seconds ago, with their files, returns how many
+def remove_stale_uploads():
+    stale = campusUpload.objects.filter(created_on__lt=timezone.now() - datetime.timedelta(seconds=settings.UPLOAD_EXPIRY))
+    removed = 0
+    for upload in stale.iterator():
+        default_storage.delete(upload.file.name)
+        upload.delete()
+        removed += 1
+    if removed:
+        log.info(f"Removed { removed } stale campus uploads")
+    return removed
+
+def on_upload_delete(sender, instance, **kwargs):
+    remove_cache(get_frame_path(instance))
+
+## Connected when the application is ready (see apps.py)
+def connect():
+    post_delete.connect(on_upload_delete, sender=campusUpload, dispatch_uid='uploads_upload_delete')
@@ -11,12 +11,19 @@ from .views import *
 router = routers.DefaultRouter()
 router.register(r'campus', campusTransCoeffViewSet)
 router.register(r'sim', simResultsViewSet)
+router.register(r'simulations', simulationParamsViewSet)
 
 sim_result_rest = simResultsViewSet.as_view({
     'get':'retrieve',
 })
 
 urlpatterns = [
+    re_path(r'^api/simulations/batch/$', simulationBatchView.as_view(), name='simulationBatch'),
+    re_path(r'^api/simulations/series/$', simulationSeriesView.as_view(), name='simulationSeries'),
+    re_path(r'^api/uploads/$', campusUploadView.as_view(), name='campusUpload'),
+    re_path(r'^api/uploads/(?P<pk>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})/$', campusUploadChunkView.as_view(), name='campusUploadChunk'),
+    re_path(r'^api/campuses/$', campusCreateView.as_view(), name='campusCreate'),
+    re_path(r'^api/instantiations/(?P<pk>\d+)/graph/$', instantiationGraphView.as_view(), name='instantiationGraph'),
     re_path(r'^api/', include(router.urls)),
 
     re_path(r'^static/(?P<path>.*)$', serve, {'document_root': settings.STATIC_ROOT, 'show_indexes': settings.DEBUG}),
@@ -36,6 +43,7 @@ urlpatterns = [
     re_path(r'^profile/edit/$', ProfileEditView.as_view(), name='profile_edit'),
 
     re_path(r'^campusData/add/$', addDataView.as_view(), name='campusData'),
+    re_path(r'^campusData/view/(?P<pk>\d+)/$', viewCampusView.as_view(), name='viewCampus'),
     re_path(r'^campusData/delete/(?P<pk>\d+)/$', deleteDataView.as_view(), name='delCampusData'),
     re_path(r'^instantiation/delete/(?P<pk>\d+)/$', deleteInstantiationView.as_view(), name='deleteCampus'),
 
@@ -49,6 +57,10 @@ urlpatterns = [
     re_path(r'^simulation/render/(?P<pk>\d+)/$', visualizeSingleSimulation.as_view(), name='visualizeSimulation'),
     re_path(r'^simulation/fetch/(?P<pk>\d+)/$', sim_result_rest, name='rest_sim_result'),
     re_path(r'^simulation/render/multiple/$', visualizeMultiSimulation.as_view(), name='visualizeMultiSimulations'),
+
+    re_path(r'^sweep/create/$', createSweepView.as_view(), name='createSweep'),
+    re_path(r'^sweep/view/(?P<pk>\d+)/$', viewSweepView.as_view(), name='viewSweep'),
+    re_path(r'^sweep/delete/(?P<pk>\d+)/$', deleteSweepView.as_view(), name='deleteSweep'),
 ]
 
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
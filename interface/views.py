@@ -1,7 +1,13 @@
 """
 views.py defines the application logic and controls what webpage is rendered on each specific url
+The scientific stack (numpy, pandas, scipy) and the simulator are not imported by the web tier at start-up, the
+views that need them import them (or the modules using them) when they run
 """
+import copy
 import json
+import uuid
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
@@ -14,7 +20,12 @@ from django.views.generic import FormView, TemplateView
 from django.views.generic.base import View
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import DeleteView
-from rest_framework import viewsets
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 from django.utils.safestring import mark_safe
 
 #setting up logs
@@ -25,21 +36,276 @@ log.info("starting the campussim interface")
 
 # custom imports
 from .forms import *
-from .helper import get_or_none, validate_password, validateFormResponse
+from .helper import (SWEEP_FIELDS, convert, expand_sweep, get_or_none, sample_indices, summarize_results, take,
+                     validate_export_request, validate_password, validate_series_request, validate_simulation_batch,
+                     validate_simulation_params, validateFormResponse, describe_estimate)
 from .mixins import *
+from .pagination import idCursorPagination
+from .renderers import float32SeriesRenderer
 from .models import *
 from .serializers import *
-from .services import (instantiateTask, launchSimulationTask,
+from . import counters, export, live, scheduler
+from .schema import cache_campus_files
+from .uploads import CHUNK_MAX_SIZE, UploadError, create_campus, create_upload, write_chunk
+from .services import (instantiateTask, launchBatchTask, launchSimulationTask, launchSweepTask,
                        send_activation_mail, send_forgotten_password_email)
 
 ## Rest API Endpoints
-class campusTransCoeffViewSet(viewsets.ModelViewSet):
-    queryset = campusInstantiation.objects.filter(status='Complete')
+## The list end-points are scoped to the user's objects, cursor paginated, filtered with query parameters and leave
+## heavy JSON fields out unless they are asked for with `?fields=' (see mixins.ScopedListMixin)
+class campusTransCoeffViewSet(ScopedListMixin, ConditionalRetrieveMixin, viewsets.ModelViewSet):
+    queryset = campusInstantiation.objects.filter(status='Complete').select_related('inst_name')
     serializer_class = campusTransCoeffSerializer
-
-class simResultsViewSet(viewsets.ModelViewSet):
-    queryset = simulationResults.objects.filter(status='A')
+    permission_classes = [IsAuthenticated]
+    pagination_class = idCursorPagination
+    filter_params = {'campus': 'inst_name', 'campus_name': 'inst_name__campus_name'}
+    date_field = 'created_on'
+    heavy_fields = ('trans_coeff_file', 'stats')
+    last_modified_field = 'updated_on'
+
+    ## `updated_on' is set by every write, the fields that make most of the representation are hashed as well
+    def get_version(self, instance):
+        return f"{ instance.trans_coeff_file }:{ instance.stats }"
+
+class simulationParamsViewSet(ScopedListMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = simulationParams.objects.all()
+    serializer_class = simulationParamsSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = idCursorPagination
+    filter_params = {'campus': 'campus_instantiation', 'intervention': 'intervention', 'status': 'status', 'sweep': 'sweep', 'batch': 'batch_id'}
+    date_field = 'created_on'
+    heavy_fields = ('trans_coeff_file',)
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [float32SeriesRenderer]
+
+    ## Day by day counts of the iterations as the simulator writes them, mean/ std over the iterations (see live.py)
+    @action(detail=True)
+    def live(self, request, pk=None):
+        obj = self.get_object()
+        iterations = obj.iterations.order_by('iteration').values('iteration', 'status', 'live_series')
+        results = simulationResults.objects.filter(simulation_id=obj.id, status='A').exists()
+        return Response(dict(live.summarize(list(iterations)), id=obj.id, status=obj.status, days_to_simulate=obj.days_to_simulate, results=results))
+
+    ## Parameters, aggregated results and with `?raw=1' the output files of the iterations of the simulations selected
+    ## by the filters of the list (or by `?ids=1,2'), as a ZIP file streamed while it is written (see export.py)
+    ## `?as=csv|parquet' is the format of the tables
+    @action(detail=False)
+    def export(self, request):
+        ids, file_format, raw, errors = validate_export_request(request.query_params)
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.get_queryset()
+        if ids:
+            queryset = queryset.filter(id__in=ids)
+        simulation_ids = list(queryset.order_by('id').values_list('id', flat=True))
+        if not simulation_ids:
+            return Response({'errors': {'ids': 'No simulation matches the request'}}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(export.stream_bundle(simulation_ids, file_format, raw), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="simulations_{ timezone.now():%Y%m%d_%H%M%S}.zip"'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+class simResultsViewSet(ScopedListMixin, ConditionalRetrieveMixin, viewsets.ModelViewSet):
+    queryset = simulationResults.objects.filter(status='A').select_related('simulation_id').defer('simulation_id__trans_coeff_file')
     serializer_class = simResultsSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = idCursorPagination
+    filter_params = {
+        'campus': 'simulation_id__campus_instantiation',
+        'campus_name': 'simulation_id__campus_instantiation__inst_name__campus_name',
+        'intervention': 'simulation_id__intervention',
+        'sweep': 'simulation_id__sweep',
+        'batch': 'simulation_id__batch_id',
+    }
+    date_field = 'completed_at'
+    date_param = 'completed'
+    heavy_fields = ('agg_results',)
+    last_modified_field = 'completed_at'
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [float32SeriesRenderer]
+
+## Requested series of several simulations in one response, for the comparison page (visualizeMultiSimulation)
+## GET ?ids=1,2&metrics=infected,fatalities&mode=daily|cumulative&points=<optional budget per series>
+## - only the requested series are extracted from `agg_results' by the database, the results are never loaded whole
+## - simulations that are not found (or not complete) are listed in `missing'
+## - `?format=f32' returns the series as float32 typed arrays (see renderers.float32SeriesRenderer)
+class simulationSeriesView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [float32SeriesRenderer]
+    max_simulations = 200
+
+    def get(self, request):
+        ids, metrics, mode, points, errors = validate_series_request(request.query_params, self.max_simulations)
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = simulationResults.objects.filter(simulation_id__in=ids, status='A')
+        if not request.user.is_staff:
+            queryset = queryset.filter(created_by=request.user)
+        rows = {row['simulation_id']: row for row in queryset.values(
+            'simulation_id', 'simulation_id__simulation_name', 'simulation_id__intervention__intv_name', 'agg_results__time',
+            *[f"agg_results__{ mode }__{ metric }" for metric in metrics]
+        )}
+
+        simulations = []
+        for pk in ids:
+            if pk not in rows:
+                continue
+            row = rows[pk]
+            time = row['agg_results__time'] or []
+            indices = sample_indices(len(time), points)
+            series = {}
+            for metric in metrics:
+                values = row[f"agg_results__{ mode }__{ metric }"] or {}
+                series[metric] = {'mean': take(values.get('mean'), indices), 'std': take(values.get('std'), indices)}
+            simulations.append({
+                'id': pk,
+                'name': row['simulation_id__simulation_name'],
+                'intv': row['simulation_id__intervention__intv_name'],
+                'time': take(time, indices),
+                'series': series,
+            })
+        return Response({
+            'mode': mode,
+            'metrics': metrics,
+            'simulations': simulations,
+            'missing': [pk for pk in ids if pk not in rows],
+        })
+
+## accepts a list of simulation specifications and creates and queues them together
+## - each specification has `simulation_name', `campus_instantiation', `intervention' (ids), optionally any of
+##   `helper.SWEEP_FIELDS' and `beta_<type>' transmission coefficients; parameters not given take their defaults
+## - the batch is validated as a whole, nothing is created when any specification is invalid
+class simulationBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_batch_size = 1000
+
+    def post(self, request):
+        specs = request.data.get('simulations') if isinstance(request.data, dict) else request.data
+        if not isinstance(specs, list) or len(specs) == 0 or not all(isinstance(spec, dict) for spec in specs):
+            return Response({'detail': 'Expected a non-empty list of simulation specifications'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(specs) > self.max_batch_size:
+            return Response({'detail': f'At most { self.max_batch_size } simulations can be submitted together'}, status=status.HTTP_400_BAD_REQUEST)
+
+        campuses = {c.id: c for c in campusInstantiation.objects.filter(created_by=request.user, status='Complete').only('id', 'trans_coeff_file')}
+        campus_betas = {pk: {int(e['type']) for e in json.loads(c.trans_coeff_file)} for pk, c in campuses.items()}
+        intervention_ids = set(interventions.objects.filter(created_by=request.user).values_list('id', flat=True))
+
+        import pandas as pd
+        df, errors = validate_simulation_batch(specs, campus_betas, intervention_ids)
+        if errors:
+            return Response({'errors': {str(i): e for i, e in sorted(errors.items())}}, status=status.HTTP_400_BAD_REQUEST)
+
+        batch_id = uuid.uuid4()
+        testing_protocol = testingParams.get_default()
+        base_betas = {pk: json.loads(c.trans_coeff_file) for pk, c in campuses.items()}
+        beta_cols = [c for c in df.columns if c.startswith('beta_')]
+        objs = []
+        for row in df.to_dict('records'):
+            betas = copy.deepcopy(base_betas[row['campus_instantiation']])
+            for e in betas:
+                if f"beta_{ e['type'] }" in beta_cols and pd.notna(row[f"beta_{ e['type'] }"]):
+                    e['beta'] = float(row[f"beta_{ e['type'] }"])
+            objs.append(simulationParams(
+                simulation_name=row['simulation_name'],
+                campus_instantiation_id=int(row['campus_instantiation']),
+                intervention_id=int(row['intervention']),
+                testing_protocol=testing_protocol,
+                trans_coeff_file=json.dumps(betas, default=convert),
+                batch_id=batch_id,
+                created_by=request.user,
+                created_on=timezone.now(),
+                status='Created',
+                **{field: cast(row[field]) for field, cast in SWEEP_FIELDS.items()}
+            ))
+        ## admission is decided once, in the transaction that inserts the simulations, and handed to the scheduler
+        try:
+            with transaction.atomic():
+                admission = scheduler.check_admission(int(df['simulation_iterations'].sum()), simulationParams.BATCH)
+                simulationParams.objects.bulk_create(objs)
+                counters.record(objs)
+        except scheduler.AdmissionError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '600'})
+        ids = launchBatchTask(batch_id, admission)
+        log.info(f"Batch { batch_id } of { len(ids) } simulations was submitted by { request.user }")
+        return Response({'batch_id': str(batch_id), 'ids': ids, 'queue': scheduler.estimate_group(ids)}, status=status.HTTP_201_CREATED)
+
+## Chunked, resumable upload of the campus files (see uploads.py)
+## POST {campus_name, field, filename, size} starts the upload of one file
+class campusUploadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            upload = create_upload(request.user, request.data.get('campus_name'), request.data.get('field'), request.data.get('filename'), int(request.data.get('size', 0)))
+        except (UploadError, ValueError, TypeError) as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.describe(upload), status=status.HTTP_201_CREATED)
+
+    @staticmethod
+    def describe(upload):
+        return {
+            'id': str(upload.id),
+            'field': upload.field,
+            'size': upload.size,
+            'offset': upload.offset,
+            'status': upload.status,
+            'error': upload.error,
+            'chunk_size': CHUNK_MAX_SIZE,
+        }
+
+## GET returns the offset to resume from, PUT appends a chunk: the raw bytes of the chunk as the body,
+## with the `Upload-Offset' and `Upload-Checksum' (sha256 of the chunk, hex) headers
+## The body is streamed to the file, it is never buffered whole in memory
+class campusUploadChunkView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        upload = get_object_or_404(campusUpload, id=pk, created_by=request.user)
+        return Response(campusUploadView.describe(upload))
+
+    def put(self, request, pk):
+        get_object_or_404(campusUpload, id=pk, created_by=request.user)
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return Response({'detail': 'The Upload-Offset and Content-Length headers are required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            upload = write_chunk(pk, request.user, offset, length, request.headers.get('Upload-Checksum', ''), request._request)
+        except UploadError as e:
+            return Response({'detail': str(e), 'offset': e.offset}, status=status.HTTP_409_CONFLICT)
+        return Response(campusUploadView.describe(upload))
+
+## Creates and instantiates a campus from completed uploads, POST {campus_name, uploads: {field: upload id}}
+class campusCreateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        campus_name, uploads = request.data.get('campus_name'), request.data.get('uploads')
+        if not campus_name or not isinstance(uploads, dict):
+            return Response({'detail': 'Expected a campus name and the id of the upload of each file'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            obj, errors = create_campus(request.user, campus_name, uploads)
+        except ValidationError:
+            return Response({'detail': 'Upload ids are expected to be UUIDs'}, status=status.HTTP_400_BAD_REQUEST)
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        campusInstantiation.objects.create(inst_name=obj, created_by=request.user, created_on=timezone.now())
+        instantiateTask(request)
+        log.info(f'Data for campus: { campus_name } was assembled from chunked uploads and is being instantiated for user { request.user }.')
+        return Response({'id': obj.id, 'campus_name': obj.campus_name}, status=status.HTTP_201_CREATED)
+
+## Structure of an instantiated campus (occupancy of the spaces, spaces per agent, projected contacts), see graph.py
+class instantiationGraphView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        queryset = campusInstantiation.objects.all() if request.user.is_staff else campusInstantiation.objects.filter(created_by=request.user)
+        inst = get_object_or_404(queryset, pk=pk)
+        if inst.status != 'Complete':
+            return Response({'detail': 'The campus has not been instantiated yet'}, status=status.HTTP_409_CONFLICT)
+        from . import graph
+        return Response(graph.summarize(inst))
 
 log.info("API end-points are enabled")
 
@@ -158,20 +424,24 @@ class ProfileView(LoginRequiredMixin, AddUserToContext, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = userModel.objects.filter(email=self.request.user)[0]
+        user = self.request.user
         context['user'] = {
             "first_name": user.first_name,
             "last_name": user.last_name,
             "works_at": user.works_at
         }
-        context['totCampus'] = campusInstantiation.get_count_by_status(user=self.request.user, status='Complete')
-        context['totIntv'] = interventions.get_count_by(user=self.request.user)
-        context['totJobs'] = simulationParams.get_count_by(user=self.request.user)
-        context['running'] = simulationParams.get_count_by_status(user=self.request.user, status='Running')
-        context['complete'] = simulationParams.get_count_by_status(user=self.request.user, status='Complete')
-        context['interventions'] = interventions.get_topk_latest(self.request.user, k=3)
-        context['simulations'] = simulationParams.get_topk_latest(self.request.user, k=3)
-        context['instantiations'] = campusInstantiation.get_topk_latest(self.request.user, k=3)
+        ## one read of the counters maintained by counters.py (summed over every user for staff)
+        counts = counters.get_counts(self.request.user)
+        context['totCampus'] = counts.campuses_complete
+        context['totIntv'] = counts.interventions
+        context['totJobs'] = counts.jobs
+        context['running'] = counts.jobs_running
+        context['complete'] = counts.jobs_complete
+        context['simulations'] = list(simulationParams.get_topk_latest(self.request.user, k=3))
+        estimates = scheduler.estimate([job.id for job in context['simulations'] if job.status in ('Queued', 'Deferred')])
+        for job in context['simulations']:
+            job.queue = estimates.get(job.id)
+        context['backlog'] = scheduler.get_backlog()
         return context
 
 
@@ -253,6 +523,7 @@ class addDataView(LoginRequiredMixin, AddUserToContext, View):
             self.campus_name = obj.campus_name
             obj.created_on = timezone.now()
             obj.save()
+            cache_campus_files(obj, self.form.frames)
             messages.success(request, f'Data for campus: { self.campus_name } is saved. Please wait while we run this job in the background, on an average you will hear from you us in 2 minutes if the servers are free.')
             log.info(f'Data for campus: { self.campus_name } is saved for user {self.request.user}. ')
             if self.instantiate():
@@ -277,6 +548,7 @@ class userActivityView(LoginRequiredMixin, AddUserToContext, TemplateView):
         context['interventions'] = interventions.get_all(self.request.user)
         context['simulations'] = simulationParams.get_all(self.request.user)
         context['campuses'] = campusData.get_all(self.request.user)
+        context['sweeps'] = simulationSweep.get_all(self.request.user)
         return context
 
 class deleteDataView(LoginRequiredMixin, AddUserToContext, DeleteView):
@@ -310,6 +582,16 @@ class deleteInterventionView(LoginRequiredMixin, AddUserToContext, DeleteView):
         context['type'] = 'intervention'
         return context
 
+class deleteSweepView(LoginRequiredMixin, AddUserToContext, DeleteView):
+    template_name = "interface/delete.html"
+    model = simulationSweep
+    success_url = reverse_lazy('profile')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['type'] = 'parameter sweep'
+        return context
+
 class deleteSimulationView(LoginRequiredMixin, AddUserToContext, DeleteView):
     template_name = "interface/delete.html"
     model = simulationParams
@@ -380,8 +662,8 @@ class createSimulationView(LoginRequiredMixin, AddUserToContext, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        campus_queryset = campusInstantiation.objects.filter(created_by=self.request.user, status='Complete')
-        intv_queryset = interventions.objects.filter(created_by=self.request.user)
+        campus_queryset = campusInstantiation.get_listing().filter(created_by=self.request.user, status='Complete').order_by('id')
+        intv_queryset = interventions.objects.filter(created_by=self.request.user).defer('intv_json').order_by('id')
         context['form'] = createSimulationForm(campus_queryset, intv_queryset)
         return context
 
@@ -424,15 +706,7 @@ class createSimulationView(LoginRequiredMixin, AddUserToContext, TemplateView):
 
                 self.simName = formData['simulation_name'][0]
 
-                try:
-                    obj = testingParams.objects.get(testing_protocol_name='default')
-                except testingParams.DoesNotExist:
-                    obj = testingParams(
-                        testing_protocol_name='default',
-                        testing_protocol_file=json.load(open('./media/testing_protocol_001.json', 'r')),
-                        created_on=timezone.now()
-                    )
-                    obj.save()
+                testing_protocol = testingParams.get_default()
 
                 try:
                     q = simulationParams(
@@ -444,7 +718,7 @@ class createSimulationView(LoginRequiredMixin, AddUserToContext, TemplateView):
                         intervention=interventions.objects.get(id=int(formData['intvName'][0])),
                         enable_testing=testing, #eval ensures the form data is a boolean and not a string
                         testing_capacity=int(formData['testing_capacity'][0]),
-                        testing_protocol=testingParams.objects.get(testing_protocol_name='default'), #By default: the default testing protocol will be aded.
+                        testing_protocol=testing_protocol, #By default: the default testing protocol will be aded.
                         periodicity=int(formData['periodicity'][0]),
                         betaScale=int(formData['betaScale'][0]),
                         min_grp_size=int(formData['min_grp_size'][0]),
@@ -468,7 +742,7 @@ class createSimulationView(LoginRequiredMixin, AddUserToContext, TemplateView):
                     return render(request, self.template_name, self.get_context_data())
                 q.save()
                 launchSimulationTask(self.request, int(formData['instantiatedCampus'][0]), BETA)
-                messages.info(request, f'Simulation: { self.simName } is created. Please wait while we run the simulation on our servers, typical campus instantiations upto 10,000 agents takes about 2 minutes/ iteration.')
+                messages.info(request, f'Simulation: { self.simName } is created. Please wait while we run the simulation on our servers, typical campus instantiations upto 10,000 agents takes about 2 minutes/ iteration. { describe_estimate(scheduler.estimate([q.id]).get(q.id)) }')
                 log.info(f'Simulation: { self.simName } is created')
                 return redirect('profile')
 
@@ -477,13 +751,135 @@ class createSimulationView(LoginRequiredMixin, AddUserToContext, TemplateView):
             log.error(f'One or more fields in the create simulation for simulation name:{ self.simName } was incorrect.')
             return render(request, self.template_name, self.get_context_data())
 
+class createSweepView(LoginRequiredMixin, AddUserToContext, FormView):
+    template_name = 'interface/create_sweep.html'
+    form_class = createSweepForm
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['campus_queryset'] = campusInstantiation.get_listing().filter(created_by=self.request.user, status='Complete').order_by('id')
+        kwargs['intv_queryset'] = interventions.objects.filter(created_by=self.request.user).defer('intv_json').order_by('id')
+        return kwargs
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['title'] = 'Create a new parameter sweep'
+        context['instruction'] = 'Vary simulation parameters and transmission coefficients over lists or ranges of values, every combination (or a random sample of them) is run as a simulation of the sweep.'
+        return context
+
+    ## builds the member simulations of the sweep, combinations that do not pass the checks of a single simulation are skipped
+    def get_members(self, sweep, combinations):
+        campus = sweep.campus_instantiation
+        testing_protocol = testingParams.get_default()
+        defaults = {field: simulationParams._meta.get_field(field).default for field in SWEEP_FIELDS}
+        base_betas = json.loads(campus.trans_coeff_file)
+
+        members = []
+        for n, combination in enumerate(combinations):
+            params = dict(defaults)
+            params.update({key: SWEEP_FIELDS[key](value) for key, value in combination.items() if key in SWEEP_FIELDS})
+            if not validate_simulation_params(params):
+                continue
+            betas = copy.deepcopy(base_betas)
+            for e in betas:
+                if f"beta_{ e['type'] }" in combination:
+                    e['beta'] = float(combination[f"beta_{ e['type'] }"])
+            members.append(simulationParams(
+                simulation_name=f"{ sweep.sweep_name }_{ n + 1 }",
+                campus_instantiation=campus,
+                intervention=sweep.intervention,
+                testing_protocol=testing_protocol,
+                trans_coeff_file=json.dumps(betas, default=convert),
+                sweep=sweep,
+                created_by=self.request.user,
+                created_on=timezone.now(),
+                status='Created',
+                **params
+            ))
+        return members
+
+    def form_valid(self, form):
+        data = form.cleaned_data
+        combinations = expand_sweep(data['sweep_spec'], data['mode'], data['num_samples'], data['random_seed'])
+        with transaction.atomic():
+            sweep = simulationSweep.objects.create(
+                sweep_name=data['sweep_name'],
+                campus_instantiation=data['instantiatedCampus'],
+                intervention=data['intvName'],
+                sweep_spec=data['sweep_spec'],
+                mode=data['mode'],
+                num_samples=data['num_samples'],
+                random_seed=data['random_seed'],
+                created_by=self.request.user,
+                created_on=timezone.now()
+            )
+            members = self.get_members(sweep, combinations)
+            if len(members) == 0:
+                transaction.set_rollback(True)
+                form.add_error(None, 'None of the parameter combinations of the sweep are valid simulations')
+                return self.form_invalid(form)
+            ## admission is decided once, in the transaction that inserts the members, and handed to the scheduler
+            try:
+                admission = scheduler.check_admission(sum(m.simulation_iterations for m in members), simulationParams.BATCH)
+            except scheduler.AdmissionError as e:
+                transaction.set_rollback(True)
+                form.add_error(None, str(e))
+                return self.form_invalid(form)
+            simulationParams.objects.bulk_create(members)
+            counters.record(members)
+        launchSweepTask(sweep, admission)
+
+        skipped = len(combinations) - len(members)
+        estimate = scheduler.estimate_group(sweep.members.values_list('id', flat=True))
+        messages.info(self.request, f'Sweep: { sweep.sweep_name } with { len(members) } simulations is created' + (f', { skipped } invalid combinations were skipped. ' if skipped else '. ') + describe_estimate(estimate))
+        log.info(f'Sweep: { sweep.sweep_name } with { len(members) } simulations is created')
+        return redirect('viewSweep', pk=sweep.pk)
+
+class viewSweepView(LoginRequiredMixin, AddUserToContext, DetailView):
+    template_name = "interface/view_sweep.html"
+    model = simulationSweep
+
+    def get_queryset(self):
+        return simulationSweep.get_all(self.request.user)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        keys = sorted(self.object.sweep_spec.keys())
+        rows = []
+        for member in self.object.members.select_related('simulationresults').order_by('id'):
+            betas = {f"beta_{ e['type'] }": e['beta'] for e in json.loads(member.trans_coeff_file)}
+            result = getattr(member, 'simulationresults', None)
+            rows.append({
+                'simulation': member,
+                'values': [betas[key] if key.startswith('beta_') else getattr(member, key) for key in keys],
+                'summary': summarize_results(result.agg_results) if result is not None and result.status == 'A' else {},
+            })
+        context['keys'] = keys
+        context['rows'] = rows
+        context['progress'] = self.object.get_progress
+        return context
+
+## Details of a campus and the structure of its latest instantiation, loaded from `instantiationGraphView'
+class viewCampusView(LoginRequiredMixin, AddUserToContext, DetailView):
+    template_name = "interface/view_campus.html"
+    model = campusData
+
+    def get_queryset(self):
+        return campusData.get_all(self.request.user)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['instantiations'] = campusInstantiation.objects.filter(inst_name=self.object).defer('trans_coeff_file').order_by('-id')
+        context['latest'] = context['instantiations'].filter(status='Complete').first()
+        return context
+
 class viewSimulationView(LoginRequiredMixin, AddUserToContext, DetailView):
     template_name = "interface/view_simulation.html"
     model = simulationParams
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['betas'] = json.loads(simulationParams.objects.filter(pk=self.kwargs.get('pk'))[0].campus_instantiation.trans_coeff_file)
+        context['betas'] = json.loads(self.object.trans_coeff_file or self.object.campus_instantiation.trans_coeff_file)
         return context
 
 class visualizeSingleSimulation(LoginRequiredMixin, AddUserToContext, TemplateView):
@@ -494,6 +890,14 @@ class visualizeSingleSimulation(LoginRequiredMixin, AddUserToContext, TemplateVi
         context = super().get_context_data(**kwargs)
         context['pk'] = self.kwargs.get('pk')
         self.obj = simulationResults.objects.filter(pk=self.kwargs.get('pk')).first()
+        if self.obj is None:
+            ## the simulation is still running, the page follows its live day by day counts
+            queryset = simulationParams.objects.all() if self.request.user.is_staff else simulationParams.objects.filter(created_by=self.request.user)
+            get_object_or_404(queryset.only('id'), pk=self.kwargs.get('pk'))
+            context['results'] = 'null'
+            context['status'] = 'null'
+            context['live'] = True
+            return context
         context['results'] = json.dumps(self.obj.agg_results)
         context['status'] = json.dumps(self.obj.status)
         return context
@@ -505,15 +909,23 @@ class visualizeMultiSimulation(LoginRequiredMixin, AddUserToContext, TemplateVie
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user_sims = simulationResults.objects.filter(created_by=self.request.user, status='A').all()
+        ## one query for the names, the results themselves are not loaded
+        user_sims = simulationResults.objects.filter(created_by=self.request.user, status='A').select_related(
+            'simulation_id__campus_instantiation__inst_name', 'simulation_id__intervention'
+        ).only(
+            'simulation_id__id', 'simulation_id__simulation_name', 'simulation_id__enable_testing',
+            'simulation_id__campus_instantiation__inst_name__campus_name', 'simulation_id__intervention__intv_name'
+        ).order_by('simulation_id')
         data = []
         for sim in user_sims:
+            params = sim.simulation_id
+            campus = params.campus_instantiation
             data.append({
-                "id": sim.simulation_id.id,
-                "name": sim.simulation_id.simulation_name,
-                "campus": sim.simulation_id.campus_instantiation.inst_name.campus_name,
-                "intv": sim.simulation_id.intervention.intv_name,
-                "enable_testing": 1 if sim.simulation_id.enable_testing else 0
+                "id": params.id,
+                "name": params.simulation_name,
+                "campus": campus.inst_name.campus_name if campus is not None and campus.inst_name is not None else "",
+                "intv": params.intervention.intv_name if params.intervention is not None else "",
+                "enable_testing": 1 if params.enable_testing else 0
             })
         context['results'] = data
         return context
@@ -62,6 +62,70 @@ function makeTraceTriplets(time, mean, pos_std, neg_std, label, plotColor=null,
 
 
 
+// Decodes a response rendered by interface/renderers.py float32SeriesRenderer (`?format=f32'): the series are
+// Float32Array views on the response buffer, nothing is copied or parsed number by number
+function decodeFloat32Series(buffer){
+    var view = new DataView(buffer);
+    var magic = String.fromCharCode.apply(null, new Uint8Array(buffer, 0, 4));
+    if (magic !== "F32S") {
+        throw new Error("Not a float32 series response");
+    }
+    var headerLength = view.getUint32(4, true);
+    var dataStart = 8 + headerLength;
+    return JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)), function (key, value) {
+        if (value !== null && typeof value === "object" && "$f32" in value) {
+            return new Float32Array(buffer, dataStart + value["$f32"][0] * 4, value["$f32"][1]);
+        }
+        return value;
+    });
+}
+
+// GET `url' with the query `params' in the float32 series encoding, resolves with the decoded response
+function fetchFloat32Series(url, params){
+    var query = new URLSearchParams(params);
+    query.set("format", "f32");
+    return fetch(url + "?" + query.toString(), {credentials: "same-origin", headers: {"Accept": "application/x-float32-series"}})
+        .then(function (response) {
+            return response.arrayBuffer().then(function (buffer) {
+                var data = decodeFloat32Series(buffer);
+                if (!response.ok) {
+                    var error = new Error(response.statusText);
+                    error.data = data;
+                    throw error;
+                }
+                return data;
+            });
+        });
+}
+
+// Colour of the idx-th series, the fixed palette first and then hues spread by the golden angle
+function plotColor(idx, palette){
+    if (palette && idx < palette.length) {
+        return palette[idx];
+    }
+    var h = (idx * 137.508) % 360 / 60, x = 1 - Math.abs(h % 2 - 1);
+    var rgb = [[1, x, 0], [x, 1, 0], [0, 1, x], [0, x, 1], [x, 0, 1], [1, 0, x]][Math.floor(h)];
+    return rgb.map(function (c) { return Math.round(40 + c * 180); });
+}
+
+// WebGL version of makeTraceTriplets for many and long series: the mean and a band of +/- one standard deviation
+// (floored at 0), computed from typed arrays into typed arrays
+function makeBandTraces(time, mean, std, label, plotColor, intervention=null){
+    var upper = new Float32Array(mean.length);
+    var lower = new Float32Array(mean.length);
+    for (var i = 0; i < mean.length; i++) {
+        upper[i] = mean[i] + std[i];
+        lower[i] = Math.max(mean[i] - std[i], 0);
+    }
+    var band = "rgba(" + plotColor[0] + "," + plotColor[1] + "," + plotColor[2] + ",0.2)";
+    return [
+        {type: "scattergl", mode: "lines", x: time, y: upper, showlegend: false, hoverinfo: "skip", line: {color: band, width: 0}},
+        {type: "scattergl", mode: "lines", x: time, y: lower, showlegend: false, hoverinfo: "skip", line: {color: band, width: 0}, fill: "tonexty", fillcolor: band},
+        {type: "scattergl", mode: "lines", x: time, y: mean, name: "" + (intervention == null ? label : intervention), showlegend: true,
+         line: {color: "rgb(" + plotColor[0] + "," + plotColor[1] + "," + plotColor[2] + ")", width: 3}}
+    ];
+}
+
 function makePlot(data, title, label, idx){
     var layout = {
         title: title,
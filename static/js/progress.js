@@ -0,0 +1,79 @@
+// Live job status and progress for the profile and activity pages, pushed by the server (interface/events.py)
+// - rows of simulations carry data-job="<id>", their status cell .job-status, progress .job-progress and the
+//   visualize cell .job-visualize (the link is data-visualize on the row)
+// - counters carry data-counter="<field of userCounters>" (data-counter="jobs" is the total of the jobs_* counters)
+// - the browser reconnects by itself, every connection starts with a snapshot of the counters and of the rows shown
+(function () {
+  if (!window.EventSource) {
+    return;
+  }
+  var rows = document.querySelectorAll('[data-job]');
+  var counters = document.querySelectorAll('[data-counter]');
+  if (rows.length === 0 && counters.length === 0) {
+    return;
+  }
+  var ids = Array.prototype.map.call(rows, function (row) { return row.dataset.job; });
+  var values = {};
+
+  function showCounters() {
+    values.jobs = Object.keys(values).filter(function (f) { return f.indexOf('jobs_') === 0; })
+      .reduce(function (total, f) { return total + values[f]; }, 0);
+    counters.forEach(function (el) {
+      if (el.dataset.counter in values) {
+        el.textContent = values[el.dataset.counter];
+      }
+    });
+  }
+
+  function setStatus(id, status) {
+    document.querySelectorAll('[data-job="' + id + '"]').forEach(function (row) {
+      row.querySelectorAll('.job-status').forEach(function (el) { el.textContent = status; });
+      if (status !== 'Queued' && status !== 'Deferred') {
+        row.querySelectorAll('.job-queue').forEach(function (el) { el.textContent = ''; });
+      }
+      if (status === 'Complete' || status === 'Error') {
+        row.querySelectorAll('.job-progress').forEach(function (el) { el.textContent = ''; });
+      }
+      row.querySelectorAll('.job-visualize').forEach(function (el) {
+        if (status === 'Complete' && row.dataset.visualize && !el.querySelector('a')) {
+          el.innerHTML = '<a class="btn btn-sm btn-success" href="' + row.dataset.visualize + '">Visualize</a>';
+        }
+      });
+    });
+  }
+
+  function setProgress(id, done, total) {
+    document.querySelectorAll('[data-job="' + id + '"] .job-progress').forEach(function (el) {
+      el.textContent = done + ' of ' + total + ' iterations done';
+    });
+  }
+
+  var source = new EventSource('/events/progress/?jobs=' + ids.join(','));
+  source.addEventListener('snapshot', function (e) {
+    var data = JSON.parse(e.data);
+    values = data.counters;
+    showCounters();
+    data.jobs.forEach(function (job) {
+      setStatus(job.id, job.status);
+      if (job.status === 'Running') {
+        setProgress(job.id, job.done, job.total);
+      }
+    });
+  });
+  ['jobs', 'campuses'].forEach(function (kind) {
+    source.addEventListener(kind, function (e) {
+      var data = JSON.parse(e.data);
+      var n = data.ids.length;
+      values[kind + '_' + data.old.toLowerCase()] = (values[kind + '_' + data.old.toLowerCase()] || 0) - n;
+      values[kind + '_' + data.status.toLowerCase()] = (values[kind + '_' + data.status.toLowerCase()] || 0) + n;
+      showCounters();
+      if (kind === 'jobs') {
+        data.ids.forEach(function (id) { setStatus(id, data.status); });
+      }
+    });
+  });
+  source.addEventListener('iteration', function (e) {
+    var data = JSON.parse(e.data);
+    setProgress(data.simulation, data.done, data.total);
+  });
+})();